@@ -1,13 +1,26 @@
 import argparse
 import llama_index
 from dotenv import load_dotenv
+from llama_index.core import Settings
 
 from .ui import LocalChatbotApp
 from .pipeline import LocalRAGPipeline
 from .logger import Logger
 from .ollama import run_ollama_server, is_port_open
+from .core import LocalEmbeddingFactory, LocalRAGModelFactory
+from .core.versions import IndexVersions
+from .settings import RAGSettings
 
 from .testing import mass_test
+from .server import serve
+from .benchmark import (
+    chunking_report,
+    dimension_report,
+    quantization_report,
+    retrieval_depth_report,
+    throughput_report,
+    token_count_report,
+)
 
 
 def main():
@@ -33,9 +46,18 @@ def main():
     parser.add_argument(
         "--mode",
         type=str,
-        choices=["run", "test"],
+        choices=["run", "test", "benchmark", "serve", "doc2query", "reindex"],
         default="run",
-        help="Specify the mode to run the script ('run' for normal execution, 'test' for testing)",
+        help="Specify the mode to run the script ('run' for normal execution, 'test' for testing, 'benchmark' for reports, 'serve' for the HTTP API, 'doc2query' for indexing generated questions, 'reindex' for building a new index version)",
+    )
+    parser.add_argument(
+        "--port", type=int, default=8000, help="Port of the HTTP API"
+    )
+    parser.add_argument(
+        "--url",
+        type=str,
+        default="http://localhost:8000",
+        help="URL of the running HTTP API for the throughput benchmark",
     )
 
     parser.add_argument(
@@ -50,6 +72,26 @@ def main():
         help="Path to the output JSON file for testing results",
         default="data/test_results.json",
     )
+    parser.add_argument(
+        "--benchmark",
+        type=str,
+        choices=[
+            "chunking",
+            "throughput",
+            "tokens",
+            "depth",
+            "quantization",
+            "dimensions",
+        ],
+        default="chunking",
+        help="Benchmark to run when mode is 'benchmark'",
+    )
+    parser.add_argument(
+        "--report_json",
+        type=str,
+        help="Path to the output JSON file for the benchmark report",
+        default=None,
+    )
     args = parser.parse_args()
 
     if args.mode == "test":
@@ -61,6 +103,30 @@ def main():
             mass_test(args.input_json, args.output_json)
         except Exception as e:
             print(f"Error during mass test: {e}")
+    elif args.mode == "benchmark":
+        report_json = args.report_json or f"data/{args.benchmark}_report.json"
+        if args.benchmark == "chunking":
+            chunking_report(report_json)
+        elif args.benchmark == "throughput":
+            throughput_report(report_json, args.input_json, url=args.url)
+        elif args.benchmark == "tokens":
+            token_count_report(report_json)
+        elif args.benchmark == "depth":
+            retrieval_depth_report(report_json, args.input_json)
+        elif args.benchmark == "quantization":
+            quantization_report(report_json, args.input_json)
+        elif args.benchmark == "dimensions":
+            dimension_report(report_json, args.input_json)
+    elif args.mode == "reindex":
+        # Runs beside the serving process, whose logs are kept.
+        Settings.embed_model = LocalEmbeddingFactory.set_embedding(
+            host=args.host
+        )
+        llm = LocalRAGModelFactory.set_model(
+            RAGSettings().OLLAMA.LLM, host=args.host
+        )
+        if IndexVersions().build(llm=llm, input_json=args.input_json) is None:
+            raise SystemExit(1)
     else:
         # OLLAMA SERVER
         if args.host != "host.docker.internal":
@@ -76,6 +142,25 @@ def main():
         # PIPELINE
         pipeline = LocalRAGPipeline(host=args.host)
 
+        if args.mode == "doc2query":
+            if not pipeline.check_store_exists():
+                print("Begin ingesting data...")
+                pipeline.process_document_dir()
+                pipeline.store_nodes()
+                print("Finished ingesting data.")
+            print("Indexing generated questions...")
+            pipeline.index_questions()
+            return
+
+        if args.mode == "serve":
+            if not pipeline.check_store_exists():
+                print("Begin ingesting data in the background...")
+                pipeline.start_ingestion()
+            pipeline.set_chat_engine()
+            print(f"Serving the API on port {args.port}")
+            serve(pipeline, port=args.port)
+            return
+
         # UI
         ui = LocalChatbotApp(
             pipeline=pipeline,
@@ -84,10 +169,10 @@ def main():
             avatar_images=AVATAR_IMAGES,
         )
 
+        # The UI starts right away and shows the indexing progress.
         if not ui.pipeline.check_store_exists():
-            print("Begin ingesting data...")
+            print("Begin ingesting data in the background...")
             ui.ingest_data()
-            print("Finished ingesting data.")
 
         print("Setting chat engine")
         ui.pipeline.set_chat_engine()
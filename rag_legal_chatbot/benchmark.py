@@ -0,0 +1,683 @@
+import asyncio
+import json
+import statistics
+import time
+from tqdm import tqdm
+
+import httpx
+
+from llama_index.core import Settings
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.node_parser import get_leaf_nodes
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+from .core import LocalChatEngineFactory, LocalEmbeddingFactory
+from .core.embedding import get_query_embeddings, truncate_embedding
+from .core.ingestion import LocalDataIngestion
+from .core.numpy_retriever import NumpyVectorRetriever
+from .core.memory import SummaryChatMemory
+from .core.metadata import LegalMetadataExtractor, cites
+from .core.prompts import ContextPrompt, SystemPrompt
+from .core.retriever import LocalRetrieverFactory
+from .core.vector_store import LocalVectorStoreFactory
+from .core.tokens import (
+    count_tokens,
+    get_chat_token_budget,
+    get_context_token_budget,
+    get_token_cache,
+    node_token_count,
+    set_token_count,
+)
+from .settings import RAGSettings
+
+
+def _straddles_section(node, text: str, headings: list[int]) -> bool:
+    """Whether a node cuts into a section on either side of a § heading it contains."""
+    start, end = node.start_char_idx, node.end_char_idx
+    if start is None or end is None:
+        return False
+    if not any(start < heading < end for heading in headings):
+        return False
+    previous = max([h for h in headings if h <= start], default=0)
+    following = min([h for h in headings if h >= end], default=len(text))
+    return bool(text[previous:start].strip() or text[end:following].strip())
+
+
+def _chunking_stats(nodes, tokenizer, text: str, headings: list[int]) -> dict:
+    leaf_nodes = get_leaf_nodes(nodes)
+    token_counts = [
+        len(tokenizer(node.get_content(metadata_mode=MetadataMode.EMBED)))
+        for node in leaf_nodes
+    ]
+    return {
+        "embedded_nodes": len(leaf_nodes),
+        "parent_nodes": len(nodes) - len(leaf_nodes),
+        "embedded_tokens": sum(token_counts),
+        "avg_tokens": (
+            round(sum(token_counts) / len(token_counts), 1)
+            if token_counts
+            else 0
+        ),
+        "max_tokens": max(token_counts, default=0),
+        "straddling_nodes": sum(
+            _straddles_section(node, text, headings) for node in leaf_nodes
+        ),
+    }
+
+
+def chunking_report(output_json: str, setting: RAGSettings | None = None) -> dict:
+    """
+    Compares the sentence splitter with the legal node parser on the document directory.
+
+    Args:
+        output_json (str): Path of the JSON report.
+        setting (RAGSettings | None): Settings for both parsers (default: None).
+
+    Returns:
+        dict: The report, with per-file and total statistics for each mode.
+    """
+    setting = setting or RAGSettings()
+    ingestion = LocalDataIngestion(setting)
+    ingestion.process_documents()
+    extractor = LegalMetadataExtractor()
+    tokenizer = get_tokenizer()
+    modes = ["sentence", "legal"]
+    parsers = {mode: ingestion.get_node_parser(mode) for mode in modes}
+
+    files = {}
+    for input_file in tqdm(
+        sorted(ingestion._input_files), desc="Chunking documents"
+    ):
+        if not input_file.lower().endswith(".pdf"):
+            continue
+        document = ingestion.read_document(input_file)
+        file_name = document.metadata["file_name"]
+        headings = [
+            offset for offset, _, _ in extractor.section_spans(document.text)
+        ]
+        files[file_name] = {}
+        for mode, parser in parsers.items():
+            nodes = extractor(document.text, file_name, parser([document]))
+            files[file_name][mode] = _chunking_stats(
+                nodes, tokenizer, document.text, headings
+            )
+
+    total = {
+        mode: {
+            key: sum(stats[mode][key] for stats in files.values())
+            for key in [
+                "embedded_nodes",
+                "parent_nodes",
+                "embedded_tokens",
+                "straddling_nodes",
+            ]
+        }
+        for mode in modes
+    }
+    for mode in modes:
+        total[mode]["max_tokens"] = max(
+            (stats[mode]["max_tokens"] for stats in files.values()), default=0
+        )
+    sentence, legal = total["sentence"], total["legal"]
+    report = {
+        "settings": {
+            "sentence": {
+                "chunk_size": setting.INGESTION.CHUNK_SIZE,
+                "chunk_overlap": setting.INGESTION.CHUCK_OVERLAP,
+            },
+            "legal": {
+                "chunk_size": setting.INGESTION.CHILD_CHUNK_SIZE,
+                "parent_chunk_size": setting.INGESTION.PARENT_CHUNK_SIZE,
+            },
+        },
+        "total": total,
+        "embedded_token_reduction": (
+            round(1 - legal["embedded_tokens"] / sentence["embedded_tokens"], 3)
+            if sentence["embedded_tokens"]
+            else 0
+        ),
+        "files": files,
+    }
+
+    print(f"Writing report to {output_json}...")
+    with open(output_json, "w", encoding="utf-8") as jsonfile:
+        json.dump(report, jsonfile, ensure_ascii=False, indent=4)
+
+    return report
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+
+async def _timed_query(
+    client: httpx.AsyncClient, url: str, question: str, session: str
+) -> dict:
+    started = time.perf_counter()
+    first_token = None
+    async with client.stream(
+        "POST",
+        f"{url}/query",
+        json={"question": question},
+        headers={"X-Session-Id": session},
+    ) as response:
+        if response.status_code == 503:
+            return {"shed": True}
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first_token is None and line == "event: token":
+                first_token = time.perf_counter() - started
+    return {
+        "shed": False,
+        "first_token_seconds": first_token or 0.0,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+async def _run_clients(
+    url: str, questions: list[str], concurrency: int
+) -> list[dict]:
+    queue = list(questions)
+    results = []
+    async with httpx.AsyncClient(timeout=None) as client:
+
+        async def client_loop(session: str) -> None:
+            while queue:
+                results.append(
+                    await _timed_query(client, url, queue.pop(0), session)
+                )
+
+        await asyncio.gather(
+            *[client_loop(f"benchmark-{i}") for i in range(concurrency)]
+        )
+    return results
+
+
+def throughput_report(
+    output_json: str,
+    input_json: str,
+    url: str = "http://localhost:8000",
+    concurrency_levels: list[int] = [1, 2, 4, 8],
+    num_questions: int = 16,
+) -> dict:
+    """
+    Measures the throughput of the HTTP API (--mode serve) under concurrent clients.
+
+    Args:
+        output_json (str): Path of the JSON report.
+        input_json (str): Test questions, in the format of data/test_questions.json.
+        url (str): Base URL of the running API (default: "http://localhost:8000").
+        concurrency_levels (list[int]): Numbers of concurrent clients (default: [1, 2, 4, 8]).
+        num_questions (int): Questions asked at every level (default: 16).
+
+    Returns:
+        dict: Requests per second, latency and time to first token per level.
+    """
+    with open(input_json, "r", encoding="utf-8") as file:
+        questions = [entry["question"] for entry in json.load(file)]
+    questions = questions[:num_questions]
+
+    levels = {}
+    for concurrency in tqdm(concurrency_levels, desc="Concurrency levels"):
+        started = time.perf_counter()
+        results = asyncio.run(_run_clients(url, questions, concurrency))
+        elapsed = time.perf_counter() - started
+        answered = [r for r in results if not r["shed"]]
+        latencies = [r["seconds"] for r in answered]
+        first_tokens = [r["first_token_seconds"] for r in answered]
+        levels[concurrency] = {
+            "requests": len(results),
+            "shed": len(results) - len(answered),
+            "requests_per_second": round(len(answered) / elapsed, 3),
+            "mean_seconds": (
+                round(statistics.mean(latencies), 3) if latencies else 0.0
+            ),
+            "p50_seconds": _percentile(latencies, 0.5),
+            "p95_seconds": _percentile(latencies, 0.95),
+            "p50_first_token_seconds": _percentile(first_tokens, 0.5),
+            "p95_first_token_seconds": _percentile(first_tokens, 0.95),
+        }
+        print(f"{concurrency} clients: {levels[concurrency]}")
+
+    report = {"url": url, "questions": len(questions), "levels": levels}
+    print(f"Writing report to {output_json}...")
+    with open(output_json, "w", encoding="utf-8") as jsonfile:
+        json.dump(report, jsonfile, ensure_ascii=False, indent=4)
+
+    return report
+
+
+def _budget_check_seconds(
+    memory, nodes: list, history: list, prompt: str, cached: bool
+) -> float:
+    """CPU seconds of the budget checks of one turn."""
+    started = time.process_time()
+    if cached:
+        node_tokens = [node_token_count(node) for node in nodes]
+        initial = count_tokens(prompt) + sum(node_tokens) + len(nodes)
+    else:
+        tokenizer = get_tokenizer()
+        texts = [node.get_content(metadata_mode=MetadataMode.LLM) for node in nodes]
+        node_tokens = [len(tokenizer(text)) for text in texts]
+        initial = len(tokenizer(prompt + "\n\n".join(texts)))
+    memory.set(list(history))
+    memory.get(initial_token_count=min(initial, memory.token_limit))
+    return time.process_time() - started
+
+
+def token_count_report(
+    output_json: str,
+    setting: RAGSettings | None = None,
+    num_turns: int = 20,
+) -> dict:
+    """
+    Measures the CPU time of the token budget checks with and without the token cache.
+
+    Every simulated turn counts the retrieved chunks for context packing,
+    the prompt for the chat memory and the growing chat history, the way
+    the QA engine does. Without the cache everything is tokenized again on
+    every turn; with it, chunks use the counts stored at ingestion and
+    messages and prompts hit the text-hash cache.
+
+    Args:
+        output_json (str): Path of the JSON report.
+        setting (RAGSettings | None): The RAG settings (default: None).
+        num_turns (int): Number of simulated chat turns (default: 20).
+
+    Returns:
+        dict: The report, with the mean CPU milliseconds per turn.
+    """
+    setting = setting or RAGSettings()
+    ingestion = LocalDataIngestion(setting)
+    ingestion.process_documents()
+    extractor = LegalMetadataExtractor()
+    parser = ingestion.get_node_parser()
+
+    nodes = []
+    for input_file in tqdm(
+        sorted(ingestion._input_files), desc="Chunking documents"
+    ):
+        if not input_file.lower().endswith(".pdf"):
+            continue
+        document = ingestion.read_document(input_file)
+        file_name = document.metadata["file_name"]
+        nodes.extend(
+            get_leaf_nodes(extractor(document.text, file_name, parser([document])))
+        )
+    if not nodes:
+        raise ValueError("No documents to benchmark")
+    for node in nodes:
+        set_token_count(node)
+
+    prompt = SystemPrompt()("eng") + "\n" + ContextPrompt()("eng")
+    top_k = setting.RETRIEVER.SIMILARITY_TOP_K
+    budget = get_chat_token_budget(setting) + get_context_token_budget(setting)
+    results = {}
+    for mode in ["uncached", "cached"]:
+        get_token_cache().clear()
+        memory = (
+            SummaryChatMemory(token_limit=budget)
+            if mode == "cached"
+            else ChatMemoryBuffer(token_limit=budget)
+        )
+        history = []
+        seconds = []
+        for turn in range(num_turns):
+            retrieved = [
+                nodes[(turn * top_k + i) % len(nodes)] for i in range(top_k)
+            ]
+            history += [
+                ChatMessage(
+                    role=MessageRole.USER,
+                    content=retrieved[0].get_content()[:300],
+                ),
+                ChatMessage(
+                    role=MessageRole.ASSISTANT,
+                    content=retrieved[1].get_content(),
+                ),
+            ]
+            seconds.append(
+                _budget_check_seconds(
+                    memory, retrieved, history, prompt, mode == "cached"
+                )
+            )
+        results[mode] = {
+            "mean_ms_per_turn": round(1000 * statistics.mean(seconds), 3),
+            "total_ms": round(1000 * sum(seconds), 3),
+        }
+    results["cached"]["cache"] = get_token_cache().stats
+
+    uncached = results["uncached"]["mean_ms_per_turn"]
+    cached = results["cached"]["mean_ms_per_turn"]
+    report = {
+        "settings": {
+            "num_turns": num_turns,
+            "similarity_top_k": top_k,
+            "nodes": len(nodes),
+        },
+        **results,
+        "saved_ms_per_turn": round(uncached - cached, 3),
+        "speedup": round(uncached / cached, 2) if cached else None,
+    }
+
+    print(f"Writing report to {output_json}...")
+    with open(output_json, "w", encoding="utf-8") as jsonfile:
+        json.dump(report, jsonfile, ensure_ascii=False, indent=4)
+
+    return report
+
+
+def retrieval_depth_report(
+    output_json: str,
+    input_json: str,
+    setting: RAGSettings | None = None,
+) -> dict:
+    """
+    Compares the fixed and the adaptive retrieval depth on the test questions.
+
+    Both modes retrieve, rerank (if RETRIEVER.USE_RERANK) and pack the
+    context of every question from the ingested collection. Accuracy is the
+    share of questions whose context holds the expected law and section.
+
+    Args:
+        output_json (str): Path of the JSON report.
+        input_json (str): Test questions, in the format of data/test_questions.json.
+        setting (RAGSettings | None): The RAG settings (default: None).
+
+    Returns:
+        dict: Latency, context size and accuracy of each mode.
+    """
+    setting = setting or RAGSettings()
+    with open(input_json, "r", encoding="utf-8") as file:
+        entries = json.load(file)
+    Settings.embed_model = LocalEmbeddingFactory.set_embedding(setting)
+
+    modes = {}
+    for mode, adaptive in [("fixed", False), ("adaptive", True)]:
+        mode_setting = setting.model_copy(deep=True)
+        mode_setting.RETRIEVER.ADAPTIVE_DEPTH = adaptive
+        factory = LocalChatEngineFactory(mode_setting)
+        retriever = factory.retriever_factory.get_retrievers(nodes=[])
+        postprocessors = factory.get_node_postprocessors()
+
+        seconds, depths, tokens, hits = [], [], [], 0
+        for entry in tqdm(entries, desc=f"Retrieving ({mode})"):
+            query_bundle = QueryBundle(entry["question"])
+            started = time.perf_counter()
+            nodes = retriever.retrieve(query_bundle)
+            for postprocessor in postprocessors:
+                nodes = postprocessor.postprocess_nodes(
+                    nodes, query_bundle=query_bundle
+                )
+            seconds.append(time.perf_counter() - started)
+            depths.append(len(nodes))
+            tokens.append(sum(node_token_count(node.node) for node in nodes))
+            hits += any(
+                cites(node, entry.get("law"), entry.get("section"))
+                for node in nodes
+            )
+        modes[mode] = {
+            "mean_seconds": round(statistics.mean(seconds), 3),
+            "p95_seconds": _percentile(seconds, 0.95),
+            "mean_nodes": round(statistics.mean(depths), 2),
+            "mean_context_tokens": round(statistics.mean(tokens), 1),
+            "accuracy": round(hits / len(entries), 3),
+        }
+        print(f"{mode}: {modes[mode]}")
+
+    report = {
+        "settings": {
+            "similarity_top_k": setting.RETRIEVER.SIMILARITY_TOP_K,
+            "top_k_rerank": setting.RETRIEVER.TOP_K_RERANK,
+            "use_rerank": setting.RETRIEVER.USE_RERANK,
+            "adaptive_min_k": setting.RETRIEVER.ADAPTIVE_MIN_K,
+            "adaptive_max_drop": setting.RETRIEVER.ADAPTIVE_MAX_DROP,
+            "adaptive_min_gap": setting.RETRIEVER.ADAPTIVE_MIN_GAP,
+        },
+        "questions": len(entries),
+        **modes,
+    }
+    print(f"Writing report to {output_json}...")
+    with open(output_json, "w", encoding="utf-8") as jsonfile:
+        json.dump(report, jsonfile, ensure_ascii=False, indent=4)
+
+    return report
+
+
+def quantization_report(
+    output_json: str,
+    input_json: str,
+    setting: RAGSettings | None = None,
+) -> dict:
+    """
+    Compares the int8 and binary quantized indexes with the float32 index.
+
+    Every index searches the ingested collection for the test questions.
+    Recall@k is the share of the float32 top k that a quantized index also
+    returns, with re-scoring (RETRIEVER.RESCORE_MULTIPLIER) and without
+    (multiplier 1). Accuracy is the share of questions whose top k holds the
+    expected law and section.
+
+    Args:
+        output_json (str): Path of the JSON report.
+        input_json (str): Test questions, in the format of data/test_questions.json.
+        setting (RAGSettings | None): The RAG settings (default: None).
+
+    Returns:
+        dict: Memory, latency, recall@k and accuracy of each index.
+    """
+    setting = setting or RAGSettings()
+    with open(input_json, "r", encoding="utf-8") as file:
+        entries = json.load(file)
+    Settings.embed_model = LocalEmbeddingFactory.set_embedding(setting)
+    vector_index = LocalVectorStoreFactory(
+        setting=setting
+    ).get_or_create_vector_store_index(nodes=[])
+    embeddings = get_query_embeddings(
+        Settings.embed_model, [entry["question"] for entry in entries]
+    )
+    top_k = setting.RETRIEVER.SIMILARITY_TOP_K
+
+    def run(retriever) -> tuple[list[list[NodeWithScore]], list[float]]:
+        results, seconds = [], []
+        for entry, embedding in zip(entries, embeddings):
+            started = time.perf_counter()
+            results.append(
+                retriever.retrieve(
+                    QueryBundle(entry["question"], embedding=embedding)
+                )
+            )
+            seconds.append(time.perf_counter() - started)
+        return results, seconds
+
+    def summary(results, seconds) -> dict:
+        hits = sum(
+            any(
+                cites(node, entry.get("law"), entry.get("section"))
+                for node in nodes
+            )
+            for entry, nodes in zip(entries, results)
+        )
+        return {
+            "mean_ms": round(statistics.mean(seconds) * 1000, 3),
+            "p95_ms": round(_percentile(seconds, 0.95) * 1000, 3),
+            "accuracy": round(hits / len(entries), 3),
+        }
+
+    def recall(results) -> float:
+        return round(
+            statistics.mean(
+                len(
+                    {node.node.node_id for node in nodes}
+                    & {node.node.node_id for node in exact}
+                )
+                / max(len(exact), 1)
+                for nodes, exact in zip(results, float_results)
+            ),
+            3,
+        )
+
+    factory = LocalRetrieverFactory(setting)
+    float_retriever = factory._get_numpy_retriever(vector_index, quantization="none")
+    float_results, seconds = run(float_retriever)
+    indexes = {
+        "float32": {
+            "bytes": int(float_retriever._matrix.nbytes),
+            **summary(float_results, seconds),
+        }
+    }
+    print(f"float32: {indexes['float32']}")
+
+    for quantization in ["int8", "binary"]:
+        retriever = factory._get_numpy_retriever(
+            vector_index, quantization=quantization
+        )
+        results, seconds = run(retriever)
+        multiplier = retriever._rescore_multiplier
+        retriever._rescore_multiplier = 1
+        no_rescore, _ = run(retriever)
+        retriever._rescore_multiplier = multiplier
+        memory = retriever.memory
+        indexes[quantization] = {
+            "bytes": memory["index_bytes"],
+            "reduction": memory["reduction"],
+            f"recall@{top_k}": recall(results),
+            f"recall@{top_k}_no_rescore": recall(no_rescore),
+            **summary(results, seconds),
+        }
+        print(f"{quantization}: {indexes[quantization]}")
+
+    report = {
+        "settings": {
+            "similarity_top_k": top_k,
+            "rescore_multiplier": setting.RETRIEVER.RESCORE_MULTIPLIER,
+            "embed_llm": setting.INGESTION.EMBED_LLM,
+        },
+        "nodes": int(float_retriever._matrix.shape[0]),
+        "dim": int(float_retriever._matrix.shape[1]),
+        "questions": len(entries),
+        **indexes,
+    }
+    print(f"Writing report to {output_json}...")
+    with open(output_json, "w", encoding="utf-8") as jsonfile:
+        json.dump(report, jsonfile, ensure_ascii=False, indent=4)
+
+    return report
+
+
+def dimension_report(
+    output_json: str,
+    input_json: str,
+    setting: RAGSettings | None = None,
+    dims: tuple[int, ...] = (256, 512, 768, 1024),
+) -> dict:
+    """
+    Sweeps shortened embedding dimensions (EMBED_DIM) on the test questions.
+
+    The ingested collection must hold full-dimension vectors. They and the
+    question embeddings are shortened to every dimension like the models
+    do (see truncate_embedding) and searched exactly, so the sweep needs no
+    re-ingestion. Recall@k is the share of the full-dimension top k also
+    found, and accuracy the share of questions whose top k holds the
+    expected law and section.
+
+    Args:
+        output_json (str): Path of the JSON report.
+        input_json (str): Test questions, in the format of data/test_questions.json.
+        setting (RAGSettings | None): The RAG settings (default: None).
+        dims (tuple[int, ...]): Dimensions compared with the full one.
+
+    Returns:
+        dict: Memory, latency, recall@k and accuracy of each dimension.
+    """
+    setting = (setting or RAGSettings()).model_copy(deep=True)
+    setting.INGESTION.EMBED_DIM = None
+    with open(input_json, "r", encoding="utf-8") as file:
+        entries = json.load(file)
+    Settings.embed_model = LocalEmbeddingFactory.set_embedding(setting)
+    collection = (
+        LocalVectorStoreFactory(setting=setting)
+        .get_or_create_vector_store_index(nodes=[])
+        .vector_store.client
+    )
+    data = collection.get(include=["embeddings", "documents", "metadatas"])
+    embeddings = get_query_embeddings(
+        Settings.embed_model, [entry["question"] for entry in entries]
+    )
+    full_dim = len(embeddings[0])
+    top_k = setting.RETRIEVER.SIMILARITY_TOP_K
+
+    full_results = None
+    results = {}
+    for dim in [full_dim] + [dim for dim in dims if dim < full_dim]:
+        nodes = []
+        for text, metadata, embedding in zip(
+            data["documents"], data["metadatas"], data["embeddings"]
+        ):
+            node = metadata_dict_to_node(metadata)
+            node.set_content(text)
+            node.embedding = truncate_embedding(list(embedding), dim)
+            nodes.append(node)
+        retriever = NumpyVectorRetriever(
+            nodes=nodes,
+            embed_model=Settings.embed_model,
+            similarity_top_k=top_k,
+        )
+
+        retrieved, seconds = [], []
+        for entry, embedding in zip(entries, embeddings):
+            query_bundle = QueryBundle(
+                entry["question"], embedding=truncate_embedding(embedding, dim)
+            )
+            started = time.perf_counter()
+            retrieved.append(retriever.retrieve(query_bundle))
+            seconds.append(time.perf_counter() - started)
+        if full_results is None:
+            full_results = retrieved
+
+        hits = sum(
+            any(
+                cites(node, entry.get("law"), entry.get("section"))
+                for node in nodes
+            )
+            for entry, nodes in zip(entries, retrieved)
+        )
+        results[str(dim)] = {
+            "bytes": int(retriever._matrix.nbytes),
+            "mean_ms": round(statistics.mean(seconds) * 1000, 3),
+            "p95_ms": round(_percentile(seconds, 0.95) * 1000, 3),
+            f"recall@{top_k}": round(
+                statistics.mean(
+                    len(
+                        {node.node.node_id for node in nodes}
+                        & {node.node.node_id for node in full}
+                    )
+                    / max(len(full), 1)
+                    for nodes, full in zip(retrieved, full_results)
+                ),
+                3,
+            ),
+            "accuracy": round(hits / len(entries), 3),
+        }
+        print(f"{dim}: {results[str(dim)]}")
+
+    report = {
+        "settings": {
+            "similarity_top_k": top_k,
+            "embed_llm": setting.INGESTION.EMBED_LLM,
+        },
+        "nodes": len(data["ids"]),
+        "questions": len(entries),
+        **results,
+    }
+    print(f"Writing report to {output_json}...")
+    with open(output_json, "w", encoding="utf-8") as jsonfile:
+        json.dump(report, jsonfile, ensure_ascii=False, indent=4)
+
+    return report
@@ -0,0 +1,191 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator
+
+from ..settings import RAGSettings
+
+
+class Ticket:
+    """A query admitted by the AdmissionController, waiting or running."""
+
+    def __init__(self, controller: "AdmissionController", user: str) -> None:
+        self.controller = controller
+        self.user = user
+        self.running = False
+        self.released = False
+
+    @property
+    def position(self) -> int:
+        """1-based position in the queue, 0 once the query runs."""
+        return self.controller.position(self)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Waits for a generation slot, returns True once the query may run."""
+        return self.controller.wait(self, timeout)
+
+    def release(self) -> None:
+        self.controller.release(self)
+
+    def __enter__(self) -> "Ticket":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+
+class AdmissionController:
+    """
+    Admits queries into a bounded FIFO queue in front of the LLM.
+
+    At most max_generations queries run at once and at most max_queue wait
+    behind them. A user may have max_per_user queries admitted. A query that
+    does not fit is shed right away, so callers can answer "busy" instead of
+    piling requests onto the LLM until they time out. Other expensive stages,
+    such as reranking, get their own semaphores through stage().
+
+    Args:
+        max_queue (int): Maximum number of waiting queries.
+        max_per_user (int): Maximum number of admitted queries per user.
+        max_generations (int): Maximum number of queries generating at once.
+        stage_limits (dict[str, int] | None): Concurrency of other named stages (default: None).
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 16,
+        max_per_user: int = 1,
+        max_generations: int = 2,
+        stage_limits: dict[str, int] | None = None,
+    ) -> None:
+        self._max_queue = max_queue
+        self._max_per_user = max_per_user
+        self._max_generations = max_generations
+        self._stages = {
+            name: threading.BoundedSemaphore(limit)
+            for name, limit in (stage_limits or {}).items()
+        }
+        self._condition = threading.Condition()
+        self._waiting: list[Ticket] = []
+        self._running = 0
+        self._per_user: Counter[str] = Counter()
+        self._admitted = 0
+        self._shed = 0
+
+    @property
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "waiting": len(self._waiting),
+                "running": self._running,
+                "admitted": self._admitted,
+                "shed": self._shed,
+            }
+
+    def admit(self, user: str, limit_user: bool = True) -> Ticket | None:
+        """
+        Admits a query into the queue.
+
+        Args:
+            user (str): Identifier of the user, such as the Gradio session hash.
+            limit_user (bool): Apply the per-user cap, False for batch items (default: True).
+
+        Returns:
+            Ticket | None: The ticket, or None if the query was shed.
+        """
+        with self._condition:
+            if len(self._waiting) >= self._max_queue or (
+                limit_user and self._per_user[user] >= self._max_per_user
+            ):
+                self._shed += 1
+                return None
+            ticket = Ticket(self, user)
+            self._waiting.append(ticket)
+            self._per_user[user] += 1
+            self._admitted += 1
+            return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        with self._condition:
+            if ticket.running or ticket.released:
+                return 0
+            return self._waiting.index(ticket) + 1
+
+    def _can_run(self, ticket: Ticket) -> bool:
+        return (
+            self._waiting
+            and self._waiting[0] is ticket
+            and self._running < self._max_generations
+        )
+
+    def wait(self, ticket: Ticket, timeout: float | None = None) -> bool:
+        with self._condition:
+            if ticket.running:
+                return True
+            # A ticket released while waiting, e.g. by a cancelled request,
+            # stops the wait.
+            if not self._condition.wait_for(
+                lambda: ticket.released or self._can_run(ticket), timeout
+            ) or ticket.released:
+                return False
+            self._waiting.pop(0)
+            self._running += 1
+            ticket.running = True
+            self._condition.notify_all()
+            return True
+
+    def release(self, ticket: Ticket) -> None:
+        with self._condition:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.running:
+                self._running -= 1
+            else:
+                self._waiting.remove(ticket)
+            self._per_user[ticket.user] -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Runs a block under the semaphore of an expensive stage.
+
+        Args:
+            name (str): The stage, such as "rerank". Unknown stages are not limited.
+        """
+        semaphore = self._stages.get(name)
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            yield
+
+
+_controller: AdmissionController | None = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller(
+    setting: RAGSettings | None = None,
+) -> AdmissionController:
+    """
+    Returns the process-wide admission controller.
+
+    Args:
+        setting (RAGSettings | None): Settings used when the controller is created (default: None).
+
+    Returns:
+        AdmissionController: The shared controller.
+    """
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            setting = setting or RAGSettings()
+            _controller = AdmissionController(
+                max_queue=setting.ADMISSION.MAX_QUEUE,
+                max_per_user=setting.ADMISSION.MAX_PER_USER,
+                max_generations=setting.ADMISSION.MAX_GENERATIONS,
+                stage_limits={"rerank": setting.ADMISSION.MAX_RERANKS},
+            )
+        return _controller
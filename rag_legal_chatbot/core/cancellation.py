@@ -0,0 +1,119 @@
+import threading
+
+from llama_index.core.base.llms.types import (
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+)
+from llama_index.core.chat_engine.types import StreamingAgentChatResponse
+
+
+class GenerationStats:
+    """
+    Counts completed and cancelled generations.
+
+    Streamed chunks are counted as tokens, which is what Ollama and OpenAI
+    send. Every cancelled answer is assumed to have saved the mean length
+    of a completed answer minus what it had generated.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._completed_tokens = 0
+        self._cancelled = 0
+        self._cancelled_tokens = 0
+        self._saved_tokens = 0.0
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "completed": self._completed,
+                "completed_tokens": self._completed_tokens,
+                "cancelled": self._cancelled,
+                "tokens_before_cancel": self._cancelled_tokens,
+                "estimated_saved_tokens": round(self._saved_tokens),
+            }
+
+    def record(self, tokens: int, cancelled: bool) -> None:
+        with self._lock:
+            if not cancelled:
+                self._completed += 1
+                self._completed_tokens += tokens
+                return
+            self._cancelled += 1
+            self._cancelled_tokens += tokens
+            if self._completed:
+                mean_tokens = self._completed_tokens / self._completed
+                self._saved_tokens += max(0.0, mean_tokens - tokens)
+
+
+_generation_stats = GenerationStats()
+
+
+def get_generation_stats() -> GenerationStats:
+    return _generation_stats
+
+
+class CancellableStream:
+    """
+    Wraps an LLM chat stream so the generation can be stopped mid-answer.
+
+    After cancel(), the stream ends at the next chunk and closes the LLM
+    generator, which closes its streaming HTTP request so the server stops
+    generating.
+
+    Args:
+        stream (ChatResponseGen | ChatResponseAsyncGen): The LLM chat stream.
+    """
+
+    def __init__(self, stream: ChatResponseGen | ChatResponseAsyncGen) -> None:
+        self._stream = stream
+        self._cancelled = threading.Event()
+        self.tokens = 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def __iter__(self) -> ChatResponseGen:
+        try:
+            for chat in self._stream:
+                if self.cancelled:
+                    break
+                self.tokens += 1
+                yield chat
+        finally:
+            self._stream.close()
+            _generation_stats.record(self.tokens, self.cancelled)
+
+    async def __aiter__(self) -> ChatResponseAsyncGen:
+        try:
+            async for chat in self._stream:
+                if self.cancelled:
+                    break
+                self.tokens += 1
+                yield chat
+        finally:
+            await self._stream.aclose()
+            _generation_stats.record(self.tokens, self.cancelled)
+
+
+class CancellableChatResponse(StreamingAgentChatResponse):
+    """StreamingAgentChatResponse whose generation can be cancelled."""
+
+    @property
+    def cancelled(self) -> bool:
+        return any(
+            isinstance(stream, CancellableStream) and stream.cancelled
+            for stream in (self.chat_stream, self.achat_stream)
+        )
+
+    def cancel(self) -> None:
+        """Stops the generation; response_gen ends with the partial answer."""
+        for stream in (self.chat_stream, self.achat_stream):
+            if isinstance(stream, CancellableStream):
+                stream.cancel()
@@ -0,0 +1,510 @@
+import asyncio
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from llama_index.core.callbacks import trace_method
+from llama_index.core.chat_engine import (
+    CondensePlusContextChatEngine,
+    SimpleChatEngine,
+)
+from llama_index.core.chat_engine.types import ToolOutput
+from llama_index.core.indices.base_retriever import BaseRetriever
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.types import Thread
+
+from .cancellation import CancellableChatResponse, CancellableStream
+from .condense import QuestionCondenser, question_overlap
+from .memory import SummaryChatMemory
+from .prompt_cache import atrack_prompt_cache, track_prompt_cache, usage_kwargs
+from .prompts import DocumentsPrompt, InstructionPrompt
+from .tokens import count_tokens, node_token_count
+
+# Shared by all engines, so recreating an engine does not leak threads.
+_SPECULATIVE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="speculative-retrieval"
+)
+
+
+def fork_memory(memory: ChatMemoryBuffer) -> ChatMemoryBuffer:
+    """Returns an empty chat memory with the settings of another."""
+    if isinstance(memory, SummaryChatMemory):
+        return memory.fork()
+    return ChatMemoryBuffer.from_defaults(token_limit=memory.token_limit)
+
+
+async def aget_history(
+    memory: ChatMemoryBuffer, **kwargs: Any
+) -> list[ChatMessage]:
+    """Gets the history of a memory, summarizing it without blocking the event loop."""
+    if isinstance(memory, SummaryChatMemory):
+        return await memory.aget(**kwargs)
+    return memory.get(**kwargs)
+
+
+def merge_retrieved(*results: list[NodeWithScore]) -> list[NodeWithScore]:
+    """
+    Merges retrieval results by node id, keeping the highest score.
+
+    Args:
+        *results (list[NodeWithScore]): Results of several retrievals.
+
+    Returns:
+        list[NodeWithScore]: The unique nodes, best score first.
+    """
+    merged: dict[str, NodeWithScore] = {}
+    for nodes in results:
+        for node in nodes:
+            best = merged.get(node.node.node_id)
+            if best is None or (node.score or 0.0) > (best.score or 0.0):
+                merged[node.node.node_id] = node
+    return sorted(merged.values(), key=lambda n: n.score or 0.0, reverse=True)
+
+
+class LocalCondensePlusContextChatEngine(CondensePlusContextChatEngine):
+    """
+    CondensePlusContextChatEngine with a pluggable condense stage.
+
+    Condensing is delegated to a QuestionCondenser, which skips the LLM call
+    when it is not needed and may use a different LLM than the answers.
+
+    With speculative retrieval, the search on the raw user message runs
+    while the question is condensed. A second search on the condensed
+    question only runs if it shares less than speculative_overlap of its
+    words with the raw message, and both results are merged.
+
+    With a prefix-stable prompt, the prompt goes from the most to the least
+    stable content: the system prompt and instruction_prompt, the same for
+    every query, then the retrieved documents in document order as a second
+    system message, then the history and the question. Ollama reuses its KV
+    cache and OpenAI its prompt cache for the longest common prefix, which
+    the default layout, with the documents inside the first message, breaks
+    on every query.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        condenser: QuestionCondenser | None = None,
+        speculative_retrieval: bool = False,
+        speculative_overlap: float = 0.6,
+        prefix_stable: bool = False,
+        instruction_prompt: str | None = None,
+        documents_prompt: str | None = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self._condenser = condenser or QuestionCondenser(
+            llm=self._llm,
+            condense_prompt=self._condense_prompt_template,
+            skip_standalone=False,
+        )
+        self._speculative_retrieval = speculative_retrieval
+        self._speculative_overlap = speculative_overlap
+        self._num_speculative = 0
+        self._num_second_retrievals = 0
+        self._prefix_stable = prefix_stable
+        self._instruction_prompt = instruction_prompt or InstructionPrompt()("eng")
+        self._documents_prompt_template = PromptTemplate(
+            documents_prompt or DocumentsPrompt()("eng")
+        )
+
+    @classmethod
+    def from_defaults(
+        cls,
+        retriever: BaseRetriever,
+        condenser: QuestionCondenser | None = None,
+        speculative_retrieval: bool = False,
+        speculative_overlap: float = 0.6,
+        prefix_stable: bool = False,
+        instruction_prompt: str | None = None,
+        documents_prompt: str | None = None,
+        **kwargs: Any,
+    ) -> "LocalCondensePlusContextChatEngine":
+        engine = super().from_defaults(retriever=retriever, **kwargs)
+        if condenser is not None:
+            engine._condenser = condenser
+        engine._speculative_retrieval = speculative_retrieval
+        engine._speculative_overlap = speculative_overlap
+        engine._prefix_stable = prefix_stable
+        if instruction_prompt is not None:
+            engine._instruction_prompt = instruction_prompt
+        if documents_prompt is not None:
+            engine._documents_prompt_template = PromptTemplate(documents_prompt)
+        return engine
+
+    @property
+    def condenser(self) -> QuestionCondenser:
+        return self._condenser
+
+    def fork(self) -> "LocalCondensePlusContextChatEngine":
+        """
+        Returns an engine with its own chat memory.
+
+        The retriever, LLM, prompts and postprocessors are shared, so one
+        loaded pipeline can serve concurrent sessions.
+
+        Returns:
+            LocalCondensePlusContextChatEngine: The new session.
+        """
+        engine = copy.copy(self)
+        engine._memory = fork_memory(self._memory)
+        return engine
+
+    @property
+    def speculative_stats(self) -> dict:
+        return {
+            "speculative_turns": self._num_speculative,
+            "second_retrievals": self._num_second_retrievals,
+        }
+
+    def _condense_question(
+        self, chat_history: list[ChatMessage], latest_message: str
+    ) -> str:
+        if self._skip_condense:
+            return latest_message
+        return self._condenser.condense(chat_history, latest_message)
+
+    async def _acondense_question(
+        self, chat_history: list[ChatMessage], latest_message: str
+    ) -> str:
+        if self._skip_condense:
+            return latest_message
+        return await self._condenser.acondense(chat_history, latest_message)
+
+    def _needs_second_retrieval(self, message: str, condensed: str) -> bool:
+        self._num_speculative += 1
+        if question_overlap(message, condensed) >= self._speculative_overlap:
+            return False
+        self._num_second_retrievals += 1
+        if self._verbose:
+            print(f"Condensed question differs, retrieving again: {condensed}")
+        return True
+
+    def _postprocess_context(
+        self, message: str, nodes: list[NodeWithScore]
+    ) -> tuple[str, list[NodeWithScore]]:
+        for postprocessor in self._node_postprocessors:
+            nodes = postprocessor.postprocess_nodes(
+                nodes, query_bundle=QueryBundle(message)
+            )
+        context_nodes = nodes
+        if self._prefix_stable:
+            # The same documents give the same text, whatever their scores.
+            context_nodes = sorted(
+                nodes,
+                key=lambda n: (
+                    n.node.metadata.get("file_name") or "",
+                    n.node.start_char_idx or 0,
+                    n.node.node_id,
+                ),
+            )
+        context_str = "\n\n".join(
+            [
+                n.node.get_content(metadata_mode=MetadataMode.LLM).strip()
+                for n in context_nodes
+            ]
+        )
+        return context_str, nodes
+
+    def _condense_and_retrieve(
+        self, chat_history: list[ChatMessage], message: str
+    ) -> tuple[str, str, list[NodeWithScore]]:
+        if not self._speculative_retrieval:
+            condensed = self._condense_question(chat_history, message)
+            nodes = self._retriever.retrieve(condensed)
+            context_str, nodes = self._postprocess_context(condensed, nodes)
+            return condensed, context_str, nodes
+
+        speculative = _SPECULATIVE_EXECUTOR.submit(
+            self._retriever.retrieve, message
+        )
+        condensed = self._condense_question(chat_history, message)
+        nodes = speculative.result()
+        if self._needs_second_retrieval(message, condensed):
+            nodes = merge_retrieved(nodes, self._retriever.retrieve(condensed))
+        context_str, nodes = self._postprocess_context(condensed, nodes)
+        return condensed, context_str, nodes
+
+    async def _acondense_and_retrieve(
+        self, chat_history: list[ChatMessage], message: str
+    ) -> tuple[str, str, list[NodeWithScore]]:
+        if not self._speculative_retrieval:
+            condensed = await self._acondense_question(chat_history, message)
+            nodes = await self._retriever.aretrieve(condensed)
+            context_str, nodes = self._postprocess_context(condensed, nodes)
+            return condensed, context_str, nodes
+
+        # The vector stores used here search synchronously, so the
+        # speculative search runs on a thread rather than the event loop.
+        nodes, condensed = await asyncio.gather(
+            asyncio.wrap_future(
+                _SPECULATIVE_EXECUTOR.submit(self._retriever.retrieve, message)
+            ),
+            self._acondense_question(chat_history, message),
+        )
+        if self._needs_second_retrieval(message, condensed):
+            nodes = merge_retrieved(
+                nodes, await self._retriever.aretrieve(condensed)
+            )
+        context_str, nodes = self._postprocess_context(condensed, nodes)
+        return condensed, context_str, nodes
+
+    def _build_prefix(
+        self,
+        condensed: str,
+        context_str: str,
+        nodes: list[NodeWithScore],
+    ) -> tuple[list[ChatMessage], int, ToolOutput]:
+        """The prompt messages before the history, their token count and the context source."""
+        if self._verbose:
+            print(f"Condensed question: {condensed}")
+            print(f"Context: {context_str}")
+        context_source = ToolOutput(
+            tool_name="retriever",
+            content=context_str,
+            raw_input={"message": condensed},
+            raw_output=context_str,
+        )
+
+        role = self._llm.metadata.system_role
+        tokenizer = self._memory.tokenizer_fn
+        # The prompt around the context is the same every turn and the
+        # nodes carry their counts, so the context is not re-tokenized.
+        if self._prefix_stable:
+            instructions = self._instruction_prompt
+            if self._system_prompt:
+                instructions = self._system_prompt + "\n" + instructions
+            prefix_messages = [
+                ChatMessage(content=instructions, role=role),
+                ChatMessage(
+                    content=self._documents_prompt_template.format(
+                        context_str=context_str
+                    ),
+                    role=role,
+                ),
+            ]
+            prompt_tokens = count_tokens(instructions, tokenizer) + count_tokens(
+                self._documents_prompt_template.format(context_str=""), tokenizer
+            )
+        else:
+            system_message_content = self._context_prompt_template.format(
+                context_str=context_str
+            )
+            prompt_without_context = self._context_prompt_template.format(
+                context_str=""
+            )
+            if self._system_prompt:
+                system_message_content = (
+                    self._system_prompt + "\n" + system_message_content
+                )
+                prompt_without_context = (
+                    self._system_prompt + "\n" + prompt_without_context
+                )
+            prefix_messages = [
+                ChatMessage(content=system_message_content, role=role)
+            ]
+            prompt_tokens = count_tokens(prompt_without_context, tokenizer)
+        initial_token_count = (
+            prompt_tokens
+            + sum(node_token_count(n.node) for n in nodes)
+            + len(nodes)
+        )
+
+        return prefix_messages, initial_token_count, context_source
+
+    def _build_chat_messages(
+        self,
+        message: str,
+        condensed: str,
+        context_str: str,
+        nodes: list[NodeWithScore],
+    ) -> tuple[list[ChatMessage], ToolOutput]:
+        prefix_messages, initial_token_count, context_source = (
+            self._build_prefix(condensed, context_str, nodes)
+        )
+        self._memory.put(ChatMessage(content=message, role=MessageRole.USER))
+        chat_messages = [
+            *prefix_messages,
+            *self._memory.get(initial_token_count=initial_token_count),
+        ]
+        return chat_messages, context_source
+
+    async def _abuild_chat_messages(
+        self,
+        message: str,
+        condensed: str,
+        context_str: str,
+        nodes: list[NodeWithScore],
+    ) -> tuple[list[ChatMessage], ToolOutput]:
+        prefix_messages, initial_token_count, context_source = (
+            self._build_prefix(condensed, context_str, nodes)
+        )
+        self._memory.put(ChatMessage(content=message, role=MessageRole.USER))
+        chat_messages = [
+            *prefix_messages,
+            *await aget_history(
+                self._memory, initial_token_count=initial_token_count
+            ),
+        ]
+        return chat_messages, context_source
+
+    def _run_c3(
+        self, message: str, chat_history: list[ChatMessage] | None = None
+    ) -> tuple[list[ChatMessage], ToolOutput, list[NodeWithScore]]:
+        if chat_history is not None:
+            self._memory.set(chat_history)
+        chat_history = self._memory.get(input=message)
+
+        condensed, context_str, nodes = self._condense_and_retrieve(
+            chat_history, message
+        )
+        chat_messages, context_source = self._build_chat_messages(
+            message, condensed, context_str, nodes
+        )
+        return chat_messages, context_source, nodes
+
+    async def _arun_c3(
+        self, message: str, chat_history: list[ChatMessage] | None = None
+    ) -> tuple[list[ChatMessage], ToolOutput, list[NodeWithScore]]:
+        if chat_history is not None:
+            self._memory.set(chat_history)
+        chat_history = await aget_history(self._memory, input=message)
+
+        condensed, context_str, nodes = await self._acondense_and_retrieve(
+            chat_history, message
+        )
+        chat_messages, context_source = await self._abuild_chat_messages(
+            message, condensed, context_str, nodes
+        )
+        return chat_messages, context_source, nodes
+
+    @trace_method("chat")
+    def stream_chat(
+        self, message: str, chat_history: list[ChatMessage] | None = None
+    ) -> CancellableChatResponse:
+        chat_messages, context_source, context_nodes = self._run_c3(
+            message, chat_history
+        )
+        chat_response = CancellableChatResponse(
+            chat_stream=CancellableStream(
+                track_prompt_cache(
+                    self._llm.stream_chat(
+                        chat_messages, **usage_kwargs(self._llm)
+                    ),
+                    chat_messages,
+                )
+            ),
+            sources=[context_source],
+            source_nodes=context_nodes,
+        )
+        thread = Thread(
+            target=chat_response.write_response_to_history,
+            args=(self._memory,),
+        )
+        thread.start()
+        return chat_response
+
+    @trace_method("chat")
+    async def astream_chat(
+        self, message: str, chat_history: list[ChatMessage] | None = None
+    ) -> CancellableChatResponse:
+        chat_messages, context_source, context_nodes = await self._arun_c3(
+            message, chat_history
+        )
+        chat_response = CancellableChatResponse(
+            achat_stream=CancellableStream(
+                atrack_prompt_cache(
+                    await self._llm.astream_chat(
+                        chat_messages, **usage_kwargs(self._llm)
+                    ),
+                    chat_messages,
+                )
+            ),
+            sources=[context_source],
+            source_nodes=context_nodes,
+        )
+        asyncio.create_task(
+            chat_response.awrite_response_to_history(self._memory)
+        )
+        return chat_response
+
+
+class LocalSimpleChatEngine(SimpleChatEngine):
+    """SimpleChatEngine whose streamed answers can be cancelled."""
+
+    def fork(self) -> "LocalSimpleChatEngine":
+        """
+        Returns an engine with its own chat memory, sharing the LLM and prompts.
+
+        Returns:
+            LocalSimpleChatEngine: The new session.
+        """
+        engine = copy.copy(self)
+        engine._memory = fork_memory(self._memory)
+        return engine
+
+    def _put_message(
+        self, message: str, chat_history: list[ChatMessage] | None
+    ) -> int:
+        """Adds the message to the memory, returns the tokens of the prefix messages."""
+        if chat_history is not None:
+            self._memory.set(chat_history)
+        self._memory.put(ChatMessage(content=message, role=MessageRole.USER))
+        return count_tokens(
+            " ".join([(m.content or "") for m in self._prefix_messages]),
+            self._memory.tokenizer_fn,
+        )
+
+    @trace_method("chat")
+    def stream_chat(
+        self, message: str, chat_history: list[ChatMessage] | None = None
+    ) -> CancellableChatResponse:
+        initial_token_count = self._put_message(message, chat_history)
+        all_messages = self._prefix_messages + self._memory.get(
+            initial_token_count=initial_token_count
+        )
+
+        chat_response = CancellableChatResponse(
+            chat_stream=CancellableStream(
+                track_prompt_cache(
+                    self._llm.stream_chat(
+                        all_messages, **usage_kwargs(self._llm)
+                    ),
+                    all_messages,
+                )
+            )
+        )
+        thread = Thread(
+            target=chat_response.write_response_to_history,
+            args=(self._memory,),
+        )
+        thread.start()
+        return chat_response
+
+    @trace_method("chat")
+    async def astream_chat(
+        self, message: str, chat_history: list[ChatMessage] | None = None
+    ) -> CancellableChatResponse:
+        initial_token_count = self._put_message(message, chat_history)
+        all_messages = self._prefix_messages + await aget_history(
+            self._memory, initial_token_count=initial_token_count
+        )
+
+        chat_response = CancellableChatResponse(
+            achat_stream=CancellableStream(
+                atrack_prompt_cache(
+                    await self._llm.astream_chat(
+                        all_messages, **usage_kwargs(self._llm)
+                    ),
+                    all_messages,
+                )
+            )
+        )
+        asyncio.create_task(
+            chat_response.awrite_response_to_history(self._memory)
+        )
+        return chat_response
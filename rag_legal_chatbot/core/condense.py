@@ -0,0 +1,194 @@
+import re
+import time
+
+from llama_index.core.base.llms.generic_utils import messages_to_history_str
+from llama_index.core.llms import ChatMessage
+from llama_index.core.llms.llm import LLM
+from llama_index.core.prompts import PromptTemplate
+
+from .metadata import LegalQueryParser
+
+
+# Words that refer back to earlier turns (English, Czech, Vietnamese).
+ANAPHORA_WORDS = {
+    # eng
+    "it", "its", "this", "that", "these", "those", "they", "them", "their",
+    "he", "she", "him", "her", "above", "previous", "same", "such", "also",
+    "former", "latter", "there",
+    # cs
+    "to", "toto", "tento", "tato", "ten", "ta", "tom", "tomu", "tím", "tu",
+    "jeho", "její", "jejich", "něj", "něm", "ní", "nich", "nim", "on", "ona",
+    "ono", "oni", "ony", "také", "též", "tedy", "uvedený", "uvedená",
+    "uvedené", "zmíněný", "zmíněná", "zmíněné", "výše", "předchozí",
+    "tamto", "stejný", "stejná", "stejné", "takový", "taková", "takové",
+    # vi
+    "nó", "đó", "này", "họ", "kia", "ấy", "vậy",
+}
+
+# Openings that continue the previous question.
+FOLLOW_UP_PREFIXES = (
+    "and ", "but ", "so ", "what about", "how about", "a co", "a kdy",
+    "a jak", "a pro", "a v", "ale ", "còn ", "vậy ",
+)
+
+
+def question_overlap(first: str, second: str) -> float:
+    """
+    Jaccard similarity of the lowercased words of two questions.
+
+    Args:
+        first (str): The first question.
+        second (str): The second question.
+
+    Returns:
+        float: 1.0 for the same words, 0.0 for no common words.
+    """
+    first_words = set(QuestionCondenser.WORD_PATTERN.findall(first.lower()))
+    second_words = set(QuestionCondenser.WORD_PATTERN.findall(second.lower()))
+    if not first_words and not second_words:
+        return 1.0
+    return len(first_words & second_words) / len(first_words | second_words)
+
+
+class QuestionCondenser:
+    """
+    Condenses a follow-up question into a standalone question.
+
+    The condense LLM call is skipped when the history is empty or when a
+    cheap local heuristic finds the question already standalone: it has
+    enough words, does not open like a continuation and has no words
+    referring back to earlier turns (or names an act explicitly). Condensing
+    can be routed to a smaller model than the one answering the question.
+
+    Args:
+        llm (LLM): The LLM used for condensing.
+        condense_prompt (PromptTemplate): Prompt with {chat_history} and {question}.
+        skip_standalone (bool): Skip the LLM call for standalone questions (default: True).
+        min_words (int): Questions with fewer words are treated as follow-ups (default: 5).
+        verbose (bool): Print every condense decision (default: False).
+    """
+
+    WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(
+        self,
+        llm: LLM,
+        condense_prompt: PromptTemplate,
+        skip_standalone: bool = True,
+        min_words: int = 5,
+        verbose: bool = False,
+    ) -> None:
+        self._llm = llm
+        self._condense_prompt = condense_prompt
+        self._skip_standalone = skip_standalone
+        self._min_words = min_words
+        self._verbose = verbose
+        self._parser = LegalQueryParser()
+
+        self._num_questions = 0
+        self._skipped_empty = 0
+        self._skipped_standalone = 0
+        self._num_llm_calls = 0
+        self._llm_seconds = 0.0
+
+    @property
+    def stats(self) -> dict:
+        """Counts of skipped condense calls and the estimated time saved."""
+        skipped = self._skipped_empty + self._skipped_standalone
+        mean_latency = (
+            self._llm_seconds / self._num_llm_calls
+            if self._num_llm_calls
+            else 0.0
+        )
+        return {
+            "questions": self._num_questions,
+            "skipped_empty_history": self._skipped_empty,
+            "skipped_standalone": self._skipped_standalone,
+            "llm_calls": self._num_llm_calls,
+            "skip_rate": (
+                skipped / self._num_questions if self._num_questions else 0.0
+            ),
+            "mean_llm_seconds": mean_latency,
+            "estimated_saved_seconds": mean_latency * skipped,
+        }
+
+    def is_standalone(self, question: str) -> bool:
+        """
+        Whether a question can be answered without the chat history.
+
+        Args:
+            question (str): The latest user message.
+
+        Returns:
+            bool: True if the question looks standalone.
+        """
+        text = question.strip().lower()
+        words = self.WORD_PATTERN.findall(text)
+        if text.startswith(FOLLOW_UP_PREFIXES):
+            return False
+        if any(word in ANAPHORA_WORDS for word in words):
+            # An explicit act reference usually resolves the anaphora.
+            return "act_number" in self._parser.parse(question)
+        return len(words) >= self._min_words
+
+    def _skip(self, chat_history: list[ChatMessage], question: str) -> bool:
+        self._num_questions += 1
+        if len(chat_history) == 0:
+            self._skipped_empty += 1
+            return True
+        if self._skip_standalone and self.is_standalone(question):
+            self._skipped_standalone += 1
+            if self._verbose:
+                print(f"Skipped condensing standalone question: {question}")
+            return True
+        return False
+
+    def _record(self, started: float) -> None:
+        self._num_llm_calls += 1
+        self._llm_seconds += time.perf_counter() - started
+
+    def condense(self, chat_history: list[ChatMessage], question: str) -> str:
+        """
+        Condenses the chat history and the latest message to a standalone question.
+
+        Args:
+            chat_history (list[ChatMessage]): The chat history.
+            question (str): The latest user message.
+
+        Returns:
+            str: The standalone question.
+        """
+        if self._skip(chat_history, question):
+            return question
+        started = time.perf_counter()
+        condensed = self._llm.predict(
+            self._condense_prompt,
+            question=question,
+            chat_history=messages_to_history_str(chat_history),
+        )
+        self._record(started)
+        return condensed
+
+    async def acondense(
+        self, chat_history: list[ChatMessage], question: str
+    ) -> str:
+        """
+        Asynchronously condenses the chat history and the latest message.
+
+        Args:
+            chat_history (list[ChatMessage]): The chat history.
+            question (str): The latest user message.
+
+        Returns:
+            str: The standalone question.
+        """
+        if self._skip(chat_history, question):
+            return question
+        started = time.perf_counter()
+        condensed = await self._llm.apredict(
+            self._condense_prompt,
+            question=question,
+            chat_history=messages_to_history_str(chat_history),
+        )
+        self._record(started)
+        return condensed
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import uuid
+
+from tqdm import tqdm
+
+from llama_index.core import Settings
+from llama_index.core.llms.llm import LLM
+from llama_index.core.schema import BaseNode, MetadataMode, TextNode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+from .fusion import parse_queries
+from .prompts import QuestionGenPrompt
+from .tokens import TOKEN_COUNT_KEY
+from .vector_store import LocalVectorStoreFactory
+
+from ..settings import RAGSettings
+
+# Metadata key of a generated question node holding the id of its chunk.
+QUESTION_OF_KEY = "question_of"
+
+
+def _chunk_key(node: BaseNode) -> str:
+    """Key of a chunk that survives re-ingestion, unlike its random node id."""
+    text = node.get_content(metadata_mode=MetadataMode.NONE)
+    return hashlib.sha256(
+        f"{node.metadata.get('file_name', '')}\n{text}".encode()
+    ).hexdigest()
+
+
+class QuestionIndexer:
+    """
+    Offline doc2query stage indexing generated questions as pointer nodes.
+
+    Legal prose and user questions are phrased very differently. For every
+    chunk of the collection the LLM writes the questions it answers, once at
+    ingestion instead of expanding every query at question time. The
+    questions are saved after every batch of chunks, keyed by a hash of the
+    chunk text, so an interrupted run resumes where it stopped and a rerun
+    only generates and embeds what is new. Each question is embedded as a
+    node with the metadata of its chunk and the chunk id under
+    QUESTION_OF_KEY; QuestionPointerRetriever returns the chunk in its place.
+
+    Args:
+        llm (LLM): LLM generating the questions.
+        setting (RAGSettings | None): The RAG settings (default: None).
+    """
+
+    def __init__(self, llm: LLM, setting: RAGSettings | None = None) -> None:
+        self._llm = llm
+        self._setting = setting or RAGSettings()
+        self._prompt = QuestionGenPrompt()(
+            language=self._setting.INGESTION.QUESTION_LANGUAGE
+        )
+        self._path = os.path.join(
+            self._setting.STORAGE.PERSIST_DIR,
+            f"{self._setting.STORAGE.COLLECTION_NAME}_questions.json",
+        )
+
+    def _load(self) -> dict[str, list[str]]:
+        if os.path.exists(self._path):
+            with open(self._path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        return {}
+
+    def _save(self, questions: dict[str, list[str]]) -> None:
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(questions, file, ensure_ascii=False)
+        os.replace(tmp_path, self._path)
+
+    def _generate(self, node: BaseNode) -> list[str]:
+        num_questions = self._setting.INGESTION.QUESTIONS_PER_CHUNK
+        prompt = self._prompt.format(
+            num_questions=num_questions,
+            pdf_name=node.metadata.get("file_name", ""),
+            law_content=node.get_content(metadata_mode=MetadataMode.NONE),
+        )
+        return parse_queries(self._llm.complete(prompt).text, "", num_questions)
+
+    def generate(self, nodes: list[BaseNode]) -> dict[str, list[str]]:
+        """
+        Generates the questions of the chunks that have none saved yet.
+
+        Args:
+            nodes (list[BaseNode]): The chunks.
+
+        Returns:
+            dict[str, list[str]]: The questions of every chunk, by chunk key.
+        """
+        questions = self._load()
+        todo = [node for node in nodes if _chunk_key(node) not in questions]
+        batch_size = self._setting.INGESTION.QUESTION_BATCH_SIZE
+        with tqdm(total=len(todo), desc="Generating questions") as progress:
+            for start in range(0, len(todo), batch_size):
+                for node in todo[start : start + batch_size]:
+                    try:
+                        questions[_chunk_key(node)] = self._generate(node)
+                    except Exception as e:
+                        # Not saved, so the next run retries the chunk.
+                        print(f"Error generating questions: {e}")
+                    progress.update(1)
+                self._save(questions)
+        return questions
+
+    def build_nodes(
+        self, nodes: list[BaseNode], questions: dict[str, list[str]]
+    ) -> list[TextNode]:
+        """
+        Returns the question nodes pointing to the chunks, not yet embedded.
+
+        The node ids derive from the chunk id and question, so a rerun
+        produces the same ids for the same questions.
+
+        Args:
+            nodes (list[BaseNode]): The chunks.
+            questions (dict[str, list[str]]): The questions by chunk key.
+
+        Returns:
+            list[TextNode]: The question nodes.
+        """
+        pointers = []
+        for node in nodes:
+            metadata = {
+                key: value
+                for key, value in node.metadata.items()
+                if key != TOKEN_COUNT_KEY
+            }
+            metadata[QUESTION_OF_KEY] = node.node_id
+            for question in questions.get(_chunk_key(node), []):
+                pointers.append(
+                    TextNode(
+                        id_=str(
+                            uuid.uuid5(
+                                uuid.NAMESPACE_URL, f"{node.node_id}/{question}"
+                            )
+                        ),
+                        text=question,
+                        metadata=dict(metadata),
+                        excluded_embed_metadata_keys=[
+                            key
+                            for key in node.excluded_embed_metadata_keys
+                            if key != TOKEN_COUNT_KEY
+                        ]
+                        + [QUESTION_OF_KEY],
+                        excluded_llm_metadata_keys=[
+                            key
+                            for key in node.excluded_llm_metadata_keys
+                            if key != TOKEN_COUNT_KEY
+                        ]
+                        + [QUESTION_OF_KEY],
+                    )
+                )
+        return pointers
+
+    def index(
+        self,
+        nodes: list[BaseNode] | None = None,
+        parent_nodes: list[BaseNode] | None = None,
+    ) -> int:
+        """
+        Generates, embeds and stores the questions of the whole collection, or of every shard.
+
+        Question nodes of chunks or questions that no longer exist are
+        deleted, and only new question nodes are embedded.
+
+        Args:
+            nodes (list[BaseNode] | None): Ingested nodes creating the collection if missing.
+            parent_nodes (list[BaseNode] | None): Parent nodes to store with them.
+
+        Returns:
+            int: Number of question nodes added.
+        """
+        added = deleted = num_chunks = 0
+        for vector_index in LocalVectorStoreFactory(
+            setting=self._setting
+        ).get_or_create_vector_store_indexes(nodes or [], parent_nodes):
+            vector_store = vector_index.vector_store
+            data = vector_store.client.get(include=["documents", "metadatas"])
+            chunks, existing = [], set()
+            for node_id, text, metadata in zip(
+                data["ids"], data["documents"], data["metadatas"]
+            ):
+                if QUESTION_OF_KEY in metadata:
+                    existing.add(node_id)
+                    continue
+                node = metadata_dict_to_node(metadata)
+                node.set_content(text)
+                chunks.append(node)
+
+            pointers = self.build_nodes(chunks, self.generate(chunks))
+            stale = existing - {pointer.node_id for pointer in pointers}
+            if stale:
+                vector_store.client.delete(ids=list(stale))
+            pointers = [
+                pointer for pointer in pointers if pointer.node_id not in existing
+            ]
+            if pointers:
+                vector_store.add(Settings.embed_model(pointers, show_progress=True))
+            added += len(pointers)
+            deleted += len(stale)
+            num_chunks += len(chunks)
+        print(
+            f"Questions: {added} added, {deleted} deleted, {num_chunks} chunks"
+        )
+        return added
@@ -1,13 +1,57 @@
 import os
+import numpy as np
 import torch
 
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.embeddings.huggingface.utils import format_query
 from llama_index.embeddings.openai import OpenAIEmbedding
 from transformers import AutoTokenizer
 
+from .http_client import get_http_client
 from ..settings import RAGSettings
 
 
+def truncate_embedding(embedding: Embedding, dim: int | None) -> Embedding:
+    """
+    Shortens a Matryoshka embedding to its first dim values, L2-normalized.
+
+    This is what text-embedding-3 models return for the `dimensions`
+    parameter.
+
+    Args:
+        embedding (Embedding): The full embedding.
+        dim (int | None): The dimension kept (None: all).
+
+    Returns:
+        Embedding: The shortened embedding.
+    """
+    if dim is None or dim >= len(embedding):
+        return embedding
+    vector = np.asarray(embedding[:dim], dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class TruncatedHuggingFaceEmbedding(HuggingFaceEmbedding):
+    """HuggingFace embedding shortened to truncate_dim dimensions (see truncate_embedding)."""
+
+    truncate_dim: int | None = Field(
+        default=None, description="Dimensions kept (None: all)."
+    )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TruncatedHuggingFaceEmbedding"
+
+    def _embed(self, sentences: list[str]) -> list[Embedding]:
+        return [
+            truncate_embedding(embedding, self.truncate_dim)
+            for embedding in super()._embed(sentences)
+        ]
+
+
 class LocalEmbeddingFactory:
     @staticmethod
     def set_embedding(setting: RAGSettings | None = None, **kwargs):
@@ -20,10 +64,15 @@ class LocalEmbeddingFactory:
                     "API key is required for the embedding model 'text-embedding-3-small'."
                 )
             return OpenAIEmbedding(
-                model=model_name, api_key=setting.INGESTION.EMBED_API_KEY
+                model=model_name,
+                dimensions=setting.INGESTION.EMBED_DIM,
+                api_key=setting.INGESTION.EMBED_API_KEY,
+                timeout=setting.OLLAMA.REQUEST_TIMEOUT,
+                max_retries=setting.OLLAMA.MAX_RETRIES,
+                http_client=get_http_client(setting, retries=False),
             )
 
-        return HuggingFaceEmbedding(
+        embed_model = TruncatedHuggingFaceEmbedding(
             model_name=model_name,
             tokenizer=AutoTokenizer.from_pretrained(
                 model_name, torch_dtype=torch.float16
@@ -34,3 +83,39 @@ class LocalEmbeddingFactory:
             trust_remote_code=True,
             embed_batch_size=setting.INGESTION.EMBED_BATCH_SIZE,
         )
+        embed_model.truncate_dim = setting.INGESTION.EMBED_DIM
+        return embed_model
+
+
+def get_query_embeddings(
+    embed_model: BaseEmbedding, queries: list[str]
+) -> list[Embedding]:
+    """
+    Embeds several queries with one batch call of the embedding model.
+
+    BaseEmbedding only embeds queries one by one. HuggingFace models get the
+    query instruction of the model prepended and run as one padded batch;
+    other models (text-embedding-3-small embeds queries and texts alike) go
+    through get_text_embedding_batch.
+
+    Args:
+        embed_model (BaseEmbedding): The embedding model.
+        queries (list[str]): The queries.
+
+    Returns:
+        list[Embedding]: One embedding per query.
+    """
+    if not queries:
+        return []
+    if len(queries) == 1:
+        return [embed_model.get_query_embedding(queries[0])]
+    if isinstance(embed_model, HuggingFaceEmbedding):
+        return embed_model._embed(
+            [
+                format_query(
+                    query, embed_model.model_name, embed_model.query_instruction
+                )
+                for query in queries
+            ]
+        )
+    return embed_model.get_text_embedding_batch(queries)
@@ -5,15 +5,33 @@ from llama_index.core.schema import (
     BaseNode,
 )
 from llama_index.core.llms.llm import LLM
-from llama_index.core.chat_engine import (
-    CondensePlusContextChatEngine,
-    SimpleChatEngine,
-)
-from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
 
+from .chat_engine import (
+    LocalCondensePlusContextChatEngine,
+    LocalSimpleChatEngine,
+)
+from .condense import QuestionCondenser
+from .memory import SummaryChatMemory
+from .model import LocalRAGModelFactory
 from .vector_store import LocalVectorStoreFactory
-from .prompts import CondensePrompt, ContextPrompt, SystemPrompt
+from .prompts import (
+    CondensePrompt,
+    ContextPrompt,
+    DocumentsPrompt,
+    InstructionPrompt,
+    SummaryPrompt,
+    SystemPrompt,
+)
 from .retriever import LocalRetrieverFactory
+from .postprocessor import ContextPackingPostprocessor
+from .rerank import CachedRerank
+from .tokens import (
+    get_chat_token_budget,
+    get_context_token_budget,
+    get_prompt_token_budget,
+)
 
 from ..settings import RAGSettings
 
@@ -36,33 +54,107 @@ class LocalChatEngineFactory:
             setting=self._setting
         ).check_exist_vector_store_index()
 
+    def get_node_postprocessors(self) -> list[BaseNodePostprocessor]:
+        node_postprocessors = []
+        if self._setting.RETRIEVER.USE_RERANK:
+            node_postprocessors.append(
+                CachedRerank(
+                    model=self._setting.RETRIEVER.RERANK_LLM,
+                    top_n=self._setting.RETRIEVER.TOP_K_RERANK,
+                    cache_size=self._setting.RETRIEVER.RERANK_CACHE_SIZE,
+                    verbose=True,
+                )
+            )
+            # Reranker scores decide how many nodes the LLM gets. They are
+            # cross-encoder logits, squashed into [0, 1] for the policy.
+            if self._setting.RETRIEVER.ADAPTIVE_DEPTH:
+                node_postprocessors.append(
+                    self.retriever_factory.get_adaptive_depth(
+                        self._setting.RETRIEVER.TOP_K_RERANK, normalize=True
+                    )
+                )
+        if self._setting.RETRIEVER.CONTEXT_PACKING:
+            node_postprocessors.append(
+                ContextPackingPostprocessor(
+                    token_budget=get_context_token_budget(self._setting),
+                    verbose=True,
+                )
+            )
+        return node_postprocessors
+
+    def get_condense_llm(self, llm: LLM) -> LLM:
+        if self._setting.OLLAMA.CONDENSE_LLM is None:
+            return llm
+        return LocalRAGModelFactory.set_model(
+            model_name=self._setting.OLLAMA.CONDENSE_LLM,
+            host=self.host,
+            setting=self._setting,
+        )
+
+    def get_condenser(self, llm: LLM, language: str = "eng") -> QuestionCondenser:
+        return QuestionCondenser(
+            llm=self.get_condense_llm(llm),
+            condense_prompt=PromptTemplate(CondensePrompt()(language=language)),
+            skip_standalone=self._setting.OLLAMA.SKIP_STANDALONE_CONDENSE,
+            verbose=True,
+        )
+
+    def get_memory(
+        self, llm: LLM, language: str = "eng", with_context: bool = False
+    ) -> SummaryChatMemory:
+        summary_llm = None
+        if self._setting.OLLAMA.SUMMARIZE_HISTORY:
+            summary_llm = self.get_condense_llm(llm)
+        # The QA engine counts the prompt and retrieved context against the
+        # memory limit, so its limit also holds the context budget.
+        token_limit = (
+            get_prompt_token_budget(self._setting)
+            if with_context
+            else get_chat_token_budget(self._setting)
+        )
+        return SummaryChatMemory(
+            token_limit=token_limit,
+            summary_llm=summary_llm,
+            summary_prompt=SummaryPrompt()(language=language),
+            summary_ratio=self._setting.OLLAMA.SUMMARY_TOKEN_RATIO,
+        )
+
     def set_engine(
         self,
         llm: LLM,
         nodes: list[BaseNode],
         language: str = "eng",
         chat_mode: Literal["QA", "chat"] = "QA",
-    ) -> CondensePlusContextChatEngine | SimpleChatEngine:
+        parent_nodes: list[BaseNode] | None = None,
+    ) -> LocalCondensePlusContextChatEngine | LocalSimpleChatEngine:
 
         # Normal chat engine
         if chat_mode == "chat":
-            return SimpleChatEngine.from_defaults(
+            return LocalSimpleChatEngine.from_defaults(
                 llm=llm,
-                memory=ChatMemoryBuffer(
-                    token_limit=self._setting.OLLAMA.CHAT_TOKEN_LIMIT
-                ),
+                memory=self.get_memory(llm=llm, language=language),
             )
 
         # Chat engine with documents
-        return CondensePlusContextChatEngine.from_defaults(
+        return LocalCondensePlusContextChatEngine.from_defaults(
             retriever=self.retriever_factory.get_retrievers(
-                llm=llm, nodes=nodes, language=language
+                llm=llm,
+                nodes=nodes,
+                language=language,
+                parent_nodes=parent_nodes,
             ),
             llm=llm,
-            memory=ChatMemoryBuffer(
-                token_limit=self._setting.OLLAMA.CHAT_TOKEN_LIMIT
+            memory=self.get_memory(
+                llm=llm, language=language, with_context=True
             ),
             system_prompt=SystemPrompt()(language=language),
             context_prompt=ContextPrompt()(language=language),
             condense_prompt=CondensePrompt()(language=language),
+            node_postprocessors=self.get_node_postprocessors(),
+            condenser=self.get_condenser(llm=llm, language=language),
+            speculative_retrieval=self._setting.RETRIEVER.SPECULATIVE_RETRIEVAL,
+            speculative_overlap=self._setting.RETRIEVER.SPECULATIVE_OVERLAP,
+            prefix_stable=self._setting.OLLAMA.PREFIX_STABLE_PROMPT,
+            instruction_prompt=InstructionPrompt()(language=language),
+            documents_prompt=DocumentsPrompt()(language=language),
         )
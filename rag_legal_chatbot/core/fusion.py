@@ -0,0 +1,128 @@
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Numbering and bullets LLMs put in front of generated queries.
+_QUERY_PREFIX = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s*")
+
+
+class QueryGenCache:
+    """
+    LRU cache of generated search queries keyed by (LLM model, prompt hash).
+
+    The prompt holds the question, the number of queries and the language of
+    the query generation template, so a repeated question reuses its queries
+    without calling the LLM.
+
+    Args:
+        max_size (int): Maximum number of cached questions (default: 1024).
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self._max_size = max_size
+        self._queries: OrderedDict[tuple[str, int], list[str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": len(self._queries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 3) if total else 0.0,
+            }
+
+    def get(self, key: tuple[str, int]) -> list[str] | None:
+        with self._lock:
+            queries = self._queries.get(key)
+            if queries is None:
+                self._misses += 1
+                return None
+            self._queries.move_to_end(key)
+            self._hits += 1
+            return list(queries)
+
+    def put(self, key: tuple[str, int], queries: list[str]) -> None:
+        with self._lock:
+            self._queries[key] = list(queries)
+            self._queries.move_to_end(key)
+            while len(self._queries) > self._max_size:
+                self._queries.popitem(last=False)
+
+
+_query_gen_cache: QueryGenCache | None = None
+_executors: dict[str, ThreadPoolExecutor] = {}
+_lock = threading.Lock()
+
+
+def get_query_gen_cache(max_size: int = 1024) -> QueryGenCache:
+    """
+    Returns the process-wide cache of generated queries.
+
+    Args:
+        max_size (int): Size used when the cache is created (default: 1024).
+
+    Returns:
+        QueryGenCache: The shared cache.
+    """
+    global _query_gen_cache
+    with _lock:
+        if _query_gen_cache is None:
+            _query_gen_cache = QueryGenCache(max_size)
+        return _query_gen_cache
+
+
+def get_search_executor(
+    max_workers: int = 8, name: str = "fusion"
+) -> ThreadPoolExecutor:
+    """
+    Returns a process-wide thread pool running concurrent searches.
+
+    Searches that wait for searches of their own (a fused sub-query fanning
+    out to shards) must use another pool than those, or a full pool would
+    wait for itself.
+
+    Args:
+        max_workers (int): Size used when the pool is created (default: 8).
+        name (str): Name of the pool (default: "fusion").
+
+    Returns:
+        ThreadPoolExecutor: The shared pool.
+    """
+    with _lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix=name
+            )
+        return _executors[name]
+
+
+def parse_queries(text: str, original_query: str, num_queries: int) -> list[str]:
+    """
+    Parses the queries generated one per line by the LLM.
+
+    Numbering is stripped, and duplicates and copies of the original query
+    are dropped, so every sub-query costs a distinct search.
+
+    Args:
+        text (str): The LLM response.
+        original_query (str): The query the others were generated from.
+        num_queries (int): Maximum number of queries returned.
+
+    Returns:
+        list[str]: The generated queries.
+    """
+    seen = {original_query.strip().casefold()}
+    queries = []
+    for line in text.split("\n"):
+        query = _QUERY_PREFIX.sub("", line).strip()
+        if not query or query.casefold() in seen:
+            continue
+        seen.add(query.casefold())
+        queries.append(query)
+    return queries[:num_queries]
@@ -0,0 +1,159 @@
+import asyncio
+import atexit
+import threading
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ..settings import RAGSettings
+
+_lock = threading.Lock()
+_session: requests.Session | None = None
+# Keyed by whether the transport retries failed connections.
+_clients: dict[bool, httpx.Client] = {}
+# An httpx.AsyncClient must not be shared between event loops.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_timeout(
+    read: float | None = None, setting: RAGSettings | None = None
+) -> httpx.Timeout:
+    """
+    Returns the timeout for a request.
+
+    Args:
+        read (float | None): Read timeout, OLLAMA.REQUEST_TIMEOUT if None (default: None).
+        setting (RAGSettings | None): The RAG settings (default: None).
+
+    Returns:
+        httpx.Timeout: The timeout, with OLLAMA.CONNECT_TIMEOUT for connecting.
+    """
+    setting = setting or RAGSettings()
+    return httpx.Timeout(
+        read or setting.OLLAMA.REQUEST_TIMEOUT,
+        connect=setting.OLLAMA.CONNECT_TIMEOUT,
+    )
+
+
+def _limits(setting: RAGSettings) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=setting.OLLAMA.MAX_CONNECTIONS,
+        max_keepalive_connections=setting.OLLAMA.MAX_CONNECTIONS,
+        keepalive_expiry=setting.OLLAMA.KEEPALIVE_EXPIRY,
+    )
+
+
+def get_session(setting: RAGSettings | None = None) -> requests.Session:
+    """
+    Returns the process-wide requests session.
+
+    Connections are kept alive in a pool and retried with exponential
+    backoff when they fail. 429 and 5xx responses are retried only for
+    idempotent methods: a POST may already have been processed, so it is
+    never resent after a response.
+
+    Args:
+        setting (RAGSettings | None): Settings used when the session is created (default: None).
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            setting = setting or RAGSettings()
+            retry = Retry(
+                total=setting.OLLAMA.MAX_RETRIES,
+                backoff_factor=setting.OLLAMA.RETRY_BACKOFF,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=setting.OLLAMA.MAX_CONNECTIONS,
+                pool_maxsize=setting.OLLAMA.MAX_CONNECTIONS,
+                max_retries=retry,
+            )
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def get_http_client(
+    setting: RAGSettings | None = None, retries: bool = True
+) -> httpx.Client:
+    """
+    Returns a process-wide httpx client used by the LLM and embedding clients.
+
+    The transport only retries connections that failed before the request
+    was sent. The OpenAI clients retry by themselves (max_retries), so they
+    take the client without transport retries and a failed request goes
+    through a single retry layer.
+
+    Args:
+        setting (RAGSettings | None): Settings used when the client is created (default: None).
+        retries (bool): Retry failed connections in the transport (default: True).
+
+    Returns:
+        httpx.Client: The shared client.
+    """
+    with _lock:
+        client = _clients.get(retries)
+        if client is None:
+            setting = setting or RAGSettings()
+            client = httpx.Client(
+                timeout=get_timeout(setting=setting),
+                transport=httpx.HTTPTransport(
+                    limits=_limits(setting),
+                    retries=setting.OLLAMA.MAX_RETRIES if retries else 0,
+                ),
+            )
+            _clients[retries] = client
+        return client
+
+
+def get_async_http_client(
+    setting: RAGSettings | None = None,
+) -> httpx.AsyncClient:
+    """
+    Returns the httpx async client of the running event loop.
+
+    Args:
+        setting (RAGSettings | None): Settings used when the client is created (default: None).
+
+    Returns:
+        httpx.AsyncClient: The client shared by all requests on this loop.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None or client.is_closed:
+            setting = setting or RAGSettings()
+            client = httpx.AsyncClient(
+                timeout=get_timeout(setting=setting),
+                transport=httpx.AsyncHTTPTransport(
+                    limits=_limits(setting),
+                    retries=setting.OLLAMA.MAX_RETRIES,
+                ),
+            )
+            _async_clients[loop] = client
+        return client
+
+
+@atexit.register
+def close_http_clients() -> None:
+    """Closes the shared session and clients."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
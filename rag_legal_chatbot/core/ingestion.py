@@ -7,19 +7,34 @@ from tqdm import tqdm
 
 from llama_index.core import Document, Settings
 from llama_index.core.schema import BaseNode
-from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.node_parser import (
+    NodeParser,
+    SentenceSplitter,
+    get_leaf_nodes,
+)
+
+from .jobs import IngestionJob
+from .metadata import LegalMetadataExtractor
+from .node_parser import LegalNodeParser
+from .tokens import set_token_count
+from .vector_store import LocalVectorStoreFactory
 
 from ..settings import RAGSettings
 
 load_dotenv()
 
+# Nodes embedded between progress updates and pause checks of a job.
+_JOB_EMBED_BATCH = 64
+
 
 class LocalDataIngestion:
     def __init__(self, setting: RAGSettings | None = None) -> None:
         self._node_store = {}
+        self._parent_store = {}
         self._input_files = []
         self._ingested_files = []
         self._setting = setting or RAGSettings()
+        self._metadata_extractor = LegalMetadataExtractor()
 
     def _filter_text(self, text):
         # Define the regex pattern.
@@ -44,51 +59,119 @@ class LocalDataIngestion:
 
         self._input_files = input_files
 
-    def store_nodes(
-        self,
-        embed_model: Any | None = None,
-    ) -> None:
-        self._ingested_files = []
-
-        if len(self._input_files) == 0:
-            return
+    def read_document(self, input_file: str) -> Document:
+        file_name = input_file.strip().split("/")[-1]
+        document = pymupdf.open(input_file)
+        all_text = ""
+
+        for _, page in enumerate(document):
+            page_text = page.get_text("text")
+            page_text = self._filter_text(page_text)
+            all_text += " " + page_text
+
+        return Document(
+            text=all_text.strip(),
+            metadata={
+                "file_name": file_name,
+            },
+        )
 
-        splitter = SentenceSplitter.from_defaults(
+    def get_node_parser(self, chunking_mode: str | None = None) -> NodeParser:
+        chunking_mode = chunking_mode or self._setting.INGESTION.CHUNKING_MODE
+        if chunking_mode == "legal":
+            return LegalNodeParser(
+                chunk_size=self._setting.INGESTION.CHILD_CHUNK_SIZE,
+                parent_chunk_size=self._setting.INGESTION.PARENT_CHUNK_SIZE,
+            )
+        return SentenceSplitter.from_defaults(
             chunk_size=self._setting.INGESTION.CHUNK_SIZE,
             chunk_overlap=self._setting.INGESTION.CHUCK_OVERLAP,
             paragraph_separator=self._setting.INGESTION.PARAGRAPH_SEP,
             secondary_chunking_regex=self._setting.INGESTION.CHUNKING_REGEX,
         )
 
-        Settings.embed_model = embed_model or Settings.embed_model
+    def _embed(
+        self, nodes: list[BaseNode], job: IngestionJob | None = None
+    ) -> list[BaseNode]:
+        if job is None:
+            return Settings.embed_model(nodes, show_progress=True)
+        job.add_nodes(len(nodes))
+        embedded = []
+        for start in range(0, len(nodes), _JOB_EMBED_BATCH):
+            job.checkpoint()
+            batch = Settings.embed_model(nodes[start : start + _JOB_EMBED_BATCH])
+            embedded.extend(batch)
+            job.embedded(len(batch))
+        return embedded
+
+    def _store_file(
+        self,
+        input_file: str,
+        splitter: NodeParser,
+        vector_store_factory: LocalVectorStoreFactory,
+        job: IngestionJob | None = None,
+    ) -> None:
+        file_name = input_file.strip().split("/")[-1]
 
-        for input_file in tqdm(self._input_files, desc="Ingesting data"):
-            file_name = input_file.strip().split("/")[-1]
+        if file_name in self._node_store:
             self._ingested_files.append(file_name)
+            return
 
-            if file_name in self._node_store:
-                continue
+        document = self.read_document(input_file)
 
-            document = pymupdf.open(input_file)
-            all_text = ""
+        nodes = splitter([document], show_progress=True)
 
-            for _, page in enumerate(document):
-                page_text = page.get_text("text")
-                page_text = self._filter_text(page_text)
-                all_text += " " + page_text
+        nodes = self._metadata_extractor(document.text, file_name, nodes)
+        for node in nodes:
+            set_token_count(node)
 
-            document = Document(
-                text=all_text.strip(),
-                metadata={
-                    "file_name": file_name,
-                },
-            )
+        # Only leaf nodes are embedded; parents are kept for expansion.
+        leaf_nodes = get_leaf_nodes(nodes)
+        if (
+            self._setting.STORAGE.SHARDING
+            and vector_store_factory.is_shard_current(file_name, leaf_nodes)
+        ):
+            # The shard of the file holds these chunks already.
+            return
+        self._ingested_files.append(file_name)
+        leaf_ids = {node.node_id for node in leaf_nodes}
+        self._parent_store[file_name] = [
+            node for node in nodes if node.node_id not in leaf_ids
+        ]
 
-            nodes = splitter([document], show_progress=True)
+        self._node_store[file_name] = self._embed(leaf_nodes, job)
 
-            nodes = Settings.embed_model(nodes, show_progress=True)
+    def store_nodes(
+        self,
+        embed_model: Any | None = None,
+        job: IngestionJob | None = None,
+    ) -> None:
+        """
+        Parses and embeds the input files.
+
+        Args:
+            embed_model (Any | None): Embedding model (default: Settings.embed_model).
+            job (IngestionJob | None): Background job reporting the progress and pausing between files and embedding batches (default: None).
+        """
+        self._ingested_files = []
+
+        if len(self._input_files) == 0:
+            return
 
-            self._node_store[file_name] = nodes
+        splitter = self.get_node_parser()
+
+        Settings.embed_model = embed_model or Settings.embed_model
+        vector_store_factory = LocalVectorStoreFactory(setting=self._setting)
+
+        if job is not None:
+            job.start_files(len(self._input_files))
+        for input_file in tqdm(self._input_files, desc="Ingesting data"):
+            if job is not None:
+                job.checkpoint()
+                job.start_file(input_file.strip().split("/")[-1])
+            self._store_file(input_file, splitter, vector_store_factory, job)
+            if job is not None:
+                job.finish_file()
 
     def get_ingested_nodes(self) -> list[BaseNode]:
         return_nodes = []
@@ -96,6 +179,12 @@ class LocalDataIngestion:
             return_nodes.extend(self._node_store[file_name])
         return return_nodes
 
+    def get_ingested_parent_nodes(self) -> list[BaseNode]:
+        return_nodes = []
+        for file_name in self._ingested_files:
+            return_nodes.extend(self._parent_store.get(file_name, []))
+        return return_nodes
+
     def get_all_nodes(self) -> list[BaseNode]:
         return_nodes = []
         for nodes in self._node_store.values():
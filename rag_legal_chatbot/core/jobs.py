@@ -0,0 +1,203 @@
+import queue
+import threading
+import time
+from typing import Callable
+
+
+class IngestionJob:
+    """
+    An ingestion job queued on the IngestionWorker, with its progress.
+
+    The job function reports the files it parses and the nodes it embeds,
+    and calls checkpoint() between steps, where the job waits while the
+    worker is paused.
+    """
+
+    def __init__(
+        self,
+        worker: "IngestionWorker",
+        name: str,
+        run: Callable[["IngestionJob"], None],
+    ) -> None:
+        self.worker = worker
+        self.name = name
+        self.run = run
+        self.status = "queued"
+        self.error: str | None = None
+        self.files_total = 0
+        self.files_done = 0
+        self.current_file: str | None = None
+        self.nodes_total = 0
+        self.nodes_embedded = 0
+        self._file_nodes = 0
+        self._file_embedded = 0
+        self._started: float | None = None
+        self._finished: float | None = None
+        self._paused_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def start_files(self, files_total: int) -> None:
+        with self._lock:
+            self.files_total = files_total
+
+    def start_file(self, file_name: str) -> None:
+        with self._lock:
+            self.current_file = file_name
+            self._file_nodes = self._file_embedded = 0
+
+    def add_nodes(self, num_nodes: int) -> None:
+        """Counts the nodes of the current file that will be embedded."""
+        with self._lock:
+            self.nodes_total += num_nodes
+            self._file_nodes += num_nodes
+
+    def embedded(self, num_nodes: int) -> None:
+        with self._lock:
+            self.nodes_embedded += num_nodes
+            self._file_embedded += num_nodes
+
+    def finish_file(self) -> None:
+        with self._lock:
+            self.files_done += 1
+            self.current_file = None
+            self._file_nodes = self._file_embedded = 0
+
+    def checkpoint(self) -> None:
+        """Blocks while the worker is paused."""
+        paused = self.worker.wait_resumed()
+        with self._lock:
+            self._paused_seconds += paused
+
+    def _elapsed(self) -> float:
+        if self._started is None:
+            return 0.0
+        end = self._finished or time.monotonic()
+        return end - self._started - self._paused_seconds
+
+    @property
+    def stats(self) -> dict:
+        """
+        Progress of the job.
+
+        The ETA extrapolates the time spent so far, without pauses, from
+        the finished files and the embedded share of the current one.
+
+        Returns:
+            dict: Status, files, nodes, elapsed and ETA seconds.
+        """
+        with self._lock:
+            status = self.status
+            if status == "running" and self.worker.paused:
+                status = "paused"
+            done = self.files_done
+            if self._file_nodes:
+                done += self._file_embedded / self._file_nodes
+            elapsed = self._elapsed()
+            eta = None
+            if status == "done":
+                eta = 0.0
+            elif self.files_total and done:
+                eta = round(elapsed * (self.files_total - done) / done, 1)
+            return {
+                "name": self.name,
+                "status": status,
+                "error": self.error,
+                "files_done": self.files_done,
+                "files_total": self.files_total,
+                "current_file": self.current_file,
+                "nodes_embedded": self.nodes_embedded,
+                "nodes_total": self.nodes_total,
+                "elapsed_seconds": round(elapsed, 1),
+                "eta_seconds": eta,
+            }
+
+    def _execute(self) -> None:
+        with self._lock:
+            self.status = "running"
+            self._started = time.monotonic()
+        try:
+            self.run(self)
+            status, error = "done", None
+        except Exception as e:
+            print(f"Error in ingestion job {self.name}: {e}")
+            status, error = "failed", str(e)
+        with self._lock:
+            self.status, self.error = status, error
+            self._finished = time.monotonic()
+
+
+class IngestionWorker:
+    """
+    Runs ingestion jobs one at a time on a background thread.
+
+    Jobs are queued by submit() and run in order, so startup and the UI
+    do not wait for parsing and embedding. pause() holds the running job
+    at its next checkpoint, between files or embedding batches, and
+    resume() lets it continue.
+    """
+
+    def __init__(self) -> None:
+        self._queue: queue.Queue[IngestionJob] = queue.Queue()
+        self._jobs: list[IngestionJob] = []
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def submit(
+        self, name: str, run: Callable[[IngestionJob], None]
+    ) -> IngestionJob:
+        """
+        Queues a job.
+
+        Args:
+            name (str): Name of the job.
+            run (Callable[[IngestionJob], None]): The job, reporting its progress on the IngestionJob.
+
+        Returns:
+            IngestionJob: The queued job.
+        """
+        job = IngestionJob(self, name, run)
+        with self._lock:
+            self._jobs.append(job)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="ingestion-worker", daemon=True
+                )
+                self._thread.start()
+        self._queue.put(job)
+        return job
+
+    def _run(self) -> None:
+        while True:
+            self._queue.get()._execute()
+
+    def pause(self) -> None:
+        self._resumed.clear()
+
+    def resume(self) -> None:
+        self._resumed.set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._resumed.is_set()
+
+    def wait_resumed(self) -> float:
+        """Waits until the worker is resumed, returns the seconds waited."""
+        if self._resumed.is_set():
+            return 0.0
+        started = time.monotonic()
+        self._resumed.wait()
+        return time.monotonic() - started
+
+    @property
+    def busy(self) -> bool:
+        """Whether a job is queued or running."""
+        with self._lock:
+            return any(job.status in ("queued", "running") for job in self._jobs)
+
+    @property
+    def jobs(self) -> list[dict]:
+        with self._lock:
+            jobs = list(self._jobs)
+        return [job.stats for job in jobs]
@@ -0,0 +1,367 @@
+import json
+import threading
+from typing import Any, AsyncIterator, Iterator, Sequence
+
+import httpx
+
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    MessageRole,
+)
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.llms.callbacks import (
+    llm_chat_callback,
+    llm_completion_callback,
+)
+from llama_index.core.llms.llm import LLM
+from llama_index.llms.ollama import Ollama
+from llama_index.llms.ollama.base import get_additional_kwargs
+
+from .http_client import get_async_http_client, get_http_client, get_timeout
+
+
+class LocalOllama(Ollama):
+    """
+    Ollama LLM sending its requests through the shared HTTP clients.
+
+    The upstream client opens a new connection for every request. This one
+    reuses the keep-alive pools of http_client, so rebuilding the model on a
+    language or mode change does not open new connections either.
+
+    Every request passes keep_alive, so Ollama keeps the model loaded for
+    that long after the request instead of its default five minutes.
+    """
+
+    keep_alive: str | None = Field(
+        default=None,
+        description="How long Ollama keeps the model loaded after a request.",
+    )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalOllama_llm"
+
+    @property
+    def _model_tag(self) -> str:
+        return self.model if ":" in self.model else f"{self.model}:latest"
+
+    def _with_keep_alive(self, payload: dict) -> dict:
+        if self.keep_alive is not None:
+            payload.setdefault("keep_alive", self.keep_alive)
+        return payload
+
+    def warm_up(self, base_url: str | None = None) -> bool:
+        """
+        Loads the model into memory without generating anything.
+
+        Args:
+            base_url (str | None): The Ollama host, base_url if None (default: None).
+
+        Returns:
+            bool: True if the model was loaded.
+        """
+        try:
+            self._post(
+                "/api/generate",
+                self._with_keep_alive({"model": self.model}),
+                base_url,
+            )
+            return True
+        except httpx.HTTPError as e:
+            print(f"Could not warm up {self.model}: {e}")
+            return False
+
+    def is_loaded(self, base_url: str | None = None) -> bool:
+        """
+        Whether Ollama currently holds the model in memory.
+
+        Args:
+            base_url (str | None): The Ollama host, base_url if None (default: None).
+
+        Returns:
+            bool: True if the model is listed by /api/ps.
+        """
+        try:
+            response = get_http_client().get(
+                f"{base_url or self.base_url}/api/ps", timeout=get_timeout(10)
+            )
+            response.raise_for_status()
+        except httpx.HTTPError:
+            return False
+        models = response.json().get("models") or []
+        return any(
+            self._model_tag in (model.get("name"), model.get("model"))
+            for model in models
+        )
+
+    def _chat_payload(
+        self, messages: Sequence[ChatMessage], stream: bool, **kwargs: Any
+    ) -> dict:
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": message.role.value,
+                    "content": message.content,
+                    **message.additional_kwargs,
+                }
+                for message in messages
+            ],
+            "options": self._model_kwargs,
+            "stream": stream,
+            **kwargs,
+        }
+        if self.json_mode:
+            payload["format"] = "json"
+        return self._with_keep_alive(payload)
+
+    def _generate_payload(self, prompt: str, stream: bool, **kwargs: Any) -> dict:
+        payload = {
+            self.prompt_key: prompt,
+            "model": self.model,
+            "options": self._model_kwargs,
+            "stream": stream,
+            **kwargs,
+        }
+        if self.json_mode:
+            payload["format"] = "json"
+        return self._with_keep_alive(payload)
+
+    def _post(
+        self, path: str, payload: dict, base_url: str | None = None
+    ) -> dict:
+        response = get_http_client().post(
+            url=f"{base_url or self.base_url}{path}",
+            json=payload,
+            timeout=get_timeout(self.request_timeout),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _apost(
+        self, path: str, payload: dict, base_url: str | None = None
+    ) -> dict:
+        response = await get_async_http_client().post(
+            url=f"{base_url or self.base_url}{path}",
+            json=payload,
+            timeout=get_timeout(self.request_timeout),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _stream(
+        self, path: str, payload: dict, base_url: str | None = None
+    ) -> Iterator[dict]:
+        with get_http_client().stream(
+            method="POST",
+            url=f"{base_url or self.base_url}{path}",
+            json=payload,
+            timeout=get_timeout(self.request_timeout),
+        ) as response:
+            response.raise_for_status()
+            # Reading to the end, rather than stopping at the "done" chunk,
+            # returns the connection to the pool.
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    async def _astream(
+        self, path: str, payload: dict, base_url: str | None = None
+    ) -> AsyncIterator[dict]:
+        async with get_async_http_client().stream(
+            method="POST",
+            url=f"{base_url or self.base_url}{path}",
+            json=payload,
+            timeout=get_timeout(self.request_timeout),
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+
+    @staticmethod
+    def _chat_response(
+        raw: dict, text: str | None = None, delta: str | None = None
+    ) -> ChatResponse:
+        message = raw["message"]
+        return ChatResponse(
+            message=ChatMessage(
+                content=message.get("content") if text is None else text,
+                role=MessageRole(message.get("role")),
+                additional_kwargs=get_additional_kwargs(
+                    message, ("content", "role")
+                ),
+            ),
+            delta=delta,
+            raw=raw,
+            additional_kwargs=get_additional_kwargs(raw, ("message",)),
+        )
+
+    @staticmethod
+    def _completion_response(
+        raw: dict, text: str | None = None, delta: str | None = None
+    ) -> CompletionResponse:
+        return CompletionResponse(
+            text=raw.get("response") if text is None else text,
+            delta=delta,
+            raw=raw,
+            additional_kwargs=get_additional_kwargs(raw, ("response",)),
+        )
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        raw = self._post("/api/chat", self._chat_payload(messages, False, **kwargs))
+        return self._chat_response(raw)
+
+    @llm_chat_callback()
+    async def achat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponse:
+        raw = await self._apost(
+            "/api/chat", self._chat_payload(messages, False, **kwargs)
+        )
+        return self._chat_response(raw)
+
+    @llm_chat_callback()
+    def stream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseGen:
+        payload = self._chat_payload(messages, True, **kwargs)
+        text = ""
+        for chunk in self._stream("/api/chat", payload):
+            delta = chunk["message"].get("content")
+            text += delta
+            yield self._chat_response(chunk, text=text, delta=delta)
+
+    @llm_chat_callback()
+    async def astream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseAsyncGen:
+        payload = self._chat_payload(messages, True, **kwargs)
+
+        async def gen() -> ChatResponseAsyncGen:
+            text = ""
+            async for chunk in self._astream("/api/chat", payload):
+                delta = chunk["message"].get("content")
+                text += delta
+                yield self._chat_response(chunk, text=text, delta=delta)
+
+        return gen()
+
+    @llm_completion_callback()
+    def complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        raw = self._post(
+            "/api/generate", self._generate_payload(prompt, False, **kwargs)
+        )
+        return self._completion_response(raw)
+
+    @llm_completion_callback()
+    async def acomplete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        raw = await self._apost(
+            "/api/generate", self._generate_payload(prompt, False, **kwargs)
+        )
+        return self._completion_response(raw)
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        payload = self._generate_payload(prompt, True, **kwargs)
+        text = ""
+        for chunk in self._stream("/api/generate", payload):
+            delta = chunk.get("response")
+            text += delta
+            yield self._completion_response(chunk, text=text, delta=delta)
+
+    @llm_completion_callback()
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        payload = self._generate_payload(prompt, True, **kwargs)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            text = ""
+            async for chunk in self._astream("/api/generate", payload):
+                delta = chunk.get("response")
+                text += delta
+                yield self._completion_response(chunk, text=text, delta=delta)
+
+        return gen()
+
+
+class ModelKeeper:
+    """
+    Keeps the answering Ollama model loaded in the background.
+
+    The watched model is warmed up as soon as it is set, so the first query
+    after startup or a model switch does not wait for a cold load, and then
+    refreshed every interval seconds so it survives idle periods. Models
+    served by an API, such as OpenAI, are always reported as warm.
+
+    Args:
+        interval (float): Seconds between refreshes, 0 to only warm up on a switch.
+    """
+
+    def __init__(self, interval: float = 600) -> None:
+        self._interval = interval
+        self._llm: LLM | None = None
+        self._loading = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def watch(self, llm: LLM) -> None:
+        """
+        Warms up a model in the background and keeps it loaded.
+
+        Args:
+            llm (LLM): The model answering the queries.
+        """
+        self._llm = llm
+        if not isinstance(llm, LocalOllama):
+            return
+        self._loading = True
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="model-keeper", daemon=True
+            )
+            self._thread.start()
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            llm = self._llm
+            if isinstance(llm, LocalOllama):
+                if llm.warm_up() and self._loading:
+                    print(f"Model {llm.model} is loaded.")
+                self._loading = False
+            self._wake.wait(self._interval or None)
+
+    def status(self) -> str:
+        """
+        Describes whether the model is loaded.
+
+        Returns:
+            str: "warm", "loading" or "cold".
+        """
+        if not isinstance(self._llm, LocalOllama):
+            return "warm"
+        if self._loading:
+            return "loading"
+        return "warm" if self._llm.is_loaded() else "cold"
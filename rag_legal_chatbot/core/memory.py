@@ -0,0 +1,222 @@
+import threading
+from typing import Any, Optional
+
+from llama_index.core.base.llms.generic_utils import messages_to_history_str
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.llms.llm import LLM
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.prompts import PromptTemplate
+
+from .prompts import SummaryPrompt
+from .tokens import count_tokens
+
+
+def _fingerprint(messages: list[ChatMessage]) -> int:
+    return hash(tuple((m.role, str(m.content)) for m in messages))
+
+
+class SummaryChatMemory(ChatMemoryBuffer):
+    """
+    Chat memory keeping recent turns verbatim and older ones as a summary.
+
+    While the history fits in what initial_token_count leaves of token_limit
+    it is returned as is. Otherwise the latest turns that fit in what the
+    summary leaves are kept and the older ones are folded into a rolling
+    summary by summary_llm, returned as one system message. The latest user
+    message is always kept, even when the prompt leaves no room. The summary
+    is cached and reused while the turns after it fit; it is then extended
+    with the turns that left the verbatim window, also when the history is
+    replaced with set() every turn as chat mode does. aget() summarizes
+    with acomplete(), so async engines do not block the event loop on it.
+    Token counts are cached by text hash in the shared token cache, so a
+    long history is not re-tokenized each turn. Without summary_llm, older
+    turns are dropped like in ChatMemoryBuffer.
+
+    Args:
+        token_limit (int): Tokens the history, with the prompt counted by get(), may use.
+        summary_llm (LLM | None): LLM writing the summary (default: None).
+        summary_prompt (str): Prompt with {summary} and {chat_history}.
+        summary_ratio (float): Share of the history budget kept for the summary (default: 0.25).
+    """
+
+    summary_llm: Optional[LLM] = Field(default=None, exclude=True)
+    summary_prompt: str = Field(default_factory=lambda: SummaryPrompt()("eng"))
+    summary_ratio: float = Field(default=0.25)
+
+    _lock: threading.Lock = PrivateAttr()
+    _summary: str = PrivateAttr(default="")
+    _summarized: int = PrivateAttr(default=0)
+    _summarized_fingerprint: int = PrivateAttr(default=0)
+    _summary_calls: int = PrivateAttr(default=0)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SummaryChatMemory"
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "summarized_messages": self._summarized,
+            "summary_calls": self._summary_calls,
+        }
+
+    def fork(self) -> "SummaryChatMemory":
+        """Returns an empty memory with the same settings."""
+        return self.__class__(
+            token_limit=self.token_limit,
+            tokenizer_fn=self.tokenizer_fn,
+            summary_llm=self.summary_llm,
+            summary_prompt=self.summary_prompt,
+            summary_ratio=self.summary_ratio,
+        )
+
+    def token_count(self, message: ChatMessage) -> int:
+        return count_tokens(str(message.content), self.tokenizer_fn)
+
+    def reset(self) -> None:
+        super().reset()
+        with self._lock:
+            self._summary = ""
+            self._summarized = 0
+            self._summarized_fingerprint = 0
+
+    def get(
+        self,
+        input: Optional[str] = None,
+        initial_token_count: int = 0,
+        **kwargs: Any,
+    ) -> list[ChatMessage]:
+        messages = self.get_all()
+        start, summarize = self._window(messages, initial_token_count)
+        if not summarize:
+            return messages[start:]
+        return self._with_summary(
+            messages[start:], self._summarize(messages[:start])
+        )
+
+    async def aget(
+        self,
+        input: Optional[str] = None,
+        initial_token_count: int = 0,
+        **kwargs: Any,
+    ) -> list[ChatMessage]:
+        """Async version of get(), summarizing with acomplete()."""
+        messages = self.get_all()
+        start, summarize = self._window(messages, initial_token_count)
+        if not summarize:
+            return messages[start:]
+        return self._with_summary(
+            messages[start:], await self._asummarize(messages[:start])
+        )
+
+    def _window(
+        self, messages: list[ChatMessage], initial_token_count: int
+    ) -> tuple[int, bool]:
+        """Start of the verbatim window, and whether older turns are summarized."""
+        counts = [self.token_count(message) for message in messages]
+        # A prompt and context over the limit leave no room for older turns,
+        # but the question being asked is always kept.
+        budget = max(0, self.token_limit - initial_token_count)
+        if sum(counts) <= budget:
+            return 0, False
+
+        if self.summary_llm is not None:
+            budget -= int(budget * self.summary_ratio)
+            # Keep the summary while the turns after it fit, then fold down
+            # to half the budget, so it is not rewritten on every turn.
+            with self._lock:
+                start = self._covered(messages)
+            if start and sum(counts[start:]) <= budget:
+                return start, True
+            budget //= 2
+        start = len(messages)
+        total = 0
+        while start > 0 and total + counts[start - 1] <= budget:
+            start -= 1
+            total += counts[start]
+        # The verbatim window starts with a user message.
+        while start < len(messages) and messages[start].role != MessageRole.USER:
+            start += 1
+        if start == len(messages):
+            start = next(
+                (
+                    index
+                    for index in range(len(messages) - 1, -1, -1)
+                    if messages[index].role == MessageRole.USER
+                ),
+                len(messages),
+            )
+        return start, self.summary_llm is not None and start > 0
+
+    def _covered(self, messages: list[ChatMessage]) -> int:
+        """Number of leading messages covered by the cached summary; holds the lock."""
+        if (
+            self._summarized
+            and len(messages) >= self._summarized
+            and _fingerprint(messages[: self._summarized])
+            == self._summarized_fingerprint
+        ):
+            return self._summarized
+        return 0
+
+    @staticmethod
+    def _with_summary(
+        recent: list[ChatMessage], summary: str
+    ) -> list[ChatMessage]:
+        if not summary:
+            return recent
+        return [ChatMessage(role=MessageRole.SYSTEM, content=summary)] + recent
+
+    def _summary_request(
+        self, older: list[ChatMessage]
+    ) -> tuple[str, str | None]:
+        """The cached summary of older, and the prompt extending it with the turns it misses."""
+        with self._lock:
+            summarized = self._covered(older)
+            summary = self._summary if summarized else ""
+        new = older[summarized:]
+        if not new:
+            return summary, None
+        return summary, PromptTemplate(self.summary_prompt).format(
+            summary=summary, chat_history=messages_to_history_str(new)
+        )
+
+    def _store_summary(self, older: list[ChatMessage], summary: str) -> None:
+        with self._lock:
+            self._summary_calls += 1
+            # A concurrent turn may have summarized a longer history.
+            if len(older) >= self._summarized:
+                self._summary = summary
+                self._summarized = len(older)
+                self._summarized_fingerprint = _fingerprint(older)
+
+    def _summarize(self, older: list[ChatMessage]) -> str:
+        # The lock only guards the cached summary; it is not held during
+        # the LLM call.
+        summary, prompt = self._summary_request(older)
+        if prompt is None:
+            return summary
+        try:
+            summary = self.summary_llm.complete(prompt).text.strip()
+        except Exception as e:
+            print(f"Error summarizing chat history: {e}")
+            return ""
+        self._store_summary(older, summary)
+        return summary
+
+    async def _asummarize(self, older: list[ChatMessage]) -> str:
+        summary, prompt = self._summary_request(older)
+        if prompt is None:
+            return summary
+        try:
+            summary = (await self.summary_llm.acomplete(prompt)).text.strip()
+        except Exception as e:
+            print(f"Error summarizing chat history: {e}")
+            return ""
+        self._store_summary(older, summary)
+        return summary
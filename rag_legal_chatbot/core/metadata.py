@@ -0,0 +1,240 @@
+import re
+import bisect
+
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
+
+
+# Keys used for filtering only; they are hidden from the embedding and LLM text.
+FILTER_METADATA_KEYS = [
+    "act_year",
+    "act_number",
+    "effective_date",
+    "section_from",
+    "section_to",
+]
+
+
+class LegalMetadataExtractor:
+    """
+    Extracts structured metadata from Czech legal documents.
+
+    The act number, year and effective date are parsed from the
+    `Sb_YYYY_NNN_YYYY-MM-DD_*.pdf` file names of the collection, and the
+    `§` headings of the text are used to find the range of sections covered
+    by each node.
+    """
+
+    FILE_NAME_PATTERN = re.compile(
+        r"Sb_(?P<year>\d{4})_(?P<number>\d+)(?:_(?P<date>\d{4}-\d{2}-\d{2}))?"
+    )
+    SECTION_PATTERN = re.compile(
+        r"^[ \t]*§[ \t]*(?P<number>\d+)(?P<suffix>[a-z]*)[ \t]*$", re.MULTILINE
+    )
+
+    def document_metadata(self, file_name: str) -> dict:
+        """
+        Parses the act metadata from a file name.
+
+        Args:
+            file_name (str): The file name, e.g. "Sb_1991_455_2024-01-01_IZ.pdf".
+
+        Returns:
+            dict: act_year, act_number, effective_date and law, if recognised.
+        """
+        match = self.FILE_NAME_PATTERN.search(file_name)
+        if match is None:
+            return {}
+        metadata = {
+            "act_year": int(match.group("year")),
+            "act_number": int(match.group("number")),
+            "law": f"{int(match.group('number'))}/{match.group('year')} Sb.",
+        }
+        if match.group("date"):
+            metadata["effective_date"] = match.group("date")
+        return metadata
+
+    def section_spans(self, text: str) -> list[tuple[int, int, str]]:
+        """
+        Finds the `§` headings of a document.
+
+        Args:
+            text (str): The document text.
+
+        Returns:
+            list[tuple[int, int, str]]: (offset, section number, label) of each heading.
+        """
+        return [
+            (
+                match.start(),
+                int(match.group("number")),
+                f"§ {match.group('number')}{match.group('suffix')}",
+            )
+            for match in self.SECTION_PATTERN.finditer(text)
+        ]
+
+    def node_metadata(
+        self,
+        spans: list[tuple[int, int, str]],
+        start: int | None,
+        end: int | None,
+    ) -> dict:
+        """
+        Returns the section range covered by the text between start and end.
+
+        Args:
+            spans (list[tuple[int, int, str]]): Output of `section_spans`.
+            start (int | None): Start offset of the node in the document.
+            end (int | None): End offset of the node in the document.
+
+        Returns:
+            dict: section, section_from and section_to, if any section is covered.
+        """
+        if not spans or start is None or end is None:
+            return {}
+        offsets = [offset for offset, _, _ in spans]
+        if end <= offsets[0]:
+            return {}
+        first = max(bisect.bisect_right(offsets, start) - 1, 0)
+        last = max(bisect.bisect_left(offsets, end) - 1, first)
+        numbers = [number for _, number, _ in spans[first : last + 1]]
+        return {
+            "section": spans[first][2],
+            "section_from": min(numbers),
+            "section_to": max(numbers),
+        }
+
+    def __call__(
+        self, text: str, file_name: str, nodes: list[BaseNode]
+    ) -> list[BaseNode]:
+        """
+        Adds act and section metadata to the nodes split from one document.
+
+        Args:
+            text (str): The document text the nodes were split from.
+            file_name (str): The document file name.
+            nodes (list[BaseNode]): The nodes.
+
+        Returns:
+            list[BaseNode]: The same nodes, annotated in place.
+        """
+        document_metadata = self.document_metadata(file_name)
+        spans = self.section_spans(text)
+        for node in nodes:
+            node.metadata.update(document_metadata)
+            node.metadata.update(
+                self.node_metadata(
+                    spans, node.start_char_idx, node.end_char_idx
+                )
+            )
+            for key in FILTER_METADATA_KEYS:
+                if key not in node.excluded_embed_metadata_keys:
+                    node.excluded_embed_metadata_keys.append(key)
+                if key not in node.excluded_llm_metadata_keys:
+                    node.excluded_llm_metadata_keys.append(key)
+        return nodes
+
+
+class LegalQueryParser:
+    """
+    Turns explicit references in a question into metadata filters.
+
+    Recognises act references such as "zákon č. 455/1991 Sb." or "455/1991"
+    and section references such as "§ 3" or "paragraf 3", so the vector
+    search only has to consider the matching act and section range. A
+    section number alone does not identify a provision across acts, so it
+    is only filtered on together with an act.
+    """
+
+    ACT_PATTERN = re.compile(
+        r"\b(?P<number>\d{1,4})\s*/\s*(?P<year>(?:18|19|20)\d{2})\b"
+    )
+    SECTION_PATTERN = re.compile(
+        r"(?:§|\bparagraf\w*|\bsection)\s*(?P<number>\d+)", re.IGNORECASE
+    )
+
+    def parse(self, query: str) -> dict:
+        """
+        Extracts the act and section referenced by a query.
+
+        Args:
+            query (str): The user question.
+
+        Returns:
+            dict: Any of act_number, act_year and section found in the query.
+        """
+        reference = {}
+        act = self.ACT_PATTERN.search(query)
+        if act is not None:
+            reference["act_number"] = int(act.group("number"))
+            reference["act_year"] = int(act.group("year"))
+        section = self.SECTION_PATTERN.search(query)
+        if section is not None:
+            reference["section"] = int(section.group("number"))
+        return reference
+
+    def to_metadata_filters(self, query: str) -> MetadataFilters | None:
+        """
+        Builds metadata filters for the references found in a query.
+
+        The section range is filtered only when the query also names the act;
+        a bare "§ 12" is left to the vector search.
+
+        Args:
+            query (str): The user question.
+
+        Returns:
+            MetadataFilters | None: The filters, or None if nothing was referenced.
+        """
+        reference = self.parse(query)
+        filters = []
+        if "act_number" in reference:
+            filters.append(
+                MetadataFilter(
+                    key="act_number",
+                    value=reference["act_number"],
+                    operator=FilterOperator.EQ,
+                )
+            )
+            filters.append(
+                MetadataFilter(
+                    key="act_year",
+                    value=reference["act_year"],
+                    operator=FilterOperator.EQ,
+                )
+            )
+            if "section" in reference:
+                filters.append(
+                    MetadataFilter(
+                        key="section_from",
+                        value=reference["section"],
+                        operator=FilterOperator.LTE,
+                    )
+                )
+                filters.append(
+                    MetadataFilter(
+                        key="section_to",
+                        value=reference["section"],
+                        operator=FilterOperator.GTE,
+                    )
+                )
+        if not filters:
+            return None
+        return MetadataFilters(filters=filters, condition=FilterCondition.AND)
+
+
+def cites(node, law: str | None, section: str | None) -> bool:
+    """Whether a node is from the expected law and covers the expected section."""
+    metadata = node.node.metadata
+    if law and metadata.get("file_name") != law:
+        return False
+    match = re.search(r"\d+", section or "")
+    if match is None or "section_from" not in metadata:
+        return True
+    number = int(match.group())
+    return metadata["section_from"] <= number <= metadata["section_to"]
@@ -1,8 +1,9 @@
-from llama_index.llms.ollama import Ollama
 from llama_index.llms.openai import OpenAI
 from dotenv import load_dotenv
-import requests
 
+from .http_client import get_http_client, get_session
+from .llm import LocalOllama
+from .router import RoutingOllama, get_base_url
 from ..settings import RAGSettings
 
 load_dotenv()
@@ -27,6 +28,9 @@ class LocalRAGModelFactory:
                 system_prompt=system_prompt,
                 temperature=setting.OLLAMA.TEMPERATURE,
                 api_key=setting.OLLAMA.API_KEY,
+                timeout=setting.OLLAMA.REQUEST_TIMEOUT,
+                max_retries=setting.OLLAMA.MAX_RETRIES,
+                http_client=get_http_client(setting, retries=False),
             )
         else:
             settings_kwargs = {
@@ -36,31 +40,53 @@ class LocalRAGModelFactory:
                 "repeat_last_n": setting.OLLAMA.REPEAT_LAST_N,
                 "repeat_penalty": setting.OLLAMA.REPEAT_PENALTY,
             }
-            return Ollama(
-                model=model_name,
-                system_prompt=system_prompt,
+            ollama_kwargs = {
+                "model": model_name,
+                "system_prompt": system_prompt,
+                "temperature": setting.OLLAMA.TEMPERATURE,
+                "context_window": setting.OLLAMA.CONTEXT_WINDOW,
+                "request_timeout": setting.OLLAMA.REQUEST_TIMEOUT,
+                "keep_alive": setting.OLLAMA.KEEP_ALIVE,
+                "additional_kwargs": settings_kwargs,
+            }
+            if setting.OLLAMA.HOSTS:
+                return RoutingOllama(
+                    base_urls=[
+                        get_base_url(h, setting.OLLAMA.PORT)
+                        for h in setting.OLLAMA.HOSTS
+                    ],
+                    health_check_interval=setting.OLLAMA.HEALTH_CHECK_INTERVAL,
+                    stall_timeout=setting.OLLAMA.STALL_TIMEOUT,
+                    **ollama_kwargs,
+                )
+            return LocalOllama(
                 base_url=f"http://{host}:{setting.OLLAMA.PORT}",
-                temperature=setting.OLLAMA.TEMPERATURE,
-                context_window=setting.OLLAMA.CONTEXT_WINDOW,
-                request_timeout=setting.OLLAMA.REQUEST_TIMEOUT,
-                additional_kwargs=settings_kwargs,
+                **ollama_kwargs,
             )
 
     @staticmethod
     def pull(host: str, model_name: str):
         setting = RAGSettings()
         payload = {"name": model_name}
-        return requests.post(
+        return get_session().post(
             f"http://{host}:{setting.OLLAMA.PORT}/api/pull",
             json=payload,
             stream=True,
+            timeout=(
+                setting.OLLAMA.CONNECT_TIMEOUT,
+                setting.OLLAMA.REQUEST_TIMEOUT,
+            ),
         )
 
     @staticmethod
     def check_model_exist(host: str, model_name: str) -> bool:
         setting = RAGSettings()
-        data = requests.get(
-            f"http://{host}:{setting.OLLAMA.PORT}/api/tags"
+        data = get_session().get(
+            f"http://{host}:{setting.OLLAMA.PORT}/api/tags",
+            timeout=(
+                setting.OLLAMA.CONNECT_TIMEOUT,
+                setting.OLLAMA.REQUEST_TIMEOUT,
+            ),
         ).json()
         if data["models"] is None:
             return False
@@ -0,0 +1,231 @@
+import re
+from typing import Any, Callable, Sequence
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.schema import (
+    BaseNode,
+    Document,
+    NodeRelationship,
+    TextNode,
+)
+from llama_index.core.utils import get_tokenizer, get_tqdm_iterable
+
+from .metadata import LegalMetadataExtractor
+
+from ..settings import RAGSettings
+
+
+class LegalNodeParser(NodeParser):
+    """
+    Splits Czech legal documents along their § / odstavec / písmeno structure.
+
+    Consecutive `§` sections that fit in `chunk_size` tokens are packed whole
+    into a single node. A longer section becomes a parent node whose text is
+    cut at odstavec markers ("(1)", "(2)", ...) and, for long odstavce, at
+    písmeno markers ("a)", "b)", ...) or line breaks; these units are packed
+    greedily into child nodes of at most `chunk_size` tokens without overlap,
+    so no node straddles a section boundary. Sections longer than
+    `parent_chunk_size` tokens are split into several parents along the same
+    units. Only the leaves are meant to be embedded; the parents are kept for
+    expanding retrieved children.
+
+    Args:
+        chunk_size (int | None): Maximum number of tokens in a child node (default: CHILD_CHUNK_SIZE).
+        parent_chunk_size (int | None): Maximum number of tokens in a parent node (default: PARENT_CHUNK_SIZE).
+    """
+
+    chunk_size: int = Field(
+        description="Maximum number of tokens in a child node.", gt=0
+    )
+    parent_chunk_size: int = Field(
+        description="Maximum number of tokens in a parent node.", gt=0
+    )
+
+    _tokenizer: Callable = PrivateAttr()
+
+    PARAGRAPH_PATTERN = re.compile(r"^[ \t]*\(\d+[a-z]?\)", re.MULTILINE)
+    LETTER_PATTERN = re.compile(r"^[ \t]*[a-z]\)", re.MULTILINE)
+    LINE_PATTERN = re.compile(r"^", re.MULTILINE)
+
+    def __init__(
+        self,
+        chunk_size: int | None = None,
+        parent_chunk_size: int | None = None,
+        tokenizer: Callable | None = None,
+        **kwargs: Any,
+    ) -> None:
+        setting = RAGSettings()
+        chunk_size = chunk_size or setting.INGESTION.CHILD_CHUNK_SIZE
+        parent_chunk_size = (
+            parent_chunk_size or setting.INGESTION.PARENT_CHUNK_SIZE
+        )
+        super().__init__(
+            chunk_size=chunk_size,
+            parent_chunk_size=parent_chunk_size,
+            include_prev_next_rel=False,
+            **kwargs,
+        )
+        self._tokenizer = tokenizer or get_tokenizer()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LegalNodeParser"
+
+    def _count_tokens(self, text: str) -> int:
+        return len(self._tokenizer(text))
+
+    @staticmethod
+    def _cut(
+        text: str, start: int, end: int, pattern: re.Pattern
+    ) -> list[tuple[int, int]]:
+        """Cuts text[start:end] before every match of pattern."""
+        cuts = [
+            start + match.start()
+            for match in pattern.finditer(text[start:end])
+            if match.start() > 0
+        ]
+        bounds = [start, *cuts, end]
+        return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+    def _units(
+        self, text: str, start: int, end: int
+    ) -> list[tuple[int, int]]:
+        """Splits a section into odstavce, long odstavce into písmena, then lines."""
+        units = []
+        for a, b in self._cut(text, start, end, self.PARAGRAPH_PATTERN):
+            if self._count_tokens(text[a:b]) <= self.chunk_size:
+                units.append((a, b))
+                continue
+            for c, d in self._cut(text, a, b, self.LETTER_PATTERN):
+                if self._count_tokens(text[c:d]) <= self.chunk_size:
+                    units.append((c, d))
+                else:
+                    units.extend(self._cut(text, c, d, self.LINE_PATTERN))
+        return units
+
+    def _pack(
+        self, text: str, units: list[tuple[int, int]], limit: int
+    ) -> list[tuple[int, int]]:
+        """Greedily merges consecutive units into spans of at most limit tokens."""
+        spans: list[tuple[int, int]] = []
+        tokens = 0
+        for a, b in units:
+            unit_tokens = self._count_tokens(text[a:b])
+            if spans and tokens + unit_tokens <= limit:
+                spans[-1] = (spans[-1][0], b)
+                tokens += unit_tokens
+            else:
+                spans.append((a, b))
+                tokens = unit_tokens
+        return spans
+
+    def _make_node(
+        self, document: BaseNode, text: str, start: int, end: int
+    ) -> TextNode | None:
+        chunk = text[start:end]
+        stripped = chunk.strip()
+        if not stripped:
+            return None
+        start += len(chunk) - len(chunk.lstrip())
+        node = TextNode(
+            text=stripped,
+            start_char_idx=start,
+            end_char_idx=start + len(stripped),
+            excluded_embed_metadata_keys=list(
+                document.excluded_embed_metadata_keys
+            ),
+            excluded_llm_metadata_keys=list(document.excluded_llm_metadata_keys),
+            metadata_seperator=document.metadata_seperator,
+            metadata_template=document.metadata_template,
+            text_template=document.text_template,
+            relationships={
+                NodeRelationship.SOURCE: document.as_related_node_info()
+            },
+        )
+        return node
+
+    def _section_nodes(
+        self, document: BaseNode, text: str, start: int, end: int
+    ) -> list[BaseNode]:
+        """Splits one long section into parent nodes and their children."""
+        nodes: list[BaseNode] = []
+        units = self._units(text, start, end)
+        for parent_start, parent_end in self._pack(
+            text, units, self.parent_chunk_size
+        ):
+            parent = self._make_node(document, text, parent_start, parent_end)
+            if parent is None:
+                continue
+            children = [
+                (a, b) for a, b in units if a >= parent_start and b <= parent_end
+            ]
+            child_nodes = []
+            for child_start, child_end in self._pack(
+                text, children, self.chunk_size
+            ):
+                child = self._make_node(document, text, child_start, child_end)
+                if child is None:
+                    continue
+                child.relationships[NodeRelationship.PARENT] = (
+                    parent.as_related_node_info()
+                )
+                child_nodes.append(child)
+            if len(child_nodes) > 1:
+                parent.relationships[NodeRelationship.CHILD] = [
+                    child.as_related_node_info() for child in child_nodes
+                ]
+                nodes.append(parent)
+                nodes.extend(child_nodes)
+            else:
+                nodes.append(parent)
+        return nodes
+
+    def _parse_document(self, document: BaseNode) -> list[BaseNode]:
+        text = document.get_content()
+        headings = [
+            match.start()
+            for match in LegalMetadataExtractor.SECTION_PATTERN.finditer(text)
+        ]
+        bounds = [0, *[h for h in headings if h > 0], len(text)]
+
+        nodes: list[BaseNode] = []
+        short_sections: list[tuple[int, int]] = []
+
+        def flush_short_sections() -> None:
+            for a, b in self._pack(text, short_sections, self.chunk_size):
+                node = self._make_node(document, text, a, b)
+                if node is not None:
+                    nodes.append(node)
+            short_sections.clear()
+
+        for start, end in zip(bounds, bounds[1:]):
+            if self._count_tokens(text[start:end]) <= self.chunk_size:
+                short_sections.append((start, end))
+                continue
+            flush_short_sections()
+            nodes.extend(self._section_nodes(document, text, start, end))
+        flush_short_sections()
+        return nodes
+
+    def _parse_nodes(
+        self,
+        nodes: Sequence[BaseNode],
+        show_progress: bool = False,
+        **kwargs: Any,
+    ) -> list[BaseNode]:
+        all_nodes: list[BaseNode] = []
+        for node in get_tqdm_iterable(nodes, show_progress, "Parsing nodes"):
+            all_nodes.extend(self._parse_document(node))
+        return all_nodes
+
+    def _postprocess_parsed_nodes(
+        self, nodes: list[BaseNode], parent_doc_map: dict[str, Document]
+    ) -> list[BaseNode]:
+        # Offsets are exact slices of the document, so only inherit metadata.
+        if self.include_metadata:
+            for node in nodes:
+                parent_doc = parent_doc_map.get(node.ref_doc_id, None)
+                if parent_doc is not None:
+                    node.metadata.update(parent_doc.metadata)
+        return nodes
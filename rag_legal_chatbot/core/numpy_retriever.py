@@ -0,0 +1,286 @@
+import operator
+
+import numpy as np
+
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.callbacks.base import CallbackManager
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import (
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+_NUMERIC_OPERATORS = {
+    FilterOperator.EQ: operator.eq,
+    FilterOperator.NE: operator.ne,
+    FilterOperator.GT: operator.gt,
+    FilterOperator.GTE: operator.ge,
+    FilterOperator.LT: operator.lt,
+    FilterOperator.LTE: operator.le,
+}
+
+
+class NumpyVectorRetriever(BaseRetriever):
+    """
+    An exact (brute-force) retriever that keeps every node vector in memory.
+
+    All embeddings are stored in one contiguous, L2-normalized float32 matrix,
+    so cosine similarity for a batch of queries is a single matrix product and
+    the top k is selected with `argpartition`. For collections of tens of
+    thousands of chunks this is both faster to load and more accurate than an
+    approximate HNSW search. Metadata filters are applied before the search,
+    on columns that are built once per metadata key.
+
+    Args:
+        nodes (list[BaseNode]): Nodes with embeddings to search over.
+        embed_model (BaseEmbedding | None): Model used to embed queries (default: Settings.embed_model).
+        similarity_top_k (int): Number of nodes to return per query (default: 10).
+        file_names (list[str] | None): Restrict every search to these files (default: None).
+        callback_manager (CallbackManager | None): Callback manager (default: None).
+        verbose (bool): Flag indicating whether to print verbose output (default: False).
+
+    Attributes:
+        _matrix (np.ndarray): Normalized embeddings with shape (num_nodes, dim).
+        _file_masks (dict[str, np.ndarray]): Precomputed row indices per file name.
+        _columns (dict[str, np.ndarray]): Cached metadata columns used by filters.
+    """
+
+    # Searches a list of queries with one retrieve_batch call.
+    batched = True
+
+    def __init__(
+        self,
+        nodes: list[BaseNode],
+        embed_model: BaseEmbedding | None = None,
+        similarity_top_k: int = 10,
+        file_names: list[str] | None = None,
+        callback_manager: CallbackManager | None = None,
+        verbose: bool = False,
+    ) -> None:
+        super().__init__(callback_manager=callback_manager, verbose=verbose)
+        self._nodes = [node for node in nodes if node.embedding is not None]
+        self._embed_model = embed_model or Settings.embed_model
+        self._similarity_top_k = similarity_top_k
+        self._file_names = file_names
+        self._matrix = self._normalize(
+            np.asarray(
+                [node.embedding for node in self._nodes], dtype=np.float32
+            )
+        )
+        self._file_masks = self._build_file_masks(self._nodes)
+        self._columns: dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_chroma_collection(
+        cls, collection, **kwargs
+    ) -> "NumpyVectorRetriever":
+        """
+        Loads all nodes and embeddings stored in a Chroma collection.
+
+        Args:
+            collection (chromadb.Collection): The Chroma collection.
+            **kwargs: Keyword arguments passed to the constructor.
+
+        Returns:
+            NumpyVectorRetriever: The retriever.
+        """
+        data = collection.get(
+            include=["embeddings", "documents", "metadatas"]
+        )
+        nodes = []
+        for text, metadata, embedding in zip(
+            data["documents"], data["metadatas"], data["embeddings"]
+        ):
+            node = metadata_dict_to_node(metadata)
+            node.set_content(text)
+            node.embedding = list(embedding)
+            nodes.append(node)
+        return cls(nodes=nodes, **kwargs)
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        if matrix.ndim != 2 or matrix.shape[0] == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+    @staticmethod
+    def _build_file_masks(nodes: list[BaseNode]) -> dict[str, np.ndarray]:
+        rows: dict[str, list[int]] = {}
+        for i, node in enumerate(nodes):
+            rows.setdefault(node.metadata.get("file_name"), []).append(i)
+        return {
+            file_name: np.asarray(indices, dtype=np.int64)
+            for file_name, indices in rows.items()
+        }
+
+    def _metadata_column(self, key: str) -> np.ndarray:
+        if key not in self._columns:
+            values = [node.metadata.get(key) for node in self._nodes]
+            if all(
+                value is None
+                or (
+                    isinstance(value, (int, float))
+                    and not isinstance(value, bool)
+                )
+                for value in values
+            ):
+                column = np.asarray(
+                    [np.nan if value is None else value for value in values],
+                    dtype=np.float64,
+                )
+            else:
+                column = np.asarray(values, dtype=object)
+            self._columns[key] = column
+        return self._columns[key]
+
+    def _filter_mask(self, filters: MetadataFilters) -> np.ndarray:
+        masks = []
+        for metadata_filter in filters.filters:
+            if isinstance(metadata_filter, MetadataFilters):
+                masks.append(self._filter_mask(metadata_filter))
+                continue
+            column = self._metadata_column(metadata_filter.key)
+            op = metadata_filter.operator
+            if op in (FilterOperator.IN, FilterOperator.NIN):
+                mask = np.isin(column, list(metadata_filter.value))
+                masks.append(mask if op == FilterOperator.IN else ~mask)
+            elif op in _NUMERIC_OPERATORS and (
+                column.dtype != object
+                or op in (FilterOperator.EQ, FilterOperator.NE)
+            ):
+                masks.append(
+                    np.asarray(
+                        _NUMERIC_OPERATORS[op](column, metadata_filter.value),
+                        dtype=bool,
+                    )
+                )
+            else:
+                raise ValueError(
+                    f"Filter operator {op} is not supported for '{metadata_filter.key}'."
+                )
+        if not masks:
+            return np.ones(len(self._nodes), dtype=bool)
+        if filters.condition == FilterCondition.OR:
+            return np.logical_or.reduce(masks)
+        return np.logical_and.reduce(masks)
+
+    def _candidate_rows(
+        self,
+        file_names: list[str] | None,
+        filters: MetadataFilters | None = None,
+    ) -> np.ndarray | None:
+        if file_names is None and filters is None:
+            return None
+        mask = np.ones(len(self._nodes), dtype=bool)
+        if file_names is not None:
+            mask[:] = False
+            for name in file_names:
+                if name in self._file_masks:
+                    mask[self._file_masks[name]] = True
+        if filters is not None:
+            mask &= self._filter_mask(filters)
+        return np.flatnonzero(mask)
+
+    def _embed_queries(self, query_bundles: list[QueryBundle]) -> np.ndarray:
+        embeddings = []
+        for query_bundle in query_bundles:
+            if query_bundle.embedding is None:
+                query_bundle.embedding = (
+                    self._embed_model.get_agg_embedding_from_queries(
+                        query_bundle.embedding_strs
+                    )
+                )
+            embeddings.append(query_bundle.embedding)
+        query_matrix = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        if self._matrix.size and query_matrix.shape[1] != self._matrix.shape[1]:
+            raise ValueError(
+                f"Query embeddings have {query_matrix.shape[1]} dimensions, "
+                f"the index has {self._matrix.shape[1]}."
+            )
+        return query_matrix
+
+    def search(
+        self,
+        query_matrix: np.ndarray,
+        top_k: int,
+        file_names: list[str] | None = None,
+        filters: MetadataFilters | None = None,
+    ) -> list[list[tuple[int, float]]]:
+        """
+        Finds the exact top k rows for each (normalized) query vector.
+
+        Args:
+            query_matrix (np.ndarray): Query vectors with shape (num_queries, dim).
+            top_k (int): Number of rows to return per query.
+            file_names (list[str] | None): Only consider nodes from these files (default: None).
+            filters (MetadataFilters | None): Only consider nodes matching these filters (default: None).
+
+        Returns:
+            list[list[tuple[int, float]]]: (row, cosine similarity) pairs per query, best first.
+        """
+        num_queries = query_matrix.shape[0]
+        rows = self._candidate_rows(file_names, filters)
+        matrix = self._matrix if rows is None else self._matrix[rows]
+        k = min(top_k, matrix.shape[0])
+        if k <= 0 or num_queries == 0:
+            return [[] for _ in range(num_queries)]
+
+        scores = query_matrix @ matrix.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        if rows is not None:
+            top = rows[top]
+
+        return [
+            list(zip(top[i].tolist(), top_scores[i].tolist()))
+            for i in range(num_queries)
+        ]
+
+    def retrieve_batch(
+        self,
+        queries: list[str | QueryBundle],
+        file_names: list[str] | None = None,
+        filters: MetadataFilters | None = None,
+    ) -> list[list[NodeWithScore]]:
+        """
+        Retrieves nodes for several queries with a single matrix product.
+
+        Args:
+            queries (list[str | QueryBundle]): Queries, e.g. generated fusion sub-queries.
+            file_names (list[str] | None): Only consider nodes from these files (default: the retriever's filter).
+            filters (MetadataFilters | None): Only consider nodes matching these filters (default: None).
+
+        Returns:
+            list[list[NodeWithScore]]: Retrieved nodes for each query.
+        """
+        query_bundles = [
+            QueryBundle(query) if isinstance(query, str) else query
+            for query in queries
+        ]
+        hits = self.search(
+            self._embed_queries(query_bundles),
+            top_k=self._similarity_top_k,
+            file_names=(
+                file_names if file_names is not None else self._file_names
+            ),
+            filters=filters,
+        )
+        return [
+            [
+                NodeWithScore(node=self._nodes[row], score=score)
+                for row, score in query_hits
+            ]
+            for query_hits in hits
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return self.retrieve_batch([query_bundle])[0]
@@ -0,0 +1,291 @@
+import math
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import (
+    BaseNode,
+    NodeWithScore,
+    QueryBundle,
+    TextNode,
+)
+
+from .tokens import TOKEN_COUNT_KEY, node_token_count
+
+
+def can_merge(first: BaseNode, second: BaseNode, max_gap: int = 2) -> bool:
+    """
+    Whether two spans of the same file overlap or follow each other.
+
+    Args:
+        first (BaseNode): The span that starts first.
+        second (BaseNode): The span that starts second.
+        max_gap (int): Maximum number of characters between adjacent spans.
+
+    Returns:
+        bool: True if the spans can be merged into one.
+    """
+    return (
+        first.metadata.get("file_name") == second.metadata.get("file_name")
+        and first.end_char_idx is not None
+        and second.start_char_idx is not None
+        and second.end_char_idx is not None
+        and second.start_char_idx - first.end_char_idx <= max_gap
+    )
+
+
+def merge_nodes(first: BaseNode, second: BaseNode) -> BaseNode:
+    """
+    Merges two overlapping or adjacent spans of the same file.
+
+    Both nodes must hold the exact document text between their start and end
+    offsets, as produced by the node parsers of this package.
+
+    Args:
+        first (BaseNode): The span that starts first.
+        second (BaseNode): The span that starts second.
+
+    Returns:
+        BaseNode: A node covering both spans.
+    """
+    if second.end_char_idx <= first.end_char_idx:
+        return first
+    overlap = first.end_char_idx - second.start_char_idx
+    if overlap >= 0:
+        text = first.get_content() + second.get_content()[overlap:]
+    else:
+        text = first.get_content() + "\n" + second.get_content()
+
+    metadata = dict(first.metadata)
+    # The count of the first span does not hold for the merged text.
+    metadata.pop(TOKEN_COUNT_KEY, None)
+    for key, pick in [("section_from", min), ("section_to", max)]:
+        values = [
+            node.metadata[key] for node in (first, second) if key in node.metadata
+        ]
+        if values:
+            metadata[key] = pick(values)
+
+    return TextNode(
+        id_=first.node_id,
+        text=text,
+        metadata=metadata,
+        start_char_idx=first.start_char_idx,
+        end_char_idx=second.end_char_idx,
+        excluded_embed_metadata_keys=first.excluded_embed_metadata_keys,
+        excluded_llm_metadata_keys=first.excluded_llm_metadata_keys,
+        relationships=first.relationships,
+    )
+
+
+class ContextPackingPostprocessor(BaseNodePostprocessor):
+    """
+    Packs retrieved nodes into a fixed token budget before prompting.
+
+    Nodes with the same id are deduplicated, overlapping or adjacent chunks of
+    the same file (such as the 200-token overlaps of the sentence splitter)
+    are merged into a single span, and the spans are then added greedily by
+    score until the budget is used up. A merged span that does not fit is
+    replaced by those of its chunks that do. The tokens saved are reported
+    for every query.
+
+    Args:
+        token_budget (int): Maximum number of tokens of packed context.
+        verbose (bool): Print the tokens saved for every query.
+    """
+
+    token_budget: int = Field(description="Maximum number of context tokens.")
+    verbose: bool = Field(default=False, description="Print token savings.")
+
+    _num_queries: int = PrivateAttr(default=0)
+    _input_tokens: int = PrivateAttr(default=0)
+    _output_tokens: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPackingPostprocessor"
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "queries": self._num_queries,
+            "input_tokens": self._input_tokens,
+            "output_tokens": self._output_tokens,
+            "saved_tokens": self._input_tokens - self._output_tokens,
+        }
+
+    @staticmethod
+    def _tokens(node: BaseNode) -> int:
+        return node_token_count(node)
+
+    def _postprocess_nodes(
+        self,
+        nodes: list[NodeWithScore],
+        query_bundle: QueryBundle | None = None,
+    ) -> list[NodeWithScore]:
+        input_tokens = sum(self._tokens(node.node) for node in nodes)
+
+        unique: dict[str, NodeWithScore] = {}
+        for node in nodes:
+            if node.node.node_id not in unique:
+                unique[node.node.node_id] = node
+
+        # Each span keeps the chunks it was merged from.
+        spans: list[tuple[NodeWithScore, list[NodeWithScore]]] = []
+        for node in sorted(
+            unique.values(),
+            key=lambda n: (
+                n.node.metadata.get("file_name") or "",
+                n.node.start_char_idx or 0,
+            ),
+        ):
+            if spans and can_merge(spans[-1][0].node, node.node):
+                span, parts = spans[-1]
+                spans[-1] = (
+                    NodeWithScore(
+                        node=merge_nodes(span.node, node.node),
+                        score=max(span.score or 0.0, node.score or 0.0),
+                    ),
+                    parts + [node],
+                )
+            else:
+                spans.append((node, [node]))
+
+        packed: list[NodeWithScore] = []
+        remaining = self.token_budget
+        for span, parts in sorted(
+            spans, key=lambda s: s[0].score or 0.0, reverse=True
+        ):
+            candidates = [span]
+            if self._tokens(span.node) > remaining and len(parts) > 1:
+                candidates = sorted(
+                    parts, key=lambda n: n.score or 0.0, reverse=True
+                )
+            for candidate in candidates:
+                tokens = self._tokens(candidate.node)
+                if tokens <= remaining:
+                    packed.append(candidate)
+                    remaining -= tokens
+        output_tokens = self.token_budget - remaining
+
+        self._num_queries += 1
+        self._input_tokens += input_tokens
+        self._output_tokens += output_tokens
+        if self.verbose:
+            print(
+                f"Context packing: {len(nodes)} -> {len(packed)} nodes, "
+                f"{input_tokens} -> {output_tokens} tokens "
+                f"({input_tokens - output_tokens} saved)"
+            )
+        return packed
+
+
+def _sigmoid(score: float) -> float:
+    if score >= 0:
+        return 1.0 / (1.0 + math.exp(-score))
+    return math.exp(score) / (1.0 + math.exp(score))
+
+
+def adaptive_depth(
+    scores: list[float],
+    min_k: int,
+    max_k: int,
+    max_drop: float = 0.15,
+    min_gap: float = 0.08,
+) -> int:
+    """
+    Decides how many of the best nodes are worth keeping from their scores.
+
+    The nodes are cut before the first one, past min_k, that scores more
+    than max_drop below the best score, or that falls more than min_gap
+    below the previous node. Both are relative to the best score and
+    expect scores within [0, 1]: cosine similarities as they are, reranker
+    logits once squashed by a sigmoid (see AdaptiveDepthPostprocessor). A
+    clear top hit, such as an exact match on the cited section, keeps only
+    min_k.
+
+    Args:
+        scores (list[float]): The scores, best first.
+        min_k (int): Minimum number of nodes kept.
+        max_k (int): Maximum number of nodes kept.
+        max_drop (float): Largest drop from the best score (default: 0.15).
+        min_gap (float): Gap between neighbours that cuts the list (default: 0.08).
+
+    Returns:
+        int: The number of nodes to keep.
+    """
+    depth = min(len(scores), max_k)
+    if depth <= min_k:
+        return depth
+    scale = abs(scores[0]) or 1.0
+    for i in range(max(min_k, 1), depth):
+        if (scores[0] - scores[i]) / scale > max_drop:
+            return i
+        if (scores[i - 1] - scores[i]) / scale > min_gap:
+            return i
+    return depth
+
+
+class AdaptiveDepthPostprocessor(BaseNodePostprocessor):
+    """
+    Keeps as many nodes as their score distribution justifies.
+
+    See adaptive_depth for the policy. Cross-encoder scores are unbounded
+    logits, often negative, so with normalize the policy sees their sigmoid
+    instead; the nodes keep their scores. The mean depth is reported for
+    every query.
+
+    Args:
+        min_k (int): Minimum number of nodes kept.
+        max_k (int): Maximum number of nodes kept.
+        max_drop (float): Largest relative drop from the best score.
+        min_gap (float): Relative gap between neighbours that cuts the list.
+        normalize (bool): Apply a sigmoid to the scores first (reranker logits).
+        verbose (bool): Print the depth of every query.
+    """
+
+    min_k: int = Field(default=2, description="Minimum number of nodes.")
+    max_k: int = Field(default=10, description="Maximum number of nodes.")
+    max_drop: float = Field(default=0.15, description="Largest score drop.")
+    min_gap: float = Field(default=0.08, description="Cutting score gap.")
+    normalize: bool = Field(default=False, description="Sigmoid of the scores.")
+    verbose: bool = Field(default=False, description="Print the depth.")
+
+    _num_queries: int = PrivateAttr(default=0)
+    _total_depth: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "AdaptiveDepthPostprocessor"
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "queries": self._num_queries,
+            "mean_depth": (
+                round(self._total_depth / self._num_queries, 2)
+                if self._num_queries
+                else 0.0
+            ),
+        }
+
+    def _postprocess_nodes(
+        self,
+        nodes: list[NodeWithScore],
+        query_bundle: QueryBundle | None = None,
+    ) -> list[NodeWithScore]:
+        nodes = sorted(nodes, key=lambda n: n.score or 0.0, reverse=True)
+        scores = [node.score or 0.0 for node in nodes]
+        if self.normalize:
+            scores = [_sigmoid(score) for score in scores]
+        depth = adaptive_depth(
+            scores,
+            self.min_k,
+            self.max_k,
+            self.max_drop,
+            self.min_gap,
+        )
+        self._num_queries += 1
+        self._total_depth += depth
+        if self.verbose:
+            print(f"Adaptive depth: {len(nodes)} -> {depth} nodes")
+        return nodes[:depth]
@@ -0,0 +1,159 @@
+import threading
+from typing import Any, Sequence
+
+from llama_index.core.base.llms.types import (
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+)
+from llama_index.core.llms import ChatMessage
+from llama_index.core.llms.llm import LLM
+from llama_index.llms.openai import OpenAI
+
+from .tokens import count_tokens
+
+
+class PromptCacheStats:
+    """
+    Counts prompt tokens served from the prompt cache of the LLM.
+
+    OpenAI reports the cached tokens of a prompt, counted under "reported".
+    Ollama only reports the prompt tokens it evaluated, which exclude the
+    prefix it reused from its KV cache. Its cached tokens are estimated as
+    the prompt tokens counted here with tiktoken minus the evaluated ones,
+    clamped at 0, and counted apart under "estimated": the two tokenizers
+    differ, so the figure only shows whether the prefix is being reused.
+
+    Args:
+        verbose (bool): Print the cached tokens of every request (default: True).
+    """
+
+    def __init__(self, verbose: bool = True) -> None:
+        self._verbose = verbose
+        self._lock = threading.Lock()
+        self._counts = {
+            kind: {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+            for kind in ("reported", "estimated")
+        }
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                kind: {
+                    **counts,
+                    "cached_ratio": (
+                        round(counts["cached_tokens"] / counts["prompt_tokens"], 3)
+                        if counts["prompt_tokens"]
+                        else 0.0
+                    ),
+                }
+                for kind, counts in self._counts.items()
+            }
+
+    def record(
+        self, prompt_tokens: int, cached_tokens: int, estimated: bool = False
+    ) -> None:
+        """
+        Records the prompt tokens of a request and those read from the cache.
+
+        Args:
+            prompt_tokens (int): Prompt tokens of the request.
+            cached_tokens (int): Prompt tokens served from the cache.
+            estimated (bool): Whether cached_tokens is an estimate (default: False).
+        """
+        cached_tokens = max(0, min(cached_tokens, prompt_tokens))
+        with self._lock:
+            counts = self._counts["estimated" if estimated else "reported"]
+            counts["requests"] += 1
+            counts["prompt_tokens"] += prompt_tokens
+            counts["cached_tokens"] += cached_tokens
+        if self._verbose:
+            approx = "~" if estimated else ""
+            print(
+                f"Prompt cache: {approx}{cached_tokens}/{prompt_tokens} "
+                "prompt tokens cached"
+            )
+
+
+_prompt_cache_stats = PromptCacheStats()
+
+
+def get_prompt_cache_stats() -> PromptCacheStats:
+    return _prompt_cache_stats
+
+
+def usage_kwargs(llm: LLM) -> dict:
+    """Keyword arguments making stream_chat of the LLM report token usage."""
+    if isinstance(llm, OpenAI):
+        return {"stream_options": {"include_usage": True}}
+    return {}
+
+
+def _field(value: Any, name: str) -> Any:
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
+
+
+def _record_usage(chat: ChatResponse, messages: Sequence[ChatMessage]) -> bool:
+    raw = chat.raw
+    # OpenAI: the last chunk holds the usage and no choices.
+    usage = _field(raw, "usage")
+    if usage is not None:
+        details = _field(usage, "prompt_tokens_details")
+        _prompt_cache_stats.record(
+            _field(usage, "prompt_tokens") or 0,
+            _field(details, "cached_tokens") or 0,
+        )
+        return True
+    # Ollama: the last chunk holds the prompt_eval_count.
+    if isinstance(raw, dict) and raw.get("done") and "prompt_eval_count" in raw:
+        prompt_tokens = sum(
+            count_tokens(str(message.content)) for message in messages
+        )
+        prompt_tokens = max(prompt_tokens, raw["prompt_eval_count"])
+        _prompt_cache_stats.record(
+            prompt_tokens,
+            prompt_tokens - raw["prompt_eval_count"],
+            estimated=True,
+        )
+        return True
+    return False
+
+
+def track_prompt_cache(
+    stream: ChatResponseGen, messages: Sequence[ChatMessage]
+) -> ChatResponseGen:
+    """
+    Passes a chat stream through, recording the prompt cache usage it reports.
+
+    Args:
+        stream (ChatResponseGen): The LLM chat stream.
+        messages (Sequence[ChatMessage]): The prompt of the stream.
+
+    Returns:
+        ChatResponseGen: The same chunks.
+    """
+    try:
+        recorded = False
+        for chat in stream:
+            if not recorded:
+                recorded = _record_usage(chat, messages)
+            yield chat
+    finally:
+        stream.close()
+
+
+async def atrack_prompt_cache(
+    stream: ChatResponseAsyncGen, messages: Sequence[ChatMessage]
+) -> ChatResponseAsyncGen:
+    """Async version of track_prompt_cache."""
+    try:
+        recorded = False
+        async for chat in stream:
+            if not recorded:
+                recorded = _record_usage(chat, messages)
+            yield chat
+    finally:
+        await stream.aclose()
@@ -36,6 +36,55 @@ Instrukce: Na základě výše uvedených dokumentů poskytněte podrobnou odpov
 Odpovězte 'nevím', pokud to není uvedeno v dokumentu."""
 
 
+class InstructionPrompt:
+
+    def __call__(self, language: str) -> str:
+        if language == "vi":
+            return INSTRUCTION_PROMPT_VI
+        elif language == "cs":
+            return INSTRUCTION_PROMPT_CS
+        return INSTRUCTION_PROMPT_EN
+
+
+INSTRUCTION_PROMPT_VI = """\
+Hướng dẫn: Dựa trên các tài liệu được cung cấp dưới đây, cung cấp một câu trả lời chi tiết cho câu hỏi cuối cùng của người dùng. \
+Trả lời 'không biết' nếu không có trong tài liệu."""
+
+INSTRUCTION_PROMPT_EN = """\
+Instruction: Based on the documents given below, provide a detailed answer for the last user question. \
+Answer 'don't know' if not present in the documents."""
+
+INSTRUCTION_PROMPT_CS = """\
+Instrukce: Na základě níže uvedených dokumentů poskytněte podrobnou odpověď na poslední otázku uživatele. \
+Odpovězte 'nevím', pokud to není uvedeno v dokumentech."""
+
+
+class DocumentsPrompt:
+
+    def __call__(self, language: str) -> str:
+        if language == "vi":
+            return DOCUMENTS_PROMPT_VI
+        elif language == "cs":
+            return DOCUMENTS_PROMPT_CS
+        return DOCUMENTS_PROMPT_EN
+
+
+DOCUMENTS_PROMPT_VI = """\
+Dưới đây là các tài liệu liên quan cho ngữ cảnh:
+
+{context_str}"""
+
+DOCUMENTS_PROMPT_EN = """\
+Here are the relevant documents for the context:
+
+{context_str}"""
+
+DOCUMENTS_PROMPT_CS = """\
+Zde jsou relevantní dokumenty pro kontext:
+
+{context_str}"""
+
+
 class CondensePrompt:
 
     def __call__(self, language: str) -> str:
@@ -192,3 +241,115 @@ SINGLE_SELECT_PROMPT_CS = (
     "Pouze na základě výše uvedených možností a nikoli na základě předchozích znalostí, vyberte "
     "JEDNU A JEDINOU možnost, která je nejrelevantnější k dotazu: '{query_str}'\n"
 )
+
+
+class SummaryPrompt:
+
+    def __call__(self, language: str) -> str:
+        if language == "vi":
+            return SUMMARY_PROMPT_VI
+        elif language == "cs":
+            return SUMMARY_PROMPT_CS
+        return SUMMARY_PROMPT_EN
+
+
+SUMMARY_PROMPT_EN = """\
+Progressively summarize the conversation between a user and an AI assistant, \
+adding to the previous summary. Keep the laws, sections and facts discussed.
+
+Previous Summary:
+{summary}
+
+New Lines of Conversation:
+{chat_history}
+
+New Summary:\
+"""
+
+SUMMARY_PROMPT_VI = """\
+Tóm tắt dần cuộc trò chuyện giữa một người dùng và một trợ lí trí tuệ nhân tạo, \
+bổ sung vào bản tóm tắt trước. Giữ lại các luật, điều khoản và sự kiện đã được thảo luận.
+
+Tóm tắt Trước:
+{summary}
+
+Các Dòng Trò chuyện Mới:
+{chat_history}
+
+Tóm tắt Mới:\
+"""
+
+SUMMARY_PROMPT_CS = """\
+Postupně shrňte rozhovor mezi uživatelem a AI asistentem \
+a doplňte předchozí shrnutí. Zachovejte zmíněné zákony, paragrafy a fakta.
+
+Předchozí shrnutí:
+{summary}
+
+Nové řádky rozhovoru:
+{chat_history}
+
+Nové shrnutí:\
+"""
+
+
+class QuestionGenPrompt:
+
+    def __call__(self, language: str) -> str:
+        if language == "vi":
+            return QUESTION_GEN_PROMPT_VI
+        elif language == "cs":
+            return QUESTION_GEN_PROMPT_CS
+        return QUESTION_GEN_PROMPT_EN
+
+
+QUESTION_GEN_PROMPT_EN = """\
+As a legal professor, your task is to write {num_questions} diverse questions \
+that people without legal training would ask and that the provided text from \
+the document answers.
+
+Name of the pdf: {pdf_name}
+
+Content: {law_content}
+
+Guidelines:
+
+Formulate the questions in English, in everyday words rather than the wording of the law.
+Use only the provided text.
+Do not mention the section in the question.
+Return one question per line and nothing else.
+"""
+
+QUESTION_GEN_PROMPT_VI = """\
+Là một giáo sư luật, nhiệm vụ của bạn là viết {num_questions} câu hỏi đa dạng \
+mà người không có chuyên môn pháp lý sẽ hỏi và được trả lời bởi đoạn văn bản \
+được cung cấp từ tài liệu.
+
+Tên của pdf: {pdf_name}
+
+Nội dung: {law_content}
+
+Hướng dẫn:
+
+Đặt câu hỏi bằng tiếng Việt, dùng từ ngữ đời thường thay vì cách diễn đạt của luật.
+Chỉ sử dụng văn bản được cung cấp.
+Không nhắc đến điều khoản trong câu hỏi.
+Trả về mỗi câu hỏi trên một dòng và không có gì khác.
+"""
+
+QUESTION_GEN_PROMPT_CS = """\
+Jako profesor práva máte za úkol napsat {num_questions} různorodých otázek, \
+které by položili lidé bez právního vzdělání a na které odpovídá poskytnutý \
+text z dokumentu.
+
+Název pdf: {pdf_name}
+
+Obsah: {law_content}
+
+Pokyny:
+
+Otázky formulujte česky, běžnými slovy místo formulací zákona.
+Použijte pouze poskytnutý text.
+V otázce nezmiňujte paragraf.
+Vraťte každou otázku na samostatném řádku a nic jiného.
+"""
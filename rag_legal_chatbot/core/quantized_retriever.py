@@ -0,0 +1,221 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.callbacks.base import CallbackManager
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import MetadataFilters
+
+from .numpy_retriever import NumpyVectorRetriever
+
+QUANTIZATIONS = ("int8", "binary")
+
+# Number of set bits of every byte value.
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(
+    axis=1, dtype=np.uint16
+)
+
+# Rows scored at once, keeping the temporary arrays of a search in cache.
+_BLOCK_ROWS = 2048
+
+
+class QuantizedVectorRetriever(NumpyVectorRetriever):
+    """
+    A brute-force retriever searching quantized vectors, re-scored in float32.
+
+    Every vector is stored either as int8 (one byte per dimension with a
+    scale per row, 4x smaller) or sign-binarized (one bit per dimension,
+    32x smaller). A search scores the whole candidate set with integer dot
+    products or Hamming distances, then re-scores the top
+    top_k * rescore_multiplier rows with their full-precision vectors, so
+    the final ranking is exact among those candidates.
+
+    The full-precision vectors are written to vectors_path and memory-mapped,
+    so only the re-scored rows are read and the node embeddings are dropped.
+    Without vectors_path they stay in memory.
+
+    Args:
+        nodes (list[BaseNode]): Nodes with embeddings to search over.
+        quantization (str): "int8" or "binary" (default: "int8").
+        rescore_multiplier (int): Candidates re-scored per returned node (default: 4).
+        vectors_path (str | None): File of the memory-mapped float32 vectors (default: None).
+        embed_model (BaseEmbedding | None): Model used to embed queries (default: Settings.embed_model).
+        similarity_top_k (int): Number of nodes to return per query (default: 10).
+        file_names (list[str] | None): Restrict every search to these files (default: None).
+        callback_manager (CallbackManager | None): Callback manager (default: None).
+        verbose (bool): Flag indicating whether to print verbose output (default: False).
+
+    Attributes:
+        _codes (np.ndarray): int8 codes (num_nodes, dim) or packed bits (num_nodes, dim / 8).
+        _scales (np.ndarray | None): Scale of the int8 codes of every row.
+    """
+
+    def __init__(
+        self,
+        nodes: list[BaseNode],
+        quantization: str = "int8",
+        rescore_multiplier: int = 4,
+        vectors_path: str | None = None,
+        embed_model: BaseEmbedding | None = None,
+        similarity_top_k: int = 10,
+        file_names: list[str] | None = None,
+        callback_manager: CallbackManager | None = None,
+        verbose: bool = False,
+    ) -> None:
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(
+                f"Quantization must be one of {QUANTIZATIONS}, got '{quantization}'."
+            )
+        super().__init__(
+            nodes=nodes,
+            embed_model=embed_model,
+            similarity_top_k=similarity_top_k,
+            file_names=file_names,
+            callback_manager=callback_manager,
+            verbose=verbose,
+        )
+        self._quantization = quantization
+        self._rescore_multiplier = max(1, rescore_multiplier)
+        self._codes, self._scales = self._quantize(self._matrix, quantization)
+
+        if vectors_path is not None:
+            self._write_vectors(vectors_path, self._matrix)
+            self._matrix = np.load(vectors_path, mmap_mode="r")
+            for node in self._nodes:
+                node.embedding = None
+
+    @staticmethod
+    def _write_vectors(vectors_path: str, matrix: np.ndarray) -> None:
+        """
+        Writes the vectors to vectors_path, unless the file already holds them.
+
+        The sha256 of the vectors is kept next to the file, so a retriever
+        built over an unchanged collection maps the existing file. A changed
+        file is written to a unique temporary file and replaced, not
+        overwritten, as other retrievers may map it.
+        """
+        digest = hashlib.sha256(str(matrix.shape).encode())
+        digest.update(np.ascontiguousarray(matrix).tobytes())
+        digest = digest.hexdigest()
+        hash_path = f"{vectors_path}.sha256"
+        if os.path.exists(vectors_path) and os.path.exists(hash_path):
+            with open(hash_path, "r", encoding="utf-8") as file:
+                if file.read().strip() == digest:
+                    return
+
+        directory = os.path.dirname(vectors_path) or "."
+        for path, write in (
+            (vectors_path, lambda file: np.save(file, matrix)),
+            (hash_path, lambda file: file.write(digest.encode())),
+        ):
+            file = tempfile.NamedTemporaryFile(
+                dir=directory, suffix=".tmp", delete=False
+            )
+            try:
+                with file:
+                    write(file)
+                os.replace(file.name, path)
+            except BaseException:
+                if os.path.exists(file.name):
+                    os.remove(file.name)
+                raise
+
+    @staticmethod
+    def _quantize(
+        matrix: np.ndarray, quantization: str
+    ) -> tuple[np.ndarray, np.ndarray | None]:
+        if quantization == "binary":
+            return np.packbits(matrix > 0, axis=1), None
+        scales = np.abs(matrix).max(axis=1, initial=0.0) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    @property
+    def memory(self) -> dict:
+        """Bytes of the float32 vectors and of the quantized index."""
+        float_bytes = self._matrix.shape[0] * self._matrix.shape[1] * 4
+        index_bytes = self._codes.nbytes + (
+            self._scales.nbytes if self._scales is not None else 0
+        )
+        return {
+            "quantization": self._quantization,
+            "float_bytes": float_bytes,
+            "index_bytes": index_bytes,
+            "reduction": (
+                round(float_bytes / index_bytes, 1) if index_bytes else None
+            ),
+        }
+
+    def _approximate_scores(
+        self, query: np.ndarray, rows: np.ndarray | None
+    ) -> np.ndarray:
+        """Scores of one query against the candidate rows, higher is better."""
+        codes = self._codes if rows is None else self._codes[rows]
+        scores = np.empty(codes.shape[0], dtype=np.float32)
+        if self._quantization == "binary":
+            bits = np.packbits(query > 0)
+            for start in range(0, codes.shape[0], _BLOCK_ROWS):
+                block = codes[start : start + _BLOCK_ROWS]
+                # Fewer differing bits is better.
+                scores[start : start + len(block)] = -_POPCOUNT[
+                    np.bitwise_xor(block, bits)
+                ].sum(axis=1, dtype=np.int32)
+            return scores
+
+        scale = np.abs(query).max() / 127.0 or 1.0
+        query_codes = np.rint(query / scale).astype(np.float32)
+        scales = self._scales if rows is None else self._scales[rows]
+        # The integer products run in float32, which numpy hands to BLAS.
+        for start in range(0, codes.shape[0], _BLOCK_ROWS):
+            block = codes[start : start + _BLOCK_ROWS].astype(np.float32)
+            scores[start : start + len(block)] = (block @ query_codes) * scales[
+                start : start + len(block)
+            ]
+        return scores
+
+    def search(
+        self,
+        query_matrix: np.ndarray,
+        top_k: int,
+        file_names: list[str] | None = None,
+        filters: MetadataFilters | None = None,
+    ) -> list[list[tuple[int, float]]]:
+        """
+        Finds the top k rows for each (normalized) query vector.
+
+        Args:
+            query_matrix (np.ndarray): Query vectors with shape (num_queries, dim).
+            top_k (int): Number of rows to return per query.
+            file_names (list[str] | None): Only consider nodes from these files (default: None).
+            filters (MetadataFilters | None): Only consider nodes matching these filters (default: None).
+
+        Returns:
+            list[list[tuple[int, float]]]: (row, cosine similarity) pairs per query, best first.
+        """
+        rows = self._candidate_rows(file_names, filters)
+        num_rows = self._codes.shape[0] if rows is None else len(rows)
+        k = min(top_k, num_rows)
+        num_candidates = min(k * self._rescore_multiplier, num_rows)
+
+        results = []
+        for query in query_matrix:
+            if k <= 0:
+                results.append([])
+                continue
+            scores = self._approximate_scores(query, rows)
+            candidates = np.argpartition(-scores, num_candidates - 1)[
+                :num_candidates
+            ]
+            if rows is not None:
+                candidates = rows[candidates]
+            candidates = np.sort(candidates)
+            exact = np.asarray(self._matrix[candidates]) @ query
+            order = np.argsort(-exact)[:k]
+            results.append(
+                list(zip(candidates[order].tolist(), exact[order].tolist()))
+            )
+        return results
@@ -0,0 +1,193 @@
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+from .admission import get_admission_controller
+
+
+class RerankCache:
+    """
+    LRU cache of cross-encoder scores keyed by (model, query hash, node id).
+
+    Args:
+        max_size (int): Maximum number of cached scores (default: 10000).
+    """
+
+    def __init__(self, max_size: int = 10000) -> None:
+        self._max_size = max_size
+        self._scores: OrderedDict[tuple[str, int, str], float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._batches = 0
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": len(self._scores),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 3) if total else 0.0,
+                "batches": self._batches,
+            }
+
+    def get_many(
+        self, keys: list[tuple[str, int, str]]
+    ) -> dict[tuple[str, int, str], float]:
+        """Returns the cached scores among keys, counting hits and misses."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                score = self._scores.get(key)
+                if score is None:
+                    self._misses += 1
+                    continue
+                self._scores.move_to_end(key)
+                self._hits += 1
+                found[key] = score
+        return found
+
+    def put_many(self, scores: dict[tuple[str, int, str], float]) -> None:
+        with self._lock:
+            self._batches += 1
+            for key, score in scores.items():
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self._max_size:
+                self._scores.popitem(last=False)
+
+
+_rerank_cache: RerankCache | None = None
+_cross_encoders: dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def get_rerank_cache(max_size: int = 10000) -> RerankCache:
+    """
+    Returns the process-wide rerank cache.
+
+    Args:
+        max_size (int): Size used when the cache is created (default: 10000).
+
+    Returns:
+        RerankCache: The shared cache.
+    """
+    global _rerank_cache
+    with _lock:
+        if _rerank_cache is None:
+            _rerank_cache = RerankCache(max_size)
+        return _rerank_cache
+
+
+def get_cross_encoder(model: str, device: str | None = None) -> Any:
+    """Returns the loaded CrossEncoder of a model, loading it once per process."""
+    with _lock:
+        if model not in _cross_encoders:
+            try:
+                from sentence_transformers import CrossEncoder
+            except ImportError:
+                raise ImportError(
+                    "Cannot import sentence-transformers package, "
+                    "please `pip install sentence-transformers`"
+                )
+            _cross_encoders[model] = CrossEncoder(model, device=device)
+        return _cross_encoders[model]
+
+
+class CachedRerank(BaseNodePostprocessor):
+    """
+    Cross-encoder reranker caching the score of every (query, node) pair.
+
+    Scores are looked up in the shared RerankCache by rerank model, query
+    hash and node id. Only the pairs missing from the cache go through the
+    cross-encoder, all at once as one padded batch, under the "rerank"
+    stage of the admission controller. A repeated question is reranked
+    without the model.
+
+    Args:
+        model (str): The cross-encoder model.
+        top_n (int): Number of nodes to keep (default: 10).
+        cache_size (int): Size of the shared cache when it is created (default: 10000).
+        verbose (bool): Print the cache hits of every query.
+    """
+
+    model: str = Field(description="Cross-encoder model name.")
+    top_n: int = Field(default=10, description="Number of nodes to keep.")
+    device: str | None = Field(default=None, description="Device of the model.")
+    cache_size: int = Field(default=10000, description="Cached scores.")
+    verbose: bool = Field(default=False, description="Print cache hits.")
+
+    _model: Any = PrivateAttr()
+    _cache: RerankCache = PrivateAttr()
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._model = get_cross_encoder(self.model, self.device)
+        self._cache = get_rerank_cache(self.cache_size)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedRerank"
+
+    @property
+    def stats(self) -> dict:
+        return self._cache.stats
+
+    def _postprocess_nodes(
+        self,
+        nodes: list[NodeWithScore],
+        query_bundle: QueryBundle | None = None,
+    ) -> list[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if not nodes:
+            return []
+
+        unique: dict[str, NodeWithScore] = {}
+        for node in nodes:
+            unique.setdefault(node.node.node_id, node)
+        query_hash = hash(query_bundle.query_str)
+        keys = {
+            node_id: (self.model, query_hash, node_id) for node_id in unique
+        }
+        scores = self._cache.get_many(list(keys.values()))
+
+        missing = [node_id for node_id, key in keys.items() if key not in scores]
+        if missing:
+            pairs = [
+                (
+                    query_bundle.query_str,
+                    unique[node_id].node.get_content(
+                        metadata_mode=MetadataMode.EMBED
+                    ),
+                )
+                for node_id in missing
+            ]
+            with get_admission_controller().stage("rerank"):
+                predicted = self._model.predict(
+                    pairs, batch_size=len(pairs), show_progress_bar=False
+                )
+            new_scores = {
+                keys[node_id]: float(score)
+                for node_id, score in zip(missing, predicted)
+            }
+            self._cache.put_many(new_scores)
+            scores.update(new_scores)
+
+        if self.verbose:
+            print(
+                f"Rerank: {len(unique) - len(missing)} cached, "
+                f"{len(missing)} scored in one batch"
+            )
+        reranked = [
+            NodeWithScore(node=node.node, score=scores[keys[node_id]])
+            for node_id, node in unique.items()
+        ]
+        reranked.sort(key=lambda n: n.score, reverse=True)
+        return reranked[: self.top_n]
@@ -1,14 +1,20 @@
+import asyncio
+import os
+import time
+from typing import Callable
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core.callbacks.base import CallbackManager
-from llama_index.core.postprocessor import SentenceTransformerRerank
 from llama_index.core.retrievers.fusion_retriever import FUSION_MODES
 from llama_index.core import Settings, VectorStoreIndex
 from llama_index.core.llms.llm import LLM
 from llama_index.core.schema import (
     BaseNode,
-    IndexNode,
     NodeWithScore,
     QueryBundle,
 )
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+from llama_index.core.vector_stores.types import MetadataFilters
 
 # from llama_index.core.selectors import LLMSingleSelector
 # from llama_index.core.tools import RetrieverTool
@@ -22,100 +28,623 @@ from llama_index.core.retrievers import (
 # from llama_index.retrievers.bm25 import BM25Retriever
 
 from .vector_store import LocalVectorStoreFactory
+from .doc2query import QUESTION_OF_KEY
+from .embedding import get_query_embeddings
+from .fusion import get_query_gen_cache, get_search_executor, parse_queries
+from .numpy_retriever import NumpyVectorRetriever
+from .quantized_retriever import QuantizedVectorRetriever
+from .metadata import LegalQueryParser
+from .postprocessor import AdaptiveDepthPostprocessor, can_merge, merge_nodes
+from .tokens import get_context_token_budget, node_token_count
+
+from .prompts import QueryGenPrompt
 
-# from .prompts import QueryGenPrompt, SingleSelectPrompt
+# from .prompts import SingleSelectPrompt
 
 from ..settings import RAGSettings
 
 
-class TwoStageRetriever(QueryFusionRetriever):
+class MultiQueryFusionRetriever(QueryFusionRetriever):
     """
-    A retriever that performs two-stage retrieval using a fusion of multiple retrievers.
+    A retriever fusing the results of queries generated from the input query.
+
+    The LLM generates num_queries - 1 search queries per question, cached by
+    question in the shared QueryGenCache, so a repeated question costs no
+    LLM call. The original and generated queries are embedded with one batch
+    call, and the searches of every (query, retriever) pair run concurrently
+    on a shared thread pool with the precomputed embeddings. A retriever
+    whose batched attribute is set, a NumpyVectorRetriever or a wrapper of
+    one, searches all queries with one retrieve_batch call instead of one
+    search per query. The results are
+    fused by reciprocal rank or by distance-based scores (see FUSION_MODES)
+    and cut to similarity_top_k.
 
     Args:
         retrievers (list[BaseRetriever]): List of retrievers to be used for retrieval.
-        setting (RAGSettings | None): RAGSettings object for configuring the retriever (default: None).
-        llm (str | None): Language model to be used for retrieval (default: None).
-        query_gen_prompt (str | None): Prompt for generating queries (default: None).
-        mode (FUSION_MODES): Fusion mode for combining retriever results (default: FUSION_MODES.SIMPLE).
-        similarity_top_k (int): Number of top similar documents to consider during retrieval (default: ...).
-        num_queries (int): Number of queries to generate for each input query (default: 4).
-        use_async (bool): Flag indicating whether to use asynchronous retrieval (default: True).
+        llm (LLM | None): LLM generating the queries (default: None).
+        query_gen_prompt (str | None): Prompt with {num_queries} and {query} (default: None).
+        mode (FUSION_MODES): Fusion mode for combining retriever results (default: FUSION_MODES.DIST_BASED_SCORE).
+        similarity_top_k (int): Number of fused nodes returned (default: 10).
+        num_queries (int): Number of queries including the original one (default: 4).
+        embed_model (BaseEmbedding | None): Model embedding the queries (default: None).
+        cache_size (int): Size of the shared query cache when it is created (default: 1024).
+        max_workers (int): Size of the shared search pool when it is created (default: 8).
         verbose (bool): Flag indicating whether to print verbose output (default: False).
-        callback_manager (CallbackManager | None): Callback manager for handling asynchronous retrieval (default: None).
-        objects (list[IndexNode] | None): List of index nodes for retrieval (default: None).
-        object_map (dict | None): Mapping of object IDs to index nodes (default: None).
+        callback_manager (CallbackManager | None): Callback manager (default: None).
         retriever_weights (list[float] | None): List of weights for retrievers during fusion (default: None).
-
-    Attributes:
-        _setting (RAGSettings): RAGSettings object for configuring the retriever.
-        _rerank_model (SentenceTransformerRerank): SentenceTransformerRerank object for reranking retrieved results.
-
     """
 
     def __init__(
         self,
         retrievers: list[BaseRetriever],
-        setting: RAGSettings | None = None,
-        llm: str | None = None,
+        llm: LLM | None = None,
         query_gen_prompt: str | None = None,
-        mode: FUSION_MODES = FUSION_MODES.SIMPLE,
-        similarity_top_k: int = ...,
+        mode: FUSION_MODES = FUSION_MODES.DIST_BASED_SCORE,
+        similarity_top_k: int = 10,
         num_queries: int = 4,
-        use_async: bool = True,
+        embed_model: BaseEmbedding | None = None,
+        cache_size: int = 1024,
+        max_workers: int = 8,
         verbose: bool = False,
         callback_manager: CallbackManager | None = None,
-        objects: list[IndexNode] | None = None,
-        object_map: dict | None = None,
         retriever_weights: list[float] | None = None,
     ) -> None:
         super().__init__(
             retrievers,
-            llm,
-            query_gen_prompt,
-            mode,
-            similarity_top_k,
-            num_queries,
-            use_async,
-            verbose,
-            callback_manager,
-            objects,
-            object_map,
-            retriever_weights,
+            llm=llm,
+            query_gen_prompt=query_gen_prompt,
+            mode=mode,
+            similarity_top_k=similarity_top_k,
+            num_queries=num_queries,
+            use_async=False,
+            verbose=verbose,
+            callback_manager=callback_manager,
+            retriever_weights=retriever_weights,
         )
-        self._setting = setting or RAGSettings()
-        self.rerank_model = SentenceTransformerRerank(
-            top_n=self._setting.RETRIEVER.TOP_K_RERANK,
-            model=self._setting.RETRIEVER.RERANK_LLM,
+        self._embed_model = embed_model or Settings.embed_model
+        self._cache = get_query_gen_cache(cache_size)
+        self._executor = get_search_executor(max_workers)
+
+    @property
+    def stats(self) -> dict:
+        return self._cache.stats
+
+    def _get_queries(self, original_query: str) -> list[QueryBundle]:
+        prompt_str = self.query_gen_prompt.format(
+            num_queries=self.num_queries - 1, query=original_query
+        )
+        key = (self._llm.metadata.model_name, hash(prompt_str))
+        queries = self._cache.get(key)
+        if queries is None:
+            queries = parse_queries(
+                self._llm.complete(prompt_str).text,
+                original_query,
+                self.num_queries - 1,
+            )
+            self._cache.put(key, queries)
+        if self._verbose:
+            queries_str = "\n".join(queries)
+            print(f"Generated queries:\n{queries_str}")
+        return [QueryBundle(query) for query in queries]
+
+    def _embed_queries(self, queries: list[QueryBundle]) -> None:
+        """Sets the embeddings of the queries missing one, in one batch call."""
+        missing = [query for query in queries if query.embedding is None]
+        embeddings = get_query_embeddings(
+            self._embed_model, [query.query_str for query in missing]
+        )
+        for query, embedding in zip(missing, embeddings):
+            query.embedding = embedding
+
+    def _run_sync_queries(
+        self, queries: list[QueryBundle]
+    ) -> dict[tuple[str, int], list[NodeWithScore]]:
+        self._embed_queries(queries)
+        futures = {}
+        for i, retriever in enumerate(self._retrievers):
+            if getattr(retriever, "batched", False):
+                futures[i] = self._executor.submit(retriever.retrieve_batch, queries)
+            else:
+                for query in queries:
+                    futures[(query.query_str, i)] = self._executor.submit(
+                        retriever.retrieve, query
+                    )
+        return self._collect(
+            queries, {key: future.result() for key, future in futures.items()}
+        )
+
+    async def _run_async_queries(
+        self, queries: list[QueryBundle]
+    ) -> dict[tuple[str, int], list[NodeWithScore]]:
+        keys, tasks = [], []
+        for i, retriever in enumerate(self._retrievers):
+            if getattr(retriever, "batched", False):
+                keys.append(i)
+                tasks.append(asyncio.to_thread(retriever.retrieve_batch, queries))
+            else:
+                for query in queries:
+                    keys.append((query.query_str, i))
+                    tasks.append(retriever.aretrieve(query))
+        return self._collect(
+            queries, dict(zip(keys, await asyncio.gather(*tasks)))
         )
 
+    @staticmethod
+    def _collect(
+        queries: list[QueryBundle],
+        results: dict[int | tuple[str, int], list],
+    ) -> dict[tuple[str, int], list[NodeWithScore]]:
+        """Splits the batched results of a retriever, keyed by its index, per query."""
+        collected = {}
+        for key, result in results.items():
+            if isinstance(key, int):
+                for query, nodes in zip(queries, result):
+                    collected[(query.query_str, key)] = nodes
+            else:
+                collected[key] = result
+        return collected
+
+    def _fuse(
+        self, results: dict[tuple[str, int], list[NodeWithScore]]
+    ) -> list[NodeWithScore]:
+        if self.mode == FUSION_MODES.RECIPROCAL_RANK:
+            fused = self._reciprocal_rerank_fusion(results)
+        elif self.mode == FUSION_MODES.RELATIVE_SCORE:
+            fused = self._relative_score_fusion(results)
+        elif self.mode == FUSION_MODES.DIST_BASED_SCORE:
+            fused = self._relative_score_fusion(results, dist_based=True)
+        elif self.mode == FUSION_MODES.SIMPLE:
+            fused = self._simple_fusion(results)
+        else:
+            raise ValueError(f"Invalid fusion mode: {self.mode}")
+        return fused[: self.similarity_top_k]
+
     def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        start = time.perf_counter()
+        queries = [query_bundle]
+        if self.num_queries > 1:
+            queries.extend(self._get_queries(query_bundle.query_str))
+        results = self._run_sync_queries(queries)
+        if self._verbose:
+            print(
+                f"Fusion: {len(queries)} queries, {len(results)} searches "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        return self._fuse(results)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        queries = [query_bundle]
+        if self.num_queries > 1:
+            queries.extend(
+                await asyncio.to_thread(self._get_queries, query_bundle.query_str)
+            )
+        await asyncio.to_thread(self._embed_queries, queries)
+        return self._fuse(await self._run_async_queries(queries))
+
+
+class LegalReferenceRetriever(BaseRetriever):
+    """
+    A retriever that narrows the search to the acts and sections named in the query.
+
+    Explicit references such as "§ 3 zákona č. 455/1991 Sb." are parsed into
+    metadata filters before the vector search, so only the matching act and
+    section range are scored. If the filtered search finds nothing (e.g. the
+    collection was ingested without structured metadata), the query falls
+    back to an unfiltered search.
+
+    With batch_search_fn the retriever is batched: retrieve_batch searches
+    the queries sharing the same filters with one call.
+
+    Args:
+        search_fn (Callable[[QueryBundle, MetadataFilters | None], list[NodeWithScore]]): Runs the vector search.
+        batch_search_fn (Callable[[list[QueryBundle], MetadataFilters | None], list[list[NodeWithScore]]] | None): Runs the vector search of several queries (default: None).
+        parser (LegalQueryParser | None): Parser for references in the query (default: None).
+        callback_manager (CallbackManager | None): Callback manager (default: None).
+        verbose (bool): Flag indicating whether to print verbose output (default: False).
+    """
+
+    def __init__(
+        self,
+        search_fn: Callable[
+            [QueryBundle, MetadataFilters | None], list[NodeWithScore]
+        ],
+        batch_search_fn: (
+            Callable[
+                [list[QueryBundle], MetadataFilters | None],
+                list[list[NodeWithScore]],
+            ]
+            | None
+        ) = None,
+        parser: LegalQueryParser | None = None,
+        callback_manager: CallbackManager | None = None,
+        verbose: bool = False,
+    ) -> None:
+        super().__init__(callback_manager=callback_manager, verbose=verbose)
+        self._search_fn = search_fn
+        self._batch_search_fn = batch_search_fn
+        self._parser = parser or LegalQueryParser()
+        self.batched = batch_search_fn is not None
+
+    def retrieve_batch(
+        self, queries: list[QueryBundle]
+    ) -> list[list[NodeWithScore]]:
         """
-        Perform retrieval using the two-stage retrieval approach.
+        Retrieves nodes for several queries, one search per distinct filter.
 
         Args:
-            query_bundle (QueryBundle): QueryBundle object containing the input query.
+            queries (list[QueryBundle]): Queries, e.g. generated fusion sub-queries.
 
         Returns:
-            list[NodeWithScore]: List of retrieved nodes with their corresponding scores.
-
+            list[list[NodeWithScore]]: Retrieved nodes for each query.
         """
-        raise NotImplementedError
+        results: list[list[NodeWithScore] | None] = [None] * len(queries)
+        groups: dict[str, tuple[MetadataFilters, list[int]]] = {}
+        for i, query in enumerate(queries):
+            filters = self._parser.to_metadata_filters(query.query_str)
+            if filters is not None:
+                groups.setdefault(filters.json(), (filters, []))[1].append(i)
+        for filters, rows in groups.values():
+            found = self._batch_search_fn([queries[i] for i in rows], filters)
+            for i, nodes in zip(rows, found):
+                if nodes:
+                    results[i] = nodes
+        rows = [i for i, nodes in enumerate(results) if nodes is None]
+        if rows:
+            found = self._batch_search_fn([queries[i] for i in rows], None)
+            for i, nodes in zip(rows, found):
+                results[i] = nodes
+        return results
 
-    async def _aretrieve(
-        self, query_bundle: QueryBundle
-    ) -> list[NodeWithScore]:
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        filters = self._parser.to_metadata_filters(query_bundle.query_str)
+        if filters is not None:
+            nodes = self._search_fn(query_bundle, filters)
+            if nodes:
+                return nodes
+        return self._search_fn(query_bundle, None)
+
+
+class QuestionPointerRetriever(BaseRetriever):
+    """
+    A retriever returning the chunks of retrieved doc2query questions.
+
+    Question nodes indexed by QuestionIndexer hold the id of their chunk
+    under QUESTION_OF_KEY. Each is replaced by its chunk, fetched by id if
+    the search did not return it, and a chunk hit directly and through its
+    questions is returned once with its best score. It is batched when the
+    wrapped retriever is.
+
+    Args:
+        retriever (BaseRetriever): Retriever over chunks and questions.
+        get_nodes_fn (Callable[[list[str]], list[BaseNode]]): Fetches nodes by id.
+        callback_manager (CallbackManager | None): Callback manager (default: None).
+        verbose (bool): Flag indicating whether to print verbose output (default: False).
+    """
+
+    def __init__(
+        self,
+        retriever: BaseRetriever,
+        get_nodes_fn: Callable[[list[str]], list[BaseNode]],
+        callback_manager: CallbackManager | None = None,
+        verbose: bool = False,
+    ) -> None:
+        super().__init__(callback_manager=callback_manager, verbose=verbose)
+        self._retriever = retriever
+        self._get_nodes_fn = get_nodes_fn
+        self.batched = getattr(retriever, "batched", False)
+
+    def retrieve_batch(
+        self, queries: list[QueryBundle]
+    ) -> list[list[NodeWithScore]]:
+        """Retrieves nodes for several queries with one call of a batched retriever."""
+        return [
+            self._resolve(nodes)
+            for nodes in self._retriever.retrieve_batch(queries)
+        ]
+
+    def _resolve(self, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        chunk_ids = [
+            node.node.metadata.get(QUESTION_OF_KEY, node.node.node_id)
+            for node in nodes
+        ]
+        if all(QUESTION_OF_KEY not in node.node.metadata for node in nodes):
+            return nodes
+
+        chunks = {
+            node.node.node_id: node.node
+            for node in nodes
+            if QUESTION_OF_KEY not in node.node.metadata
+        }
+        missing = list({i for i in chunk_ids if i not in chunks})
+        if missing:
+            for chunk in self._get_nodes_fn(missing):
+                chunks[chunk.node_id] = chunk
+
+        results: dict[str, NodeWithScore] = {}
+        for node, chunk_id in zip(nodes, chunk_ids):
+            if chunk_id not in chunks:
+                continue
+            if chunk_id in results:
+                results[chunk_id].score = max(
+                    results[chunk_id].score or 0.0, node.score or 0.0
+                )
+            else:
+                results[chunk_id] = NodeWithScore(
+                    node=chunks[chunk_id], score=node.score
+                )
+        return sorted(
+            results.values(), key=lambda node: node.score or 0.0, reverse=True
+        )
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return self._resolve(self._retriever.retrieve(query_bundle))
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return self._resolve(await self._retriever.aretrieve(query_bundle))
+
+
+class ShardedRetriever(BaseRetriever):
+    """
+    A retriever fanning a search out to per-act shard collections.
+
+    The query is embedded once and searched concurrently in every shard, or
+    only in the shards of the acts it names (e.g. "455/1991 Sb."), and the
+    top k of all shards are merged by score. When every shard is batched,
+    retrieve_batch sends each shard the queries routed to it in one call.
+
+    Args:
+        shards (dict[str, BaseRetriever]): Retriever of every shard, by file name.
+        shard_metadata (dict[str, dict]): Manifest entry of every shard, with act_number and act_year.
+        similarity_top_k (int): Number of merged nodes returned (default: 10).
+        embed_model (BaseEmbedding | None): Model embedding the query (default: None).
+        parser (LegalQueryParser | None): Parser for references in the query (default: None).
+        max_workers (int): Size of the shared shard pool when it is created (default: 8).
+        callback_manager (CallbackManager | None): Callback manager (default: None).
+        verbose (bool): Flag indicating whether to print verbose output (default: False).
+    """
+
+    def __init__(
+        self,
+        shards: dict[str, BaseRetriever],
+        shard_metadata: dict[str, dict],
+        similarity_top_k: int = 10,
+        embed_model: BaseEmbedding | None = None,
+        parser: LegalQueryParser | None = None,
+        max_workers: int = 8,
+        callback_manager: CallbackManager | None = None,
+        verbose: bool = False,
+    ) -> None:
+        super().__init__(callback_manager=callback_manager, verbose=verbose)
+        self._shards = shards
+        self._shard_metadata = shard_metadata
+        self._similarity_top_k = similarity_top_k
+        self._embed_model = embed_model or Settings.embed_model
+        self._parser = parser or LegalQueryParser()
+        self._executor = get_search_executor(max_workers, name="shards")
+        self.batched = bool(shards) and all(
+            getattr(shard, "batched", False) for shard in shards.values()
+        )
+
+    def _route(self, query_str: str) -> list[str]:
+        """File names of the shards to search: those of the named acts, else all."""
+        reference = self._parser.parse(query_str)
+        if "act_number" in reference:
+            act = (reference["act_number"], reference["act_year"])
+            routed = [
+                file_name
+                for file_name in self._shards
+                if act == (
+                    self._shard_metadata.get(file_name, {}).get("act_number"),
+                    self._shard_metadata.get(file_name, {}).get("act_year"),
+                )
+            ]
+            if routed:
+                return routed
+        return list(self._shards)
+
+    def _merge(self, results: list[list[NodeWithScore]]) -> list[NodeWithScore]:
+        nodes = [node for shard_nodes in results for node in shard_nodes]
+        nodes.sort(key=lambda node: node.score or 0.0, reverse=True)
+        return nodes[: self._similarity_top_k]
+
+    def retrieve_batch(
+        self, queries: list[QueryBundle]
+    ) -> list[list[NodeWithScore]]:
         """
-        Perform asynchronous retrieval using the two-stage retrieval approach.
+        Retrieves nodes for several queries, one batched search per shard.
 
         Args:
-            query_bundle (QueryBundle): QueryBundle object containing the input query.
+            queries (list[QueryBundle]): Queries, e.g. generated fusion sub-queries.
 
         Returns:
-            list[NodeWithScore]: List of retrieved nodes with their corresponding scores.
-
+            list[list[NodeWithScore]]: Merged nodes for each query.
         """
-        raise NotImplementedError
+        missing = [query for query in queries if query.embedding is None]
+        embeddings = get_query_embeddings(
+            self._embed_model, [query.query_str for query in missing]
+        )
+        for query, embedding in zip(missing, embeddings):
+            query.embedding = embedding
+        routes: dict[str, list[int]] = {}
+        for i, query in enumerate(queries):
+            for file_name in self._route(query.query_str):
+                routes.setdefault(file_name, []).append(i)
+        futures = {
+            file_name: self._executor.submit(
+                self._shards[file_name].retrieve_batch,
+                [queries[i] for i in rows],
+            )
+            for file_name, rows in routes.items()
+        }
+        results: list[list[list[NodeWithScore]]] = [[] for _ in queries]
+        for file_name, future in futures.items():
+            for i, nodes in zip(routes[file_name], future.result()):
+                results[i].append(nodes)
+        return [self._merge(query_results) for query_results in results]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self._embed_model.get_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        file_names = self._route(query_bundle.query_str)
+        if self._verbose:
+            print(f"Shards: searching {len(file_names)} of {len(self._shards)}")
+        futures = [
+            self._executor.submit(self._shards[file_name].retrieve, query_bundle)
+            for file_name in file_names
+        ]
+        return self._merge([future.result() for future in futures])
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = (
+                await self._embed_model.aget_agg_embedding_from_queries(
+                    query_bundle.embedding_strs
+                )
+            )
+        file_names = self._route(query_bundle.query_str)
+        return self._merge(
+            await asyncio.gather(
+                *[
+                    self._shards[file_name].aretrieve(query_bundle)
+                    for file_name in file_names
+                ]
+            )
+        )
+
+
+class AdaptiveDepthRetriever(BaseRetriever):
+    """
+    A retriever that cuts the candidates where their scores fall off.
+
+    The wrapped retriever fetches up to its similarity_top_k candidates and
+    only those the score distribution justifies (see adaptive_depth) are
+    returned, so a clear top hit is not reranked and prompted along with
+    nine weaker chunks.
+
+    Args:
+        retriever (BaseRetriever): The wrapped retriever.
+        depth (AdaptiveDepthPostprocessor): The cut-off policy.
+        callback_manager (CallbackManager | None): Callback manager (default: None).
+        verbose (bool): Flag indicating whether to print verbose output (default: False).
+    """
+
+    def __init__(
+        self,
+        retriever: BaseRetriever,
+        depth: AdaptiveDepthPostprocessor,
+        callback_manager: CallbackManager | None = None,
+        verbose: bool = False,
+    ) -> None:
+        super().__init__(callback_manager=callback_manager, verbose=verbose)
+        self._retriever = retriever
+        self._depth = depth
+
+    @property
+    def stats(self) -> dict:
+        return self._depth.stats
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return self._depth.postprocess_nodes(
+            self._retriever.retrieve(query_bundle), query_bundle=query_bundle
+        )
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return self._depth.postprocess_nodes(
+            await self._retriever.aretrieve(query_bundle),
+            query_bundle=query_bundle,
+        )
+
+
+class ParentExpansionRetriever(BaseRetriever):
+    """
+    A small-to-big retriever that searches child chunks and returns their parents.
+
+    Retrieved children are replaced by their parent section from the docstore.
+    Children of the same parent are deduplicated, parents that are adjacent in
+    the same file are merged into one span, and the spans are packed by score
+    into a token budget. A parent that does not fit is replaced by those of its
+    retrieved children that do.
+
+    Args:
+        retriever (BaseRetriever): Retriever over the child chunks.
+        docstore (BaseDocumentStore): Docstore holding the parent nodes.
+        token_budget (int): Maximum number of tokens of returned context.
+        callback_manager (CallbackManager | None): Callback manager (default: None).
+        verbose (bool): Flag indicating whether to print verbose output (default: False).
+    """
+
+    def __init__(
+        self,
+        retriever: BaseRetriever,
+        docstore: BaseDocumentStore,
+        token_budget: int,
+        callback_manager: CallbackManager | None = None,
+        verbose: bool = False,
+    ) -> None:
+        super().__init__(callback_manager=callback_manager, verbose=verbose)
+        self._retriever = retriever
+        self._docstore = docstore
+        self._token_budget = token_budget
+
+    def _expand(self, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        # Replace children by their parents, keeping the best child score.
+        groups: dict[str, list] = {}
+        for node in nodes:
+            parent = None
+            if node.node.parent_node is not None:
+                parent = self._docstore.get_node(
+                    node.node.parent_node.node_id, raise_error=False
+                )
+            big = parent or node.node
+            if big.node_id in groups:
+                groups[big.node_id][1] = max(
+                    groups[big.node_id][1], node.score or 0.0
+                )
+                groups[big.node_id][2].append(node)
+            else:
+                groups[big.node_id] = [big, node.score or 0.0, [node]]
+
+        # Merge parents that follow each other in the same file.
+        spans = sorted(
+            groups.values(),
+            key=lambda group: (
+                group[0].metadata.get("file_name") or "",
+                group[0].start_char_idx or 0,
+            ),
+        )
+        merged: list[list] = []
+        for span in spans:
+            if merged and can_merge(merged[-1][0], span[0]):
+                merged[-1] = [
+                    merge_nodes(merged[-1][0], span[0]),
+                    max(merged[-1][1], span[1]),
+                    merged[-1][2] + span[2],
+                ]
+            else:
+                merged.append(span)
+
+        # Pack the best spans into the token budget.
+        results: list[NodeWithScore] = []
+        remaining = self._token_budget
+        for big, score, children in sorted(
+            merged, key=lambda group: group[1], reverse=True
+        ):
+            tokens = node_token_count(big)
+            if tokens <= remaining:
+                results.append(NodeWithScore(node=big, score=score))
+                remaining -= tokens
+                continue
+            for child in children:
+                tokens = node_token_count(child.node)
+                if tokens <= remaining:
+                    results.append(child)
+                    remaining -= tokens
+        return results
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return self._expand(self._retriever.retrieve(query_bundle))
 
 
 class LocalRetrieverFactory:
@@ -129,6 +658,14 @@ class LocalRetrieverFactory:
     Methods:
         __init__: Initializes the _LocalRetriever object.
         _get_normal_retriever: Returns a normal retriever.
+        _get_numpy_retriever: Returns an exact NumPy retriever.
+        _get_filtered_retriever: Returns a retriever with query metadata filtering.
+        _get_small_to_big_retriever: Returns a retriever expanding children to parents.
+        _get_adaptive_retriever: Returns a retriever with an adaptive depth.
+        _get_fusion_retriever: Returns a multi-query fusion retriever.
+        _get_question_retriever: Returns a retriever resolving doc2query questions.
+        _get_collection_retriever: Returns the retriever of one collection.
+        _get_sharded_retriever: Returns a retriever over per-act shards.
         _get_hybrid_retriever: Returns a hybrid retriever.
         _get_router_retriever: Returns a router retriever.
         get_retrievers: Returns the appropriate retriever based on the number of nodes.
@@ -161,6 +698,250 @@ class LocalRetrieverFactory:
             verbose=True,
         )
 
+    def _get_numpy_retriever(
+        self,
+        vector_index: VectorStoreIndex,
+        file_names: list[str] | None = None,
+        quantization: str | None = None,
+    ) -> NumpyVectorRetriever:
+        """
+        Returns an exact brute-force retriever over the whole collection.
+
+        With a quantization other than "none", the vectors are searched
+        quantized and the top candidates re-scored with the float32 vectors,
+        memory-mapped from PERSIST_DIR.
+
+        Args:
+            vector_index (VectorStoreIndex): The vector store index.
+            file_names (list[str] | None): Restrict the search to these files.
+            quantization (str | None): "none", "int8" or "binary" (default: RETRIEVER.QUANTIZATION).
+
+        Returns:
+            NumpyVectorRetriever: The NumPy retriever.
+        """
+        quantization = quantization or self._setting.RETRIEVER.QUANTIZATION
+        kwargs = {}
+        retriever_class = NumpyVectorRetriever
+        if quantization != "none":
+            retriever_class = QuantizedVectorRetriever
+            kwargs = {
+                "quantization": quantization,
+                "rescore_multiplier": self._setting.RETRIEVER.RESCORE_MULTIPLIER,
+                "vectors_path": os.path.join(
+                    self._setting.STORAGE.PERSIST_DIR,
+                    f"{vector_index.vector_store.client.name}_vectors.npy",
+                ),
+            }
+        return retriever_class.from_chroma_collection(
+            vector_index.vector_store.client,
+            embed_model=Settings.embed_model,
+            similarity_top_k=self._setting.RETRIEVER.SIMILARITY_TOP_K,
+            file_names=file_names,
+            **kwargs,
+        )
+
+    def _get_filtered_retriever(
+        self,
+        vector_index: VectorStoreIndex,
+        retriever: BaseRetriever,
+    ) -> LegalReferenceRetriever:
+        """
+        Returns a retriever that pre-filters by the acts and sections named in the query.
+
+        Args:
+            vector_index (VectorStoreIndex): The vector store index.
+            retriever (BaseRetriever): The unfiltered retriever.
+
+        Returns:
+            LegalReferenceRetriever: The filtered retriever.
+        """
+        if isinstance(retriever, NumpyVectorRetriever):
+
+            def batch_search_fn(query_bundles, filters):
+                return retriever.retrieve_batch(query_bundles, filters=filters)
+
+            def search_fn(query_bundle, filters):
+                return batch_search_fn([query_bundle], filters)[0]
+
+            return LegalReferenceRetriever(search_fn, batch_search_fn)
+
+        def search_fn(query_bundle, filters):
+            if filters is None:
+                return retriever.retrieve(query_bundle)
+            return VectorIndexRetriever(
+                index=vector_index,
+                similarity_top_k=self._setting.RETRIEVER.SIMILARITY_TOP_K,
+                embed_model=Settings.embed_model,
+                filters=filters,
+            ).retrieve(query_bundle)
+
+        return LegalReferenceRetriever(search_fn)
+
+    def _get_small_to_big_retriever(
+        self, retriever: BaseRetriever
+    ) -> ParentExpansionRetriever:
+        """
+        Returns a retriever that expands retrieved children to their parent sections.
+
+        Args:
+            retriever (BaseRetriever): Retriever over the child chunks.
+
+        Returns:
+            ParentExpansionRetriever: The small-to-big retriever.
+        """
+        return ParentExpansionRetriever(
+            retriever=retriever,
+            docstore=LocalVectorStoreFactory(
+                setting=self._setting
+            ).get_docstore(),
+            token_budget=get_context_token_budget(self._setting),
+        )
+
+    def _get_adaptive_retriever(
+        self, retriever: BaseRetriever
+    ) -> AdaptiveDepthRetriever:
+        """
+        Returns a retriever keeping as many candidates as their scores justify.
+
+        Args:
+            retriever (BaseRetriever): Retriever fetching SIMILARITY_TOP_K candidates.
+
+        Returns:
+            AdaptiveDepthRetriever: The adaptive retriever.
+        """
+        return AdaptiveDepthRetriever(
+            retriever=retriever,
+            depth=self.get_adaptive_depth(
+                self._setting.RETRIEVER.SIMILARITY_TOP_K
+            ),
+        )
+
+    def get_adaptive_depth(
+        self, max_k: int, normalize: bool = False
+    ) -> AdaptiveDepthPostprocessor:
+        """
+        Returns the adaptive depth policy of the settings.
+
+        Args:
+            max_k (int): Maximum number of nodes kept.
+            normalize (bool): Squash the scores with a sigmoid, for reranker logits.
+
+        Returns:
+            AdaptiveDepthPostprocessor: The policy.
+        """
+        return AdaptiveDepthPostprocessor(
+            min_k=min(self._setting.RETRIEVER.ADAPTIVE_MIN_K, max_k),
+            max_k=max_k,
+            max_drop=self._setting.RETRIEVER.ADAPTIVE_MAX_DROP,
+            min_gap=self._setting.RETRIEVER.ADAPTIVE_MIN_GAP,
+            normalize=normalize,
+            verbose=True,
+        )
+
+    def _get_question_retriever(
+        self,
+        vector_index: VectorStoreIndex,
+        retriever: BaseRetriever,
+    ) -> QuestionPointerRetriever:
+        """
+        Returns a retriever replacing retrieved doc2query questions by their chunks.
+
+        Args:
+            vector_index (VectorStoreIndex): The vector store index holding the chunks.
+            retriever (BaseRetriever): Retriever over chunks and questions.
+
+        Returns:
+            QuestionPointerRetriever: The resolving retriever.
+        """
+        return QuestionPointerRetriever(
+            retriever=retriever,
+            get_nodes_fn=lambda node_ids: vector_index.vector_store.get_nodes(
+                node_ids=node_ids
+            ),
+        )
+
+    def _get_collection_retriever(
+        self, vector_index: VectorStoreIndex
+    ) -> BaseRetriever:
+        """
+        Returns the retriever of one collection, with filtering and question pointers.
+
+        Args:
+            vector_index (VectorStoreIndex): The vector store index.
+
+        Returns:
+            BaseRetriever: The retriever.
+        """
+        if self._setting.RETRIEVER.RETRIEVER_MODE == "numpy":
+            retriever = self._get_numpy_retriever(vector_index)
+        else:
+            retriever = self._get_normal_retriever(vector_index)
+
+        if self._setting.RETRIEVER.METADATA_FILTERING:
+            retriever = self._get_filtered_retriever(vector_index, retriever)
+
+        if self._setting.RETRIEVER.QUESTION_POINTERS:
+            retriever = self._get_question_retriever(vector_index, retriever)
+
+        return retriever
+
+    def _get_sharded_retriever(
+        self,
+        nodes: list[BaseNode],
+        parent_nodes: list[BaseNode] | None = None,
+    ) -> ShardedRetriever:
+        """
+        Returns a retriever fanning out to the per-act shard collections.
+
+        Args:
+            nodes (list[BaseNode]): Embedded nodes of the ingested files.
+            parent_nodes (list[BaseNode] | None): Parent nodes to store in the docstore.
+
+        Returns:
+            ShardedRetriever: The sharded retriever.
+        """
+        vector_store_factory = LocalVectorStoreFactory(setting=self._setting)
+        indexes = vector_store_factory.get_or_create_shard_indexes(
+            nodes, parent_nodes
+        )
+        return ShardedRetriever(
+            shards={
+                file_name: self._get_collection_retriever(vector_index)
+                for file_name, vector_index in indexes.items()
+            },
+            shard_metadata=vector_store_factory.get_manifest(),
+            similarity_top_k=self._setting.RETRIEVER.SIMILARITY_TOP_K,
+            verbose=True,
+        )
+
+    def _get_fusion_retriever(
+        self,
+        retriever: BaseRetriever,
+        llm: LLM | None = None,
+        language: str = "eng",
+    ) -> MultiQueryFusionRetriever:
+        """
+        Returns a retriever fusing the results of NUM_QUERIES queries.
+
+        Args:
+            retriever (BaseRetriever): Retriever running every query.
+            llm (LLM | None): The LLM generating the queries.
+            language (str): The language of the query generation prompt.
+
+        Returns:
+            MultiQueryFusionRetriever: The fusion retriever.
+        """
+        return MultiQueryFusionRetriever(
+            retrievers=[retriever],
+            llm=llm,
+            query_gen_prompt=QueryGenPrompt()(language=language).template,
+            mode=FUSION_MODES(self._setting.RETRIEVER.FUSION_MODE),
+            similarity_top_k=self._setting.RETRIEVER.SIMILARITY_TOP_K,
+            num_queries=self._setting.RETRIEVER.NUM_QUERIES,
+            cache_size=self._setting.RETRIEVER.QUERY_GEN_CACHE_SIZE,
+            verbose=True,
+        )
+
     def _get_hybrid_retriever(
         self,
         vector_index: VectorStoreIndex,
@@ -178,7 +959,7 @@ class LocalRetrieverFactory:
             gen_query (bool): Whether to generate a query or not.
 
         Returns:
-            QueryFusionRetriever or TwoStageRetriever: The hybrid retriever.
+            QueryFusionRetriever: The hybrid retriever.
         """
         raise NotImplementedError
 
@@ -205,6 +986,7 @@ class LocalRetrieverFactory:
         nodes: list[BaseNode],
         llm: LLM | None = None,
         language: str = "en",
+        parent_nodes: list[BaseNode] | None = None,
     ):
         """
         Returns the appropriate retriever based on the number of nodes.
@@ -212,14 +994,26 @@ class LocalRetrieverFactory:
         Args:
             nodes (list[BaseNode]): The list of nodes.
             llm (LLM | None): The LLM object.
+            parent_nodes (list[BaseNode] | None): Parent nodes to store in the docstore.
 
         Returns:
-            VectorIndexRetriever or RouterRetriever: The retriever.
+            BaseRetriever: The vector retriever, wrapped by the enabled stages.
         """
-        vector_index: VectorStoreIndex = LocalVectorStoreFactory(
-            setting=self._setting
-        ).get_or_create_vector_store_index(nodes)
-
-        retriever = self._get_normal_retriever(vector_index)
+        if self._setting.STORAGE.SHARDING:
+            retriever = self._get_sharded_retriever(nodes, parent_nodes)
+        else:
+            vector_index: VectorStoreIndex = LocalVectorStoreFactory(
+                setting=self._setting
+            ).get_or_create_vector_store_index(nodes, parent_nodes)
+            retriever = self._get_collection_retriever(vector_index)
+
+        if self._setting.RETRIEVER.QUERY_FUSION:
+            retriever = self._get_fusion_retriever(retriever, llm, language)
+
+        if self._setting.RETRIEVER.ADAPTIVE_DEPTH:
+            retriever = self._get_adaptive_retriever(retriever)
+
+        if self._setting.RETRIEVER.SMALL_TO_BIG:
+            retriever = self._get_small_to_big_retriever(retriever)
 
         return retriever
@@ -0,0 +1,365 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterator
+
+import httpx
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+from .http_client import get_http_client, get_timeout
+from .llm import LocalOllama
+
+
+def get_base_url(host: str, port: int) -> str:
+    """
+    Returns the base URL of an Ollama host.
+
+    Args:
+        host (str): "host", "host:port" or a full URL.
+        port (int): Port used when the host has none.
+
+    Returns:
+        str: The base URL, such as http://host:11434.
+    """
+    if "://" in host:
+        return host.rstrip("/")
+    if ":" in host:
+        return f"http://{host}"
+    return f"http://{host}:{port}"
+
+
+def is_backend_failure(error: Exception) -> bool:
+    """Whether an error means the backend, not the request, failed."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+@dataclass
+class Backend:
+    url: str
+    healthy: bool = True
+    in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+    total_seconds: float = 0.0
+    first_chunk_seconds: float = 0.0
+    streams: int = 0
+    last_check: float = 0.0
+    last_progress: float = 0.0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.requests if self.requests else 0.0
+
+    @property
+    def mean_first_chunk_seconds(self) -> float:
+        return self.first_chunk_seconds / self.streams if self.streams else 0.0
+
+
+class RoutingOllama(LocalOllama):
+    """
+    Ollama LLM spreading requests over several Ollama hosts.
+
+    Each request goes to the healthy backend with the fewest requests in
+    flight, ties broken by mean latency; the choice and the in-flight count
+    are updated under one lock, so concurrent requests spread out. A
+    backend that times out, refuses the connection or answers with a 5xx
+    error is marked unhealthy and the request fails over to the next one.
+    A stream can only fail over before its first chunk. A backend holding
+    requests without a first chunk or a completed request for
+    stall_timeout seconds is hung even if it still accepts connections, and
+    is marked unhealthy as well. Every backend is probed through /api/tags
+    at most every health_check_interval seconds, healthy ones in the
+    background, and an unhealthy one rejoins once it answers and is not
+    stalled.
+
+    Args:
+        base_urls (list[str]): Base URLs of the Ollama hosts.
+        health_check_interval (float): Seconds between probes of a backend.
+        stall_timeout (float): Seconds without progress after which a busy backend is hung.
+    """
+
+    base_urls: list[str] = Field(description="Base URLs of the Ollama hosts.")
+    health_check_interval: float = Field(
+        default=30, description="Seconds between health checks of a host."
+    )
+    stall_timeout: float = Field(
+        default=90,
+        description="Seconds a host may hold requests without progress.",
+    )
+
+    _backends: list[Backend] = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+
+    def __init__(self, **kwargs: Any) -> None:
+        kwargs.setdefault("base_url", kwargs["base_urls"][0])
+        super().__init__(**kwargs)
+        self._backends = [Backend(url=url) for url in self.base_urls]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RoutingOllama_llm"
+
+    @property
+    def stats(self) -> list[dict]:
+        """Health, load and latency of every backend."""
+        with self._lock:
+            return [
+                {
+                    "url": backend.url,
+                    "healthy": backend.healthy,
+                    "in_flight": backend.in_flight,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                    "mean_seconds": round(backend.mean_seconds, 3),
+                    "mean_first_chunk_seconds": round(
+                        backend.mean_first_chunk_seconds, 3
+                    ),
+                }
+                for backend in self._backends
+            ]
+
+    def _stalled(self, backend: Backend, now: float) -> bool:
+        """Whether a backend holds requests without progress; holds the lock."""
+        return (
+            backend.in_flight > 0
+            and now - backend.last_progress >= self.stall_timeout
+        )
+
+    def check_health(self, backend: Backend) -> bool:
+        """
+        Probes a backend through /api/tags and records the result.
+
+        Args:
+            backend (Backend): The backend to probe.
+
+        Returns:
+            bool: True if the backend answered and is not stalled.
+        """
+        try:
+            response = get_http_client().get(
+                f"{backend.url}/api/tags", timeout=get_timeout(5)
+            )
+            response.raise_for_status()
+            healthy = True
+        except httpx.HTTPError:
+            healthy = False
+        with self._lock:
+            now = time.monotonic()
+            healthy = healthy and not self._stalled(backend, now)
+            if backend.healthy and not healthy:
+                print(f"Ollama backend {backend.url} failed its health check")
+            backend.healthy = healthy
+            backend.last_check = now
+        return healthy
+
+    def _check_backends(self) -> None:
+        """Probes the backends due a check: unhealthy ones inline, healthy ones in the background."""
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for backend in self._backends:
+                if backend.healthy and self._stalled(backend, now):
+                    backend.healthy = False
+                    backend.last_check = now
+                    print(f"Ollama backend {backend.url} stalled")
+                elif now - backend.last_check >= self.health_check_interval:
+                    # Not probed again while this probe runs.
+                    backend.last_check = now
+                    due.append((backend, backend.healthy))
+        for backend, healthy in due:
+            if healthy:
+                threading.Thread(
+                    target=self.check_health, args=(backend,), daemon=True
+                ).start()
+            else:
+                self.check_health(backend)
+
+    def _ranked(self) -> list[Backend]:
+        # Unhealthy backends stay as a last resort.
+        return sorted(
+            self._backends,
+            key=lambda b: (not b.healthy, b.in_flight, b.mean_seconds),
+        )
+
+    def _candidates(self) -> list[Backend]:
+        self._check_backends()
+        with self._lock:
+            return self._ranked()
+
+    def _acquire(self, tried: list[Backend]) -> tuple[Backend, float] | None:
+        """
+        Picks the best backend not tried yet and counts the request in its load.
+
+        Args:
+            tried (list[Backend]): Backends that already failed this request.
+
+        Returns:
+            tuple[Backend, float] | None: The backend and the start time, None if all were tried.
+        """
+        with self._lock:
+            for backend in self._ranked():
+                if backend in tried:
+                    continue
+                if backend.in_flight == 0:
+                    backend.last_progress = time.monotonic()
+                backend.in_flight += 1
+                tried.append(backend)
+                return backend, time.perf_counter()
+        return None
+
+    def _end(
+        self,
+        backend: Backend,
+        started: float,
+        error: Exception | None = None,
+    ) -> None:
+        with self._lock:
+            backend.in_flight -= 1
+            if error is None:
+                backend.last_progress = time.monotonic()
+            if error is not None and is_backend_failure(error):
+                backend.failures += 1
+                backend.healthy = False
+                backend.last_check = time.monotonic()
+                print(f"Ollama backend {backend.url} failed: {error!r}")
+            elif error is None:
+                backend.requests += 1
+                backend.total_seconds += time.perf_counter() - started
+
+    def _first_chunk(self, backend: Backend, started: float) -> None:
+        with self._lock:
+            backend.streams += 1
+            backend.first_chunk_seconds += time.perf_counter() - started
+            backend.last_progress = time.monotonic()
+
+    def _post(
+        self, path: str, payload: dict, base_url: str | None = None
+    ) -> dict:
+        if base_url is not None:
+            return super()._post(path, payload, base_url)
+        error: Exception | None = None
+        self._check_backends()
+        tried: list[Backend] = []
+        while (acquired := self._acquire(tried)) is not None:
+            backend, started = acquired
+            try:
+                raw = super()._post(path, payload, backend.url)
+            except httpx.HTTPError as e:
+                self._end(backend, started, e)
+                if not is_backend_failure(e):
+                    raise
+                error = e
+                continue
+            self._end(backend, started)
+            return raw
+        raise error
+
+    async def _apost(
+        self, path: str, payload: dict, base_url: str | None = None
+    ) -> dict:
+        if base_url is not None:
+            return await super()._apost(path, payload, base_url)
+        error: Exception | None = None
+        self._check_backends()
+        tried: list[Backend] = []
+        while (acquired := self._acquire(tried)) is not None:
+            backend, started = acquired
+            try:
+                raw = await super()._apost(path, payload, backend.url)
+            except httpx.HTTPError as e:
+                self._end(backend, started, e)
+                if not is_backend_failure(e):
+                    raise
+                error = e
+                continue
+            self._end(backend, started)
+            return raw
+        raise error
+
+    def _stream(
+        self, path: str, payload: dict, base_url: str | None = None
+    ) -> Iterator[dict]:
+        if base_url is not None:
+            yield from super()._stream(path, payload, base_url)
+            return
+        error: Exception | None = None
+        self._check_backends()
+        tried: list[Backend] = []
+        while (acquired := self._acquire(tried)) is not None:
+            backend, started = acquired
+            streamed = False
+            try:
+                for chunk in super()._stream(path, payload, backend.url):
+                    if not streamed:
+                        streamed = True
+                        self._first_chunk(backend, started)
+                    yield chunk
+            except httpx.HTTPError as e:
+                self._end(backend, started, e)
+                if streamed or not is_backend_failure(e):
+                    raise
+                error = e
+                continue
+            except BaseException:
+                self._end(backend, started)
+                raise
+            self._end(backend, started)
+            return
+        raise error
+
+    async def _astream(
+        self, path: str, payload: dict, base_url: str | None = None
+    ) -> AsyncIterator[dict]:
+        if base_url is not None:
+            async for chunk in super()._astream(path, payload, base_url):
+                yield chunk
+            return
+        error: Exception | None = None
+        self._check_backends()
+        tried: list[Backend] = []
+        while (acquired := self._acquire(tried)) is not None:
+            backend, started = acquired
+            streamed = False
+            try:
+                async for chunk in super()._astream(path, payload, backend.url):
+                    if not streamed:
+                        streamed = True
+                        self._first_chunk(backend, started)
+                    yield chunk
+            except httpx.HTTPError as e:
+                self._end(backend, started, e)
+                if streamed or not is_backend_failure(e):
+                    raise
+                error = e
+                continue
+            except BaseException:
+                self._end(backend, started)
+                raise
+            self._end(backend, started)
+            return
+        raise error
+
+    def warm_up(self, base_url: str | None = None) -> bool:
+        """Loads the model on every healthy backend."""
+        if base_url is not None:
+            return super().warm_up(base_url)
+        return any(
+            [
+                super(RoutingOllama, self).warm_up(backend.url)
+                for backend in self._candidates()
+                if backend.healthy
+            ]
+        )
+
+    def is_loaded(self, base_url: str | None = None) -> bool:
+        """Whether any healthy backend holds the model in memory."""
+        if base_url is not None:
+            return super().is_loaded(base_url)
+        return any(
+            super(RoutingOllama, self).is_loaded(backend.url)
+            for backend in self._candidates()
+            if backend.healthy
+        )
@@ -0,0 +1,160 @@
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.utils import get_tokenizer
+
+from ..settings import RAGSettings
+
+# Node metadata key holding the token count of the LLM view of the node.
+TOKEN_COUNT_KEY = "token_count"
+
+
+class TokenCountCache:
+    """
+    LRU cache of token counts keyed by tokenizer and text hash.
+
+    The same history messages, prompts and retrieved chunks are counted on
+    every turn to check the token budgets. Hashing a string is much cheaper
+    than tokenizing it, and Python caches the hash on the string.
+
+    Args:
+        max_size (int): Maximum number of cached counts (default: 16384).
+    """
+
+    def __init__(self, max_size: int = 16384) -> None:
+        self._max_size = max_size
+        self._counts: OrderedDict[tuple[int, int], int] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._counts),
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+    def count(
+        self, text: str, tokenizer: Callable[[str], list] | None = None
+    ) -> int:
+        tokenizer = tokenizer or get_tokenizer()
+        key = (id(tokenizer), hash(text))
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                self._hits += 1
+                return count
+            self._misses += 1
+        count = len(tokenizer(text))
+        with self._lock:
+            self._counts[key] = count
+            if len(self._counts) > self._max_size:
+                self._counts.popitem(last=False)
+        return count
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self._hits = 0
+            self._misses = 0
+
+
+_token_cache = TokenCountCache()
+
+
+def get_token_cache() -> TokenCountCache:
+    return _token_cache
+
+
+def count_tokens(text: str, tokenizer: Callable[[str], list] | None = None) -> int:
+    return _token_cache.count(text, tokenizer)
+
+
+def set_token_count(node: BaseNode) -> None:
+    """
+    Stores the token count of the LLM view of a node in its metadata.
+
+    The key is excluded from the embedded and LLM texts, so storing it does
+    not change what it counts.
+
+    Args:
+        node (BaseNode): The node, updated in place.
+    """
+    for keys in (node.excluded_embed_metadata_keys, node.excluded_llm_metadata_keys):
+        if TOKEN_COUNT_KEY not in keys:
+            keys.append(TOKEN_COUNT_KEY)
+    node.metadata.pop(TOKEN_COUNT_KEY, None)
+    node.metadata[TOKEN_COUNT_KEY] = count_tokens(
+        node.get_content(metadata_mode=MetadataMode.LLM)
+    )
+
+
+def node_token_count(node: BaseNode) -> int:
+    """
+    Returns the number of tokens of the LLM view of a node.
+
+    Args:
+        node (BaseNode): The node.
+
+    Returns:
+        int: The count stored at ingestion, or the cached count.
+    """
+    token_count = node.metadata.get(TOKEN_COUNT_KEY)
+    if token_count is not None:
+        return int(token_count)
+    return count_tokens(node.get_content(metadata_mode=MetadataMode.LLM))
+
+
+def get_context_token_budget(setting: RAGSettings | None = None) -> int:
+    """
+    Returns the number of tokens retrieved context may use in a prompt.
+
+    Args:
+        setting (RAGSettings | None): The RAG settings (default: None).
+
+    Returns:
+        int: RETRIEVER.CONTEXT_TOKEN_RATIO of OLLAMA.CONTEXT_WINDOW.
+    """
+    setting = setting or RAGSettings()
+    return int(
+        setting.OLLAMA.CONTEXT_WINDOW * setting.RETRIEVER.CONTEXT_TOKEN_RATIO
+    )
+
+
+def get_chat_token_budget(setting: RAGSettings | None = None) -> int:
+    """
+    Returns the number of tokens chat history may use in a prompt.
+
+    Args:
+        setting (RAGSettings | None): The RAG settings (default: None).
+
+    Returns:
+        int: OLLAMA.CHAT_TOKEN_RATIO of OLLAMA.CONTEXT_WINDOW, at most OLLAMA.CHAT_TOKEN_LIMIT.
+    """
+    setting = setting or RAGSettings()
+    return min(
+        setting.OLLAMA.CHAT_TOKEN_LIMIT,
+        int(setting.OLLAMA.CONTEXT_WINDOW * setting.OLLAMA.CHAT_TOKEN_RATIO),
+    )
+
+
+def get_prompt_token_budget(setting: RAGSettings | None = None) -> int:
+    """
+    Returns the number of tokens the retrieved context and chat history may use together.
+
+    The QA chat memory gets this limit, so a full context leaves the chat
+    history budget for the prompt around it and the history.
+
+    Args:
+        setting (RAGSettings | None): The RAG settings (default: None).
+
+    Returns:
+        int: The context and chat token budgets combined.
+    """
+    return get_context_token_budget(setting) + get_chat_token_budget(setting)
@@ -1,11 +1,26 @@
+import hashlib
+import json
+import os
 import chromadb
 
 from llama_index.core import VectorStoreIndex, StorageContext
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.storage.docstore import SimpleDocumentStore
 from llama_index.vector_stores.chroma import ChromaVectorStore
 
+from .metadata import LegalMetadataExtractor
 from ..settings import RAGSettings
 
 
+def content_hash(nodes: list[BaseNode]) -> str:
+    """Hash of the chunk texts of a document, unchanged by embedding them."""
+    digest = hashlib.sha256()
+    for node in nodes:
+        digest.update(node.get_content(metadata_mode=MetadataMode.NONE).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
 class LocalVectorStoreFactory:
     def __init__(
         self,
@@ -16,8 +31,16 @@ class LocalVectorStoreFactory:
         self._setting = setting or RAGSettings()
         self._persist_dir = self._setting.STORAGE.PERSIST_DIR
         self._collection_name = self._setting.STORAGE.COLLECTION_NAME
+        self._docstore_path = os.path.join(
+            self._persist_dir, f"{self._collection_name}_docstore.json"
+        )
+        self._manifest_path = os.path.join(
+            self._persist_dir, f"{self._collection_name}_shards.json"
+        )
 
     def check_exist_vector_store_index(self) -> bool:
+        if self._setting.STORAGE.SHARDING:
+            return bool(self.get_manifest())
         db = chromadb.PersistentClient(path=self._persist_dir)
         try:
             _ = db.get_collection(self._collection_name)
@@ -25,7 +48,228 @@ class LocalVectorStoreFactory:
             return False
         return True
 
-    def get_or_create_vector_store_index(self, nodes) -> VectorStoreIndex:
+    def get_embedding_metadata(self) -> dict:
+        """
+        Returns the collection metadata recording how its vectors were embedded.
+
+        Returns:
+            dict: The embedding model and EMBED_DIM (0 for full-dimension vectors).
+        """
+        return {
+            "embed_model": self._setting.INGESTION.EMBED_LLM,
+            "embed_dim": self._setting.INGESTION.EMBED_DIM or 0,
+        }
+
+    def check_embedding(self, collection) -> None:
+        """
+        Rejects a collection embedded with another model or dimension.
+
+        Queries embedded differently than the stored vectors either fail in
+        the search or return meaningless neighbours. Collections created
+        without the metadata are checked by the length of a stored vector.
+
+        Args:
+            collection (chromadb.Collection): The Chroma collection.
+
+        Raises:
+            ValueError: If the settings do not match the collection.
+        """
+        expected = self.get_embedding_metadata()
+        metadata = collection.metadata or {}
+        if "embed_dim" in metadata:
+            found = {key: metadata.get(key) for key in expected}
+            if found != expected:
+                raise ValueError(
+                    f"Collection '{self._collection_name}' was embedded with "
+                    f"{found}, but the settings use {expected}. Re-ingest the "
+                    f"documents or change EMBED_LLM and EMBED_DIM."
+                )
+            return
+        embed_dim = self._setting.INGESTION.EMBED_DIM
+        if embed_dim is None:
+            return
+        embeddings = collection.peek(1)["embeddings"]
+        if len(embeddings) and len(embeddings[0]) != embed_dim:
+            raise ValueError(
+                f"Collection '{self._collection_name}' holds "
+                f"{len(embeddings[0])}-dimensional vectors, but EMBED_DIM is "
+                f"{embed_dim}."
+            )
+
+    def get_docstore(self) -> SimpleDocumentStore:
+        if os.path.exists(self._docstore_path):
+            return SimpleDocumentStore.from_persist_path(self._docstore_path)
+        return SimpleDocumentStore()
+
+    def persist_docstore(
+        self, nodes: list[BaseNode], file_names: list[str] | None = None
+    ) -> None:
+        """
+        Adds nodes to the docstore.
+
+        Args:
+            nodes (list[BaseNode]): The nodes to add.
+            file_names (list[str] | None): Files whose stored nodes are deleted first (default: None).
+        """
+        docstore = self.get_docstore()
+        if file_names:
+            for doc_id, node in list(docstore.docs.items()):
+                if node.metadata.get("file_name") in file_names:
+                    docstore.delete_document(doc_id)
+        docstore.add_documents(nodes)
+        docstore.persist(self._docstore_path)
+
+    def get_manifest(self) -> dict[str, dict]:
+        """
+        Returns the shard manifest.
+
+        Returns:
+            dict[str, dict]: The collection, act metadata, node count and
+            hash of the shard of every file name.
+        """
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        return {}
+
+    def _save_manifest(self, manifest: dict[str, dict]) -> None:
+        os.makedirs(self._persist_dir, exist_ok=True)
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self._manifest_path)
+
+    def shard_name(self, file_name: str, nodes_hash: str) -> str:
+        """
+        Name of the collection of a file, valid for Chroma whatever the file name.
+
+        The name includes the shard hash, so a changed shard is written
+        to a new collection next to the one being served.
+        """
+        suffix = hashlib.sha1(file_name.encode()).hexdigest()[:16]
+        return f"{self._collection_name}-{suffix}-{nodes_hash[:8]}"
+
+    def shard_hash(self, nodes: list[BaseNode]) -> str:
+        """
+        Hash of the chunk texts of a shard and of how they are embedded.
+
+        A change of EMBED_LLM or EMBED_DIM changes the hash, so the shards
+        embedded with the previous settings are re-embedded.
+        """
+        digest = hashlib.sha256(content_hash(nodes).encode())
+        digest.update(
+            json.dumps(self.get_embedding_metadata(), sort_keys=True).encode()
+        )
+        return digest.hexdigest()
+
+    def is_shard_current(self, file_name: str, nodes: list[BaseNode]) -> bool:
+        """Whether the shard of a file already holds these nodes, embedded with the current settings."""
+        shard = self.get_manifest().get(file_name)
+        return shard is not None and shard["hash"] == self.shard_hash(nodes)
+
+    def _open_index(self, collection) -> VectorStoreIndex:
+        vector_store = ChromaVectorStore(chroma_collection=collection)
+        storage_context = StorageContext.from_defaults(vector_store=vector_store)
+        return VectorStoreIndex.from_vector_store(
+            vector_store, storage_context=storage_context
+        )
+
+    def get_or_create_shard_indexes(
+        self,
+        nodes: list[BaseNode],
+        parent_nodes: list[BaseNode] | None = None,
+    ) -> dict[str, VectorStoreIndex]:
+        """
+        Returns the index of every shard, writing the shards of changed files.
+
+        Nodes are grouped by file name, one collection per file (act). A
+        shard is only rewritten when the chunk texts of its file or the
+        embedding settings changed, so adding or replacing a law touches its
+        shard alone. Shards of files
+        not among the nodes are opened as they are.
+
+        A changed shard is built in a new collection and its parent nodes
+        replace those of the file in the docstore. Only then does the
+        manifest point to the new collection, and the old one is deleted,
+        so an interrupted rebuild leaves the previous shard served.
+
+        Args:
+            nodes (list[BaseNode]): Embedded nodes of the ingested files.
+            parent_nodes (list[BaseNode] | None): Parent nodes to store in the docstore.
+
+        Returns:
+            dict[str, VectorStoreIndex]: The index of every shard, by file name.
+        """
+        db = chromadb.PersistentClient(path=self._persist_dir)
+        manifest = self.get_manifest()
+        groups: dict[str, list[BaseNode]] = {}
+        for node in nodes:
+            groups.setdefault(node.metadata.get("file_name", ""), []).append(node)
+        parents: dict[str, list[BaseNode]] = {}
+        for node in parent_nodes or []:
+            parents.setdefault(node.metadata.get("file_name", ""), []).append(node)
+
+        for file_name, group in groups.items():
+            shard = manifest.get(file_name)
+            nodes_hash = self.shard_hash(group)
+            if shard is not None and shard["hash"] == nodes_hash:
+                continue
+            name = self.shard_name(file_name, nodes_hash)
+            try:
+                # Left over by an interrupted rebuild, never served.
+                db.delete_collection(name)
+            except Exception:
+                pass
+            collection = db.create_collection(
+                name, metadata=self.get_embedding_metadata()
+            )
+            ChromaVectorStore(chroma_collection=collection).add(group)
+            self.persist_docstore(parents.get(file_name, []), [file_name])
+            manifest[file_name] = {
+                "collection": name,
+                **LegalMetadataExtractor().document_metadata(file_name),
+                "nodes": len(group),
+                "hash": nodes_hash,
+            }
+            # Saved per shard, so an interrupted run keeps the finished ones.
+            self._save_manifest(manifest)
+            if shard is not None and shard["collection"] != name:
+                try:
+                    db.delete_collection(shard["collection"])
+                except Exception:
+                    pass
+
+        indexes = {}
+        for file_name, shard in manifest.items():
+            collection = db.get_collection(shard["collection"])
+            self.check_embedding(collection)
+            indexes[file_name] = self._open_index(collection)
+        return indexes
+
+    def get_or_create_vector_store_indexes(
+        self,
+        nodes: list[BaseNode],
+        parent_nodes: list[BaseNode] | None = None,
+    ) -> list[VectorStoreIndex]:
+        """
+        Returns the indexes of the store: every shard, or the one collection.
+
+        Args:
+            nodes (list[BaseNode]): Embedded nodes of the ingested files.
+            parent_nodes (list[BaseNode] | None): Parent nodes to store in the docstore.
+
+        Returns:
+            list[VectorStoreIndex]: The indexes.
+        """
+        if self._setting.STORAGE.SHARDING:
+            return list(
+                self.get_or_create_shard_indexes(nodes, parent_nodes).values()
+            )
+        return [self.get_or_create_vector_store_index(nodes, parent_nodes)]
+
+    def get_or_create_vector_store_index(
+        self, nodes, parent_nodes: list[BaseNode] | None = None
+    ) -> VectorStoreIndex:
         db = chromadb.PersistentClient(path=self._persist_dir)
         col_exists = True
         try:
@@ -34,6 +278,7 @@ class LocalVectorStoreFactory:
             col_exists = False
 
         if col_exists:
+            self.check_embedding(collection)
             vector_store = ChromaVectorStore(chroma_collection=collection)
             storage_context = StorageContext.from_defaults(
                 vector_store=vector_store
@@ -42,7 +287,9 @@ class LocalVectorStoreFactory:
                 vector_store, storage_context=storage_context
             )
         else:
-            collection = db.create_collection(self._collection_name)
+            collection = db.create_collection(
+                self._collection_name, metadata=self.get_embedding_metadata()
+            )
             vector_store = ChromaVectorStore(chroma_collection=collection)
             storage_context = StorageContext.from_defaults(
                 vector_store=vector_store
@@ -50,5 +297,7 @@ class LocalVectorStoreFactory:
             index = VectorStoreIndex(
                 nodes=nodes, storage_context=storage_context
             )
+            if parent_nodes:
+                self.persist_docstore(parent_nodes)
 
         return index
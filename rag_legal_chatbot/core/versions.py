@@ -0,0 +1,348 @@
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable
+
+from llama_index.core.llms.llm import LLM
+
+from .doc2query import QuestionIndexer
+from .ingestion import LocalDataIngestion
+from .metadata import cites
+from .retriever import LocalRetrieverFactory
+from .vector_store import LocalVectorStoreFactory
+
+from ..settings import RAGSettings
+
+
+class IndexVersions:
+    """
+    Blue/green versions of the vector store.
+
+    Every build goes to a new directory, versions/<version> in PERSIST_DIR,
+    with its own Chroma database, docstore and manifests, so the serving
+    index is never written to. A build is validated with a retrieval smoke
+    test and only then made active by atomically replacing versions.json,
+    which serving processes poll to switch without a restart. Versions
+    beyond KEEP_VERSIONS are deleted. Without an active version the store
+    in PERSIST_DIR itself is served.
+
+    Args:
+        setting (RAGSettings | None): The RAG settings (default: None).
+    """
+
+    def __init__(self, setting: RAGSettings | None = None) -> None:
+        self._setting = setting or RAGSettings()
+        self._root = self._setting.STORAGE.PERSIST_DIR
+        self._path = os.path.join(self._root, "versions.json")
+
+    def _load(self) -> dict:
+        if os.path.exists(self._path):
+            with open(self._path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        return {"active": None, "versions": {}}
+
+    def _save(self, state: dict) -> None:
+        os.makedirs(self._root, exist_ok=True)
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(state, file, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self._path)
+
+    def _update(self, version: str, **info) -> None:
+        state = self._load()
+        state["versions"].setdefault(version, {}).update(info)
+        self._save(state)
+
+    @property
+    def active(self) -> str | None:
+        return self._load()["active"]
+
+    @property
+    def versions(self) -> dict[str, dict]:
+        return self._load()["versions"]
+
+    def version_dir(self, version: str) -> str:
+        return os.path.join(self._root, "versions", version)
+
+    def setting_for(self, version: str | None) -> RAGSettings:
+        """
+        Returns the settings reading and writing the store of a version.
+
+        Args:
+            version (str | None): The version, None for the store in PERSIST_DIR.
+
+        Returns:
+            RAGSettings: A copy of the settings with the PERSIST_DIR of the version.
+        """
+        setting = self._setting.model_copy(deep=True)
+        if version is not None:
+            setting.STORAGE.PERSIST_DIR = self.version_dir(version)
+        return setting
+
+    def active_setting(self) -> RAGSettings:
+        return self.setting_for(self.active)
+
+    def build(
+        self, llm: LLM | None = None, input_json: str | None = None
+    ) -> str | None:
+        """
+        Ingests the documents into a new version and activates it if it passes the smoke test.
+
+        The questions generated by doc2query for the active version are
+        copied over, and with an llm the questions of new chunks are
+        generated and indexed, so the new version keeps its pointers.
+
+        Args:
+            llm (LLM | None): LLM generating doc2query questions (default: None).
+            input_json (str | None): Test questions of the smoke test (default: None).
+
+        Returns:
+            str | None: The activated version, None if the build failed.
+        """
+        version = datetime.now().strftime("v%Y%m%d-%H%M%S")
+        setting = self.setting_for(version)
+        os.makedirs(self.version_dir(version), exist_ok=True)
+        self._update(version, status="building", created=time.time())
+        print(f"Building index version {version}")
+
+        try:
+            ingestion = LocalDataIngestion(setting)
+            ingestion.process_documents()
+            ingestion.store_nodes()
+            nodes = ingestion.get_ingested_nodes()
+            LocalVectorStoreFactory(
+                setting=setting
+            ).get_or_create_vector_store_indexes(
+                nodes, ingestion.get_ingested_parent_nodes()
+            )
+            questions = f"{setting.STORAGE.COLLECTION_NAME}_questions.json"
+            active_questions = os.path.join(
+                self.active_setting().STORAGE.PERSIST_DIR, questions
+            )
+            if llm is not None and os.path.exists(active_questions):
+                shutil.copyfile(
+                    active_questions,
+                    os.path.join(self.version_dir(version), questions),
+                )
+                QuestionIndexer(llm=llm, setting=setting).index()
+            smoke = self.validate(setting, input_json)
+        except Exception as e:
+            print(f"Error building index version {version}: {e}")
+            self._update(version, status="failed", error=str(e))
+            self.gc()
+            return None
+
+        self._update(version, nodes=len(nodes), smoke=smoke)
+        if not smoke["passed"]:
+            print(f"Index version {version} failed the smoke test: {smoke}")
+            self._update(version, status="failed")
+            self.gc()
+            return None
+        self.activate(version)
+        return version
+
+    def validate(
+        self, setting: RAGSettings, input_json: str | None = None
+    ) -> dict:
+        """
+        Smoke-tests the retrieval of a built version.
+
+        The first SMOKE_QUESTIONS test questions are retrieved without query
+        fusion. The version passes if every question retrieves nodes and its
+        accuracy, the share of questions retrieving the expected law and
+        section, is at most SMOKE_TOLERANCE below that of the active version.
+        Without test questions, one probe query must retrieve nodes.
+
+        Args:
+            setting (RAGSettings): The settings of the version.
+            input_json (str | None): Test questions, in the format of data/test_questions.json.
+
+        Returns:
+            dict: Whether it passed, the accuracy, the baseline and the latency.
+        """
+        entries = []
+        if input_json and os.path.exists(input_json):
+            with open(input_json, "r", encoding="utf-8") as file:
+                entries = json.load(file)[: self._setting.STORAGE.SMOKE_QUESTIONS]
+        queries = [entry["question"] for entry in entries] or ["§ 1"]
+
+        smoke_setting = setting.model_copy(deep=True)
+        smoke_setting.RETRIEVER.QUERY_FUSION = False
+        retriever = LocalRetrieverFactory(smoke_setting).get_retrievers(nodes=[])
+
+        seconds, empty, hits = [], 0, 0
+        for index, query in enumerate(queries):
+            started = time.perf_counter()
+            nodes = retriever.retrieve(query)
+            seconds.append(time.perf_counter() - started)
+            empty += not nodes
+            if entries:
+                hits += any(
+                    cites(node, entries[index].get("law"), entries[index].get("section"))
+                    for node in nodes
+                )
+
+        accuracy = round(hits / len(entries), 3) if entries else None
+        baseline = (
+            self.versions.get(self.active, {}).get("smoke", {}).get("accuracy")
+            if self.active
+            else None
+        )
+        passed = empty == 0 and (
+            accuracy is None
+            or baseline is None
+            or accuracy >= baseline - self._setting.STORAGE.SMOKE_TOLERANCE
+        )
+        return {
+            "passed": passed,
+            "questions": len(queries),
+            "empty": empty,
+            "accuracy": accuracy,
+            "baseline": baseline,
+            "mean_seconds": round(statistics.mean(seconds), 3),
+        }
+
+    def activate(self, version: str) -> None:
+        """
+        Makes a version the one served, then deletes old versions.
+
+        Args:
+            version (str): The version.
+        """
+        state = self._load()
+        previous = state["active"]
+        if previous in state["versions"]:
+            state["versions"][previous]["status"] = "ready"
+        state["versions"].setdefault(version, {})["status"] = "active"
+        state["active"] = version
+        self._save(state)
+        print(f"Activated index version {version}")
+        self.gc()
+
+    def gc(self) -> list[str]:
+        """
+        Deletes failed versions and all but the newest KEEP_VERSIONS, the active one included.
+
+        Versions still building are left alone. The previous version is
+        kept by default, as serving processes switch to a new version a
+        poll interval after it is activated.
+
+        Returns:
+            list[str]: The deleted versions.
+        """
+        state = self._load()
+        keep = max(1, self._setting.STORAGE.KEEP_VERSIONS)
+        ready = sorted(
+            (
+                version
+                for version, info in state["versions"].items()
+                if info.get("status") == "ready"
+            ),
+            reverse=True,
+        )
+        kept = ready[: keep - 1] if state["active"] else ready[:keep]
+        deleted = [
+            version
+            for version, info in state["versions"].items()
+            if info.get("status") in ("ready", "failed") and version not in kept
+        ]
+        for version in deleted:
+            shutil.rmtree(self.version_dir(version), ignore_errors=True)
+            del state["versions"][version]
+        if deleted:
+            self._save(state)
+            print(f"Deleted index versions: {', '.join(deleted)}")
+        return deleted
+
+    def start_build(
+        self, host: str = "host.docker.internal", input_json: str | None = None
+    ) -> subprocess.Popen:
+        """
+        Builds a new version in a background process.
+
+        The build runs in its own process with BUILD_NICENESS, so parsing
+        and embedding do not hold the interpreter lock or the CPU of the
+        process serving queries.
+
+        Args:
+            host (str): Host of the Ollama server.
+            input_json (str | None): Test questions of the smoke test (default: None).
+
+        Returns:
+            subprocess.Popen: The build process.
+        """
+        command = [
+            sys.executable,
+            "-m",
+            "rag_legal_chatbot",
+            "--mode",
+            "reindex",
+            "--host",
+            host,
+        ]
+        if input_json:
+            command += ["--input_json", input_json]
+        niceness = self._setting.STORAGE.BUILD_NICENESS
+        return subprocess.Popen(
+            command,
+            preexec_fn=(lambda: os.nice(niceness)) if os.name == "posix" else None,
+        )
+
+
+class VersionWatcher:
+    """
+    Polls the active index version in the background.
+
+    Args:
+        versions (IndexVersions): The index versions.
+        on_change (Callable[[str | None], None]): Called with a newly activated version.
+        interval (float): Seconds between polls (default: 5).
+    """
+
+    def __init__(
+        self,
+        versions: IndexVersions,
+        on_change: Callable[[str | None], None],
+        interval: float = 5,
+    ) -> None:
+        self._versions = versions
+        self._on_change = on_change
+        self._interval = interval
+        self._version: str | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def watch(self, version: str | None) -> None:
+        """
+        Starts polling, switching whenever the active version differs from version.
+
+        Args:
+            version (str | None): The version being served.
+        """
+        self._version = version
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="version-watcher", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            try:
+                active = self._versions.active
+                if active != self._version:
+                    self._on_change(active)
+                    self._version = active
+            except Exception as e:
+                # Retried at the next poll.
+                print(f"Error switching index version: {e}")
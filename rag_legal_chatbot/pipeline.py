@@ -9,7 +9,60 @@ from .core import (
     LocalEmbeddingFactory,
 )
 
+from .core.chat_engine import (
+    LocalCondensePlusContextChatEngine,
+    LocalSimpleChatEngine,
+)
+from .core.doc2query import QuestionIndexer
+from .core.jobs import IngestionJob, IngestionWorker
+from .core.llm import ModelKeeper
+from .core.versions import IndexVersions, VersionWatcher
+from .core.router import RoutingOllama
 from .core.prompts import SystemPrompt
+from .settings import RAGSettings
+
+
+class ChatSession:
+    """
+    The chat engine, history and sources of one UI session.
+
+    The engine is forked from the pipeline engine on the first query and
+    again whenever the pipeline engine is replaced, so concurrent sessions
+    never share a chat memory.
+    """
+
+    def __init__(self) -> None:
+        self.engine: (
+            LocalCondensePlusContextChatEngine | LocalSimpleChatEngine | None
+        ) = None
+        self.source = None
+        self.sources: list[str] = []
+        self._history_turns: list[tuple[str, str]] = []
+        self._history: list[ChatMessage] = []
+
+    def get_history(self, chatbot: list[list[str]]) -> list[ChatMessage]:
+        turns = [(chat[0], chat[1]) for chat in chatbot if chat[0]]
+        # The Gradio history grows by one turn per query, so only new turns
+        # are converted.
+        known = len(self._history_turns)
+        if turns[:known] != self._history_turns:
+            self._history_turns = []
+            self._history = []
+        for user, assistant in turns[len(self._history_turns) :]:
+            self._history.append(ChatMessage(role=MessageRole.USER, content=user))
+            self._history.append(
+                ChatMessage(role=MessageRole.ASSISTANT, content=assistant)
+            )
+        self._history_turns = turns
+        # A copy, since the chat store appends to the list it is given.
+        return list(self._history)
+
+    def reset(self) -> None:
+        if self.engine is not None:
+            self.engine.reset()
+        self.sources = []
+        self._history_turns = []
+        self._history = []
 
 
 class LocalRAGPipeline:
@@ -19,14 +72,29 @@ class LocalRAGPipeline:
         self._model_name = "gpt-4o-mini"
         self._chat_mode = "QA"
 
-        self._engine = LocalChatEngineFactory(host=host)
+        self._versions = IndexVersions()
+        self._index_version = self._versions.active
+        self._setting = self._versions.setting_for(self._index_version)
+        self._build = None
+        self._engine = LocalChatEngineFactory(setting=self._setting, host=host)
         self._default_model = LocalRAGModelFactory.set_model(
             self._model_name, host=host
         )
+        self._model_keeper = ModelKeeper(
+            interval=RAGSettings().OLLAMA.KEEP_WARM_INTERVAL
+        )
+        self._model_keeper.watch(self._default_model)
         self._query_engine = None
-        self._ingestion = LocalDataIngestion()
+        self._ingestion = LocalDataIngestion(self._setting)
+        self._ingestion_worker = IngestionWorker()
         Settings.llm = LocalRAGModelFactory.set_model(host=host)
         Settings.embed_model = LocalEmbeddingFactory.set_embedding(host=host)
+        self._version_watcher = VersionWatcher(
+            self._versions,
+            self.switch_index,
+            interval=self._setting.STORAGE.VERSION_POLL_INTERVAL,
+        )
+        self._version_watcher.watch(self._index_version)
 
     ##########
     # BASICS #
@@ -48,9 +116,105 @@ class LocalRAGPipeline:
     def store_nodes(self) -> None:
         self._ingestion.store_nodes()
 
+    def start_ingestion(self) -> IngestionJob:
+        """
+        Ingests the documents in the background, then sets the chat engine.
+
+        Until the job is done, set_engine() leaves the engine unset, so no
+        empty collection is created before the nodes are embedded.
+
+        Returns:
+            IngestionJob: The job, with its progress.
+        """
+        return self._ingestion_worker.submit("ingest", self._ingest)
+
+    def _ingest(self, job: IngestionJob) -> None:
+        self._ingestion.process_documents()
+        self._ingestion.store_nodes(job=job)
+        self._set_engine()
+        print("Finished ingesting data.")
+
+    def pause_ingestion(self) -> None:
+        self._ingestion_worker.pause()
+
+    def resume_ingestion(self) -> None:
+        self._ingestion_worker.resume()
+
+    def is_indexing(self) -> bool:
+        return self._ingestion_worker.busy
+
+    def is_ready(self) -> bool:
+        return self._query_engine is not None
+
+    def get_ingestion_status(self) -> dict:
+        return {
+            "ready": self.is_ready(),
+            "paused": self._ingestion_worker.paused,
+            "jobs": self._ingestion_worker.jobs,
+        }
+
     def check_store_exists(self) -> bool:
         return self._engine.check_store_exists()
 
+    def index_questions(self) -> int:
+        return QuestionIndexer(
+            llm=self._default_model, setting=self._setting
+        ).index(
+            nodes=self._ingestion.get_ingested_nodes(),
+            parent_nodes=self._ingestion.get_ingested_parent_nodes(),
+        )
+
+    def reindex(self, input_json: str | None = "data/test_questions.json") -> bool:
+        """
+        Starts a blue/green build of a new index version in the background.
+
+        Queries keep using the current version; the version watcher switches
+        to the new one once the build has passed its smoke test.
+
+        Args:
+            input_json (str | None): Test questions of the smoke test.
+
+        Returns:
+            bool: False if a build is already running.
+        """
+        if self._build is not None and self._build.poll() is None:
+            return False
+        self._build = self._versions.start_build(self._host, input_json)
+        return True
+
+    def switch_index(self, version: str | None) -> None:
+        """
+        Switches the served index to another version without a restart.
+
+        The new engine is built beside the old one, then swapped in with a
+        single assignment, so every query runs against one complete version
+        and sessions that are still answering finish on the old one.
+
+        Args:
+            version (str | None): The version, None for the store in PERSIST_DIR.
+        """
+        setting = self._versions.setting_for(version)
+        engine = LocalChatEngineFactory(setting=setting, host=self._host)
+        query_engine = engine.set_engine(
+            llm=self._default_model,
+            nodes=[],
+            language=self._language,
+            chat_mode=self._chat_mode,
+        )
+        self._setting = setting
+        self._engine = engine
+        self._ingestion = LocalDataIngestion(setting)
+        self._query_engine = query_engine
+        self._index_version = version
+        print(f"Serving index version {version}")
+
+    def get_index_status(self) -> dict:
+        return {
+            "version": self._index_version,
+            "building": self._build is not None and self._build.poll() is None,
+            "versions": self._versions.versions,
+        }
+
     #############
     # LLM MODEL #
     #############
@@ -62,6 +226,7 @@ class LocalRAGPipeline:
             host=self._host,
         )
         self._default_model = Settings.llm
+        self._model_keeper.watch(self._default_model)
 
     def pull_model(self, model_name: str):
         return LocalRAGModelFactory.pull(self._host, model_name)
@@ -69,16 +234,35 @@ class LocalRAGPipeline:
     def check_exist(self, model_name: str) -> bool:
         return LocalRAGModelFactory.check_model_exist(self._host, model_name)
 
+    def get_model_status(self) -> str:
+        status = f"{self._model_name}: {self._model_keeper.status()}"
+        if isinstance(self._default_model, RoutingOllama):
+            for backend in self._default_model.stats:
+                state = "up" if backend["healthy"] else "down"
+                status += (
+                    f"\n{backend['url']}: {state}, "
+                    f"{backend['in_flight']} in flight, "
+                    f"{backend['mean_seconds']}s mean"
+                )
+        return status
+
     ###########
     # ENGINGE #
     ###########
 
     def set_engine(self):
+        # Set by the ingestion job once the nodes are stored.
+        if self.is_indexing():
+            return
+        self._set_engine()
+
+    def _set_engine(self):
         self._query_engine = self._engine.set_engine(
             llm=self._default_model,
             nodes=self._ingestion.get_ingested_nodes(),
             language=self._language,
             chat_mode=self._chat_mode,
+            parent_nodes=self._ingestion.get_ingested_parent_nodes(),
         )
 
     def reset_engine(self):
@@ -90,45 +274,64 @@ class LocalRAGPipeline:
         self.set_model()
         self.set_engine()
 
+    def new_session(
+        self,
+    ) -> LocalCondensePlusContextChatEngine | LocalSimpleChatEngine:
+        """Returns a chat engine with its own memory, sharing the loaded retriever and LLM."""
+        return self._query_engine.fork()
+
     ################
     # CONVERSATION #
     ################
 
-    def clear_conversation(self):
-        self._query_engine.reset()
+    def get_session(self, session: ChatSession | None = None) -> ChatSession:
+        """
+        Returns a session whose engine is forked from the current pipeline engine.
 
-    def get_history(self, chatbot: list[list[str]]):
-        history = []
-        for chat in chatbot:
-            if chat[0]:
-                history.append(
-                    ChatMessage(role=MessageRole.USER, content=chat[0])
-                )
-                history.append(
-                    ChatMessage(role=MessageRole.ASSISTANT, content=chat[1])
-                )
-        return history
+        Args:
+            session (ChatSession | None): Session to refresh (default: a new one).
+
+        Returns:
+            ChatSession: The session.
+        """
+        session = session or ChatSession()
+        # Read once, as the index may be switched in the meantime.
+        query_engine = self._query_engine
+        if session.source is not query_engine:
+            session.engine = query_engine.fork()
+            session.source = query_engine
+        return session
 
     #########
     # QUERY #
     #########
 
     def query(
-        self, chat_mode: str, message: str, chatbot: list[list[str]]
+        self,
+        chat_mode: str,
+        message: str,
+        chatbot: list[list[str]],
+        session: ChatSession | None = None,
     ) -> StreamingAgentChatResponse:
+        session = self.get_session(session)
         if chat_mode == "chat":
-            history = self.get_history(chatbot)
-            return self._query_engine.stream_chat(message, history)
+            history = session.get_history(chatbot)
+            return session.engine.stream_chat(message, history)
         else:
-            self._query_engine.reset()
-            return self._query_engine.stream_chat(message)
+            session.engine.reset()
+            return session.engine.stream_chat(message)
 
     async def aquery(
-        self, mode: str, message: str, chatbot: list[list[str]]
+        self,
+        mode: str,
+        message: str,
+        chatbot: list[list[str]],
+        session: ChatSession | None = None,
     ) -> StreamingAgentChatResponse:
+        session = self.get_session(session)
         if mode == "chat":
-            history = self.get_history(chatbot)
-            return await self._query_engine.astream_chat(message, history)
+            history = session.get_history(chatbot)
+            return await session.engine.astream_chat(message, history)
         else:
-            self._query_engine.reset()
-            return await self._query_engine.astream_chat(message)
+            session.engine.reset()
+            return await session.engine.astream_chat(message)
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Literal
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from llama_index.core.chat_engine.types import StreamingAgentChatResponse
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+from .core.admission import Ticket, get_admission_controller
+from .core.cancellation import CancellableChatResponse, get_generation_stats
+from .core.prompt_cache import get_prompt_cache_stats
+from .core.rerank import get_rerank_cache
+from .pipeline import LocalRAGPipeline
+from .settings import RAGSettings
+
+
+class HistoryMessage(BaseModel):
+    role: Literal["user", "assistant"]
+    content: str
+
+
+class QueryRequest(BaseModel):
+    question: str
+    history: list[HistoryMessage] = Field(default=[])
+    stream: bool = Field(default=True, description="Stream tokens as SSE")
+
+
+class BatchRequest(BaseModel):
+    questions: list[str]
+
+
+def _source(node: NodeWithScore) -> dict:
+    return {
+        "id": node.node.node_id,
+        "score": node.score,
+        "metadata": node.node.metadata,
+        "text": node.node.get_content(metadata_mode=MetadataMode.LLM).strip(),
+    }
+
+
+def _event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def create_app(
+    pipeline: LocalRAGPipeline, setting: RAGSettings | None = None
+) -> FastAPI:
+    """
+    Builds the HTTP API around one loaded pipeline.
+
+    Every request gets its own chat session from pipeline.new_session() and
+    passes the admission controller shared with the Gradio UI. Queries that
+    do not fit the queue, or wait in it longer than QUEUE_TIMEOUT, get a
+    503 response.
+
+    Args:
+        pipeline (LocalRAGPipeline): The pipeline, with its chat engine set or its ingestion started.
+        setting (RAGSettings | None): The RAG settings (default: None).
+
+    Returns:
+        FastAPI: The application.
+    """
+    setting = setting or RAGSettings()
+    admission = get_admission_controller(setting)
+    app = FastAPI(title="rag_legal_chatbot")
+
+    def admit(request: Request, limit_user: bool = True) -> Ticket:
+        if not pipeline.is_ready():
+            raise HTTPException(
+                status_code=503,
+                detail="The documents are still being indexed.",
+                headers={"Retry-After": "30"},
+            )
+        user = request.headers.get("X-Session-Id") or (
+            request.client.host if request.client else "anonymous"
+        )
+        ticket = admission.admit(user, limit_user=limit_user)
+        if ticket is None:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many requests, please try again in a moment.",
+                headers={"Retry-After": "5"},
+            )
+        return ticket
+
+    async def wait_turn(ticket: Ticket, request: Request) -> None:
+        """
+        Waits until the query may run, releasing its ticket if it may not.
+
+        The wait runs in POLL_INTERVAL slices, so a client that went away
+        frees its queue slot and threadpool worker, and a query waiting
+        longer than QUEUE_TIMEOUT gets a 503.
+        """
+        deadline = time.monotonic() + setting.ADMISSION.QUEUE_TIMEOUT
+        while not await run_in_threadpool(
+            ticket.wait, setting.ADMISSION.POLL_INTERVAL
+        ):
+            if await request.is_disconnected():
+                ticket.release()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+            if ticket.released or time.monotonic() >= deadline:
+                ticket.release()
+                raise HTTPException(
+                    status_code=503,
+                    detail="The queue is too long, please try again in a moment.",
+                    headers={"Retry-After": "5"},
+                )
+
+    def start_query(
+        question: str, history: list[HistoryMessage]
+    ) -> StreamingAgentChatResponse:
+        chat_history = [
+            ChatMessage(role=MessageRole(message.role), content=message.content)
+            for message in history
+        ]
+        return pipeline.new_session().stream_chat(question, chat_history)
+
+    def cancel(response: StreamingAgentChatResponse) -> None:
+        if isinstance(response, CancellableChatResponse):
+            response.cancel()
+
+    async def answer(
+        question: str,
+        history: list[HistoryMessage],
+        request: Request | None = None,
+    ) -> dict:
+        response = await run_in_threadpool(start_query, question, history)
+        tokens = []
+        async for token in iterate_in_threadpool(response.response_gen):
+            tokens.append(token)
+            # Nobody reads the answer of a client that went away.
+            if request is not None and await request.is_disconnected():
+                cancel(response)
+                raise HTTPException(status_code=499, detail="Client disconnected")
+        return {
+            "question": question,
+            "answer": "".join(tokens),
+            "sources": [_source(node) for node in response.source_nodes],
+        }
+
+    @app.get("/health")
+    async def health() -> dict:
+        return {
+            "model": pipeline.get_model_status(),
+            "admission": admission.stats,
+            "generation": get_generation_stats().stats,
+            "prompt_cache": get_prompt_cache_stats().stats,
+            "rerank_cache": get_rerank_cache().stats,
+            "index": pipeline.get_index_status(),
+            "ingestion": pipeline.get_ingestion_status(),
+        }
+
+    @app.post("/query")
+    async def query(body: QueryRequest, request: Request):
+        ticket = admit(request)
+        if not body.stream:
+            with ticket:
+                await wait_turn(ticket, request)
+                return await answer(body.question, body.history, request)
+        try:
+            await wait_turn(ticket, request)
+            response = await run_in_threadpool(
+                start_query, body.question, body.history
+            )
+        except BaseException:
+            ticket.release()
+            raise
+
+        async def events() -> AsyncIterator[str]:
+            completed = False
+            with ticket:
+                try:
+                    yield _event(
+                        "sources",
+                        [_source(node) for node in response.source_nodes],
+                    )
+                    async for token in iterate_in_threadpool(
+                        response.response_gen
+                    ):
+                        yield _event("token", token)
+                    completed = True
+                finally:
+                    # Closed by Starlette when the client disconnects.
+                    if not completed:
+                        cancel(response)
+                yield _event("done", {})
+
+        # Also released and cancelled if the client leaves before the
+        # stream starts.
+        def abandon() -> None:
+            cancel(response)
+            ticket.release()
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            background=BackgroundTask(abandon),
+        )
+
+    @app.post("/batch")
+    async def batch(body: BatchRequest, request: Request) -> list[dict]:
+        # A batch uses at most MAX_GENERATIONS queue slots at once, so it
+        # shares the LLM fairly with interactive users.
+        slots = asyncio.Semaphore(setting.ADMISSION.MAX_GENERATIONS)
+
+        async def run(question: str) -> dict:
+            async with slots:
+                try:
+                    ticket = admit(request, limit_user=False)
+                except HTTPException as e:
+                    return {"question": question, "error": e.detail}
+                with ticket:
+                    try:
+                        await wait_turn(ticket, request)
+                    except HTTPException as e:
+                        return {"question": question, "error": e.detail}
+                    return await answer(question, [], request)
+
+        return await asyncio.gather(*[run(q) for q in body.questions])
+
+    @app.get("/ingestion")
+    async def ingestion() -> dict:
+        return pipeline.get_ingestion_status()
+
+    @app.post("/ingestion/pause")
+    async def pause_ingestion() -> dict:
+        pipeline.pause_ingestion()
+        return pipeline.get_ingestion_status()
+
+    @app.post("/ingestion/resume")
+    async def resume_ingestion() -> dict:
+        pipeline.resume_ingestion()
+        return pipeline.get_ingestion_status()
+
+    @app.post("/reindex", status_code=202)
+    async def reindex() -> dict:
+        if not pipeline.reindex():
+            raise HTTPException(
+                status_code=409, detail="An index build is already running."
+            )
+        return pipeline.get_index_status()
+
+    return app
+
+
+def serve(
+    pipeline: LocalRAGPipeline, host: str = "0.0.0.0", port: int = 8000
+) -> None:
+    uvicorn.run(create_app(pipeline), host=host, port=port)
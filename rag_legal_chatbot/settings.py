@@ -16,19 +16,73 @@ class OllamaSettings(BaseModel):
     KEEP_ALIVE: str = Field(
         default="1h", description="Keep alive time for the server"
     )
+    KEEP_WARM_INTERVAL: float = Field(
+        default=600,
+        description="Seconds between refreshes of the loaded model (0: only warm up on switch)",
+    )
     TFS_Z: float = Field(default=1.0, description="TFS normalization factor")
     TOP_K: int = Field(default=40, description="Top k sampling")
     TOP_P: float = Field(default=0.9, description="Top p sampling")
     REPEAT_LAST_N: int = Field(default=64, description="Repeat last n tokens")
     REPEAT_PENALTY: float = Field(default=1.1, description="Repeat penalty")
     REQUEST_TIMEOUT: float = Field(default=300, description="Request timeout")
+    CONNECT_TIMEOUT: float = Field(
+        default=10, description="Connection timeout"
+    )
+    MAX_CONNECTIONS: int = Field(
+        default=32, description="Size of the shared HTTP connection pool"
+    )
+    KEEPALIVE_EXPIRY: float = Field(
+        default=300, description="Seconds an idle HTTP connection is kept"
+    )
+    MAX_RETRIES: int = Field(
+        default=3, description="Retries of failed HTTP requests"
+    )
+    RETRY_BACKOFF: float = Field(
+        default=0.5, description="Exponential backoff factor between retries"
+    )
     PORT: int = Field(default=11434, description="Port number")
+    HOSTS: list[str] = Field(
+        default=[],
+        description="Ollama hosts ('host', 'host:port' or URL) to balance over",
+    )
+    HEALTH_CHECK_INTERVAL: float = Field(
+        default=30, description="Seconds between health checks of a host"
+    )
+    STALL_TIMEOUT: float = Field(
+        default=90,
+        description="Seconds a host may hold requests without answering before it is avoided",
+    )
     CONTEXT_WINDOW: int = Field(
         default=8000, description="Context window size"
     )
     TEMPERATURE: float = Field(default=0.1, description="Temperature")
     CHAT_TOKEN_LIMIT: int = Field(
-        default=30000, description="Chat memory limit"
+        default=30000, description="Upper bound of the chat memory"
+    )
+    CHAT_TOKEN_RATIO: float = Field(
+        default=0.25,
+        description="Share of the context window used for chat history",
+    )
+    SUMMARIZE_HISTORY: bool = Field(
+        default=True,
+        description="Fold turns that do not fit into a rolling summary",
+    )
+    SUMMARY_TOKEN_RATIO: float = Field(
+        default=0.25,
+        description="Share of the chat history budget kept for the summary",
+    )
+    CONDENSE_LLM: Union[str, None] = Field(
+        default=None,
+        description="Smaller LLM for condensing follow-up questions",
+    )
+    SKIP_STANDALONE_CONDENSE: bool = Field(
+        default=True,
+        description="Skip condensing follow-ups that are already standalone",
+    )
+    PREFIX_STABLE_PROMPT: bool = Field(
+        default=True,
+        description="Order the QA prompt from the most to the least stable part, so prompt caching hits",
     )
 
 
@@ -44,9 +98,78 @@ class RetrieverSettings(BaseModel):
     RERANK_LLM: str = Field(
         default="BAAI/bge-reranker-large", description="Rerank LLM model"
     )
+    USE_RERANK: bool = Field(
+        default=False,
+        description="Rerank the retrieved nodes with the cross-encoder",
+    )
+    RERANK_CACHE_SIZE: int = Field(
+        default=10000, description="Number of cached rerank scores"
+    )
+    ADAPTIVE_DEPTH: bool = Field(
+        default=False,
+        description="Keep as many candidates as their score distribution justifies",
+    )
+    ADAPTIVE_MIN_K: int = Field(
+        default=2, description="Minimum number of nodes kept by the adaptive depth"
+    )
+    ADAPTIVE_MAX_DROP: float = Field(
+        default=0.15,
+        description="Cut nodes scoring this share below the best score",
+    )
+    ADAPTIVE_MIN_GAP: float = Field(
+        default=0.08,
+        description="Cut at a gap of this share of the best score between neighbours",
+    )
     FUSION_MODE: str = Field(
         default="dist_based_score", description="Fusion mode"
     )
+    QUESTION_POINTERS: bool = Field(
+        default=True,
+        description="Return the chunks of retrieved doc2query questions",
+    )
+    QUERY_FUSION: bool = Field(
+        default=False,
+        description="Search NUM_QUERIES generated queries and fuse the results",
+    )
+    QUERY_GEN_CACHE_SIZE: int = Field(
+        default=1024, description="Number of questions with cached generated queries"
+    )
+    RETRIEVER_MODE: str = Field(
+        default="chroma",
+        description="Vector search backend ('chroma' or exact 'numpy')",
+    )
+    QUANTIZATION: str = Field(
+        default="none",
+        description="Quantized index of the numpy backend ('none', 'int8' or 'binary')",
+    )
+    RESCORE_MULTIPLIER: int = Field(
+        default=4,
+        description="Quantized candidates re-scored in float32 per returned node",
+    )
+    METADATA_FILTERING: bool = Field(
+        default=True,
+        description="Filter the search by acts and sections named in the query",
+    )
+    SMALL_TO_BIG: bool = Field(
+        default=False,
+        description="Search child chunks and return their parent sections",
+    )
+    CONTEXT_TOKEN_RATIO: float = Field(
+        default=0.5,
+        description="Share of the context window used for retrieved context",
+    )
+    CONTEXT_PACKING: bool = Field(
+        default=True,
+        description="Deduplicate, merge and pack context into the token budget",
+    )
+    SPECULATIVE_RETRIEVAL: bool = Field(
+        default=False,
+        description="Retrieve on the raw message while condensing the question",
+    )
+    SPECULATIVE_OVERLAP: float = Field(
+        default=0.6,
+        description="Word overlap below which the condensed question is retrieved again",
+    )
 
 
 class IngestionSettings(BaseModel):
@@ -56,6 +179,10 @@ class IngestionSettings(BaseModel):
     EMBED_API_KEY: Union[str, None] = Field(
         default=os.getenv("API_KEY", None), description="API key"
     )
+    EMBED_DIM: Union[int, None] = Field(
+        default=None,
+        description="Dimensions of shortened (Matryoshka) embeddings (None: full)",
+    )
     EMBED_BATCH_SIZE: int = Field(
         default=8, description="Embedding batch size"
     )
@@ -73,6 +200,25 @@ class IngestionSettings(BaseModel):
         default="\n \n", description="Paragraph separator"
     )
     NUM_WORKERS: int = Field(default=0, description="Number of workers")
+    CHUNKING_MODE: str = Field(
+        default="sentence",
+        description="Node parser ('sentence' or structure-aware 'legal')",
+    )
+    CHILD_CHUNK_SIZE: int = Field(
+        default=1536, description="Legal parser child chunk size"
+    )
+    PARENT_CHUNK_SIZE: int = Field(
+        default=3072, description="Legal parser parent chunk size"
+    )
+    QUESTIONS_PER_CHUNK: int = Field(
+        default=3, description="Questions generated per chunk by doc2query"
+    )
+    QUESTION_BATCH_SIZE: int = Field(
+        default=16, description="Chunks per saved batch of doc2query"
+    )
+    QUESTION_LANGUAGE: str = Field(
+        default="cs", description="Language of the doc2query questions"
+    )
 
 
 class StorageSettings(BaseModel):
@@ -83,6 +229,50 @@ class StorageSettings(BaseModel):
         default="collection", description="Collection name"
     )
     DOCUMENT_DIR: str = Field(default="./data", description="Data directory")
+    SHARDING: bool = Field(
+        default=False,
+        description="Store every act in its own collection, listed in a shard manifest",
+    )
+    KEEP_VERSIONS: int = Field(
+        default=2,
+        description="Index versions kept by blue/green builds, including the active one",
+    )
+    SMOKE_QUESTIONS: int = Field(
+        default=20,
+        description="Test questions retrieved to validate a new index version",
+    )
+    SMOKE_TOLERANCE: float = Field(
+        default=0.1,
+        description="Smoke accuracy a new index version may lose against the active one",
+    )
+    VERSION_POLL_INTERVAL: float = Field(
+        default=5, description="Seconds between checks of the active index version"
+    )
+    BUILD_NICENESS: int = Field(
+        default=10, description="Niceness of the background index build process"
+    )
+
+
+class AdmissionSettings(BaseModel):
+    MAX_QUEUE: int = Field(
+        default=16, description="Maximum number of waiting queries"
+    )
+    MAX_PER_USER: int = Field(
+        default=1, description="Maximum number of queries per user session"
+    )
+    MAX_GENERATIONS: int = Field(
+        default=2, description="Maximum number of queries generating at once"
+    )
+    MAX_RERANKS: int = Field(
+        default=1, description="Maximum number of reranks running at once"
+    )
+    POLL_INTERVAL: float = Field(
+        default=1.0, description="Seconds between queue position updates"
+    )
+    QUEUE_TIMEOUT: float = Field(
+        default=120.0,
+        description="Seconds an API query may wait in the queue before a 503",
+    )
 
 
 class RAGSettings(BaseModel):
@@ -90,3 +280,4 @@ class RAGSettings(BaseModel):
     RETRIEVER: RetrieverSettings = RetrieverSettings()
     INGESTION: IngestionSettings = IngestionSettings()
     STORAGE: StorageSettings = StorageSettings()
+    ADMISSION: AdmissionSettings = AdmissionSettings()
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import sys
 import time
@@ -8,8 +9,11 @@ from typing import ClassVar
 from llama_index.core.schema import MetadataMode
 from llama_index.core.chat_engine.types import StreamingAgentChatResponse
 
-from .pipeline import LocalRAGPipeline
+from .core.admission import Ticket, get_admission_controller
+from .core.cancellation import CancellableChatResponse
+from .pipeline import ChatSession, LocalRAGPipeline
 from .logger import Logger
+from .settings import RAGSettings
 
 
 _JS_LIGHT_THEME = """
@@ -47,6 +51,12 @@ class _DefaultElement:
     DEFAULT_STATUS: str = "Ready!"
     ANSWERING_STATUS: str = "Answering!"
     COMPLETED_STATUS: str = "Completed!"
+    CANCELLED_STATUS: str = "Cancelled!"
+    QUEUED_STATUS: str = "Queued, position {}"
+    BUSY_STATUS: str = "Busy!"
+    BUSY_MESSAGE: str = "Too many requests right now, please try again in a moment."
+    INDEXING_STATUS: str = "Indexing!"
+    INDEXING_MESSAGE: str = "The documents are still being indexed, please try again when they are ready."
 
 
 class LLMResponse:
@@ -76,17 +86,29 @@ class LLMResponse:
         response: StreamingAgentChatResponse,
     ):
         answer = []
-        for text in response.response_gen:
-            answer.append(text)
-            yield (
-                _DefaultElement.DEFAULT_MESSAGE,
-                history + [[message, "".join(answer)]],
-                _DefaultElement.ANSWERING_STATUS,
-            )
+        completed = False
+        try:
+            for text in response.response_gen:
+                answer.append(text)
+                yield (
+                    _DefaultElement.DEFAULT_MESSAGE,
+                    history + [[message, "".join(answer)]],
+                    _DefaultElement.ANSWERING_STATUS,
+                )
+            completed = True
+        finally:
+            # Closed by Gradio when the user leaves: stop generating.
+            if not completed and isinstance(response, CancellableChatResponse):
+                response.cancel()
+        cancelled = getattr(response, "cancelled", False)
         yield (
             _DefaultElement.DEFAULT_MESSAGE,
             history + [[message, "".join(answer)]],
-            _DefaultElement.COMPLETED_STATUS,
+            (
+                _DefaultElement.CANCELLED_STATUS
+                if cancelled
+                else _DefaultElement.COMPLETED_STATUS
+            ),
         )
 
 
@@ -105,7 +127,10 @@ class LocalChatbotApp:
             os.path.join(os.getcwd(), image) for image in avatar_images
         ]
         self._llm_response = LLMResponse()
-        self._sources: list[str] = []
+        self._setting = RAGSettings()
+        self._admission = get_admission_controller(self._setting)
+        # Answer being generated for every session.
+        self._in_flight: dict[str, CancellableChatResponse] = {}
 
     def _change_language(self, language: str):
         self.pipeline.set_language(language)
@@ -117,59 +142,183 @@ class LocalChatbotApp:
         self.pipeline.set_chat_engine()
         gr.Info(f"Change chat mode to {chat_mode}")
 
-    def _get_sources(self):
-        # print("Getting sources:", self._sources)
-        return self._sources
+    def _index_status(self) -> str:
+        status = self.pipeline.get_ingestion_status()
+        jobs = status["jobs"]
+        if not jobs or jobs[-1]["status"] == "done":
+            return "Ready!" if status["ready"] else "No index"
+        job = jobs[-1]
+        if job["status"] == "failed":
+            return f"Indexing failed: {job['error']}"
+        if job["status"] == "queued":
+            return "Indexing queued"
+        text = (
+            f"{'Paused' if job['status'] == 'paused' else 'Indexing'}: "
+            f"{job['files_done']}/"
+            f"{job['files_total']} files, {job['nodes_embedded']}/"
+            f"{job['nodes_total']} nodes embedded"
+        )
+        if job["current_file"]:
+            text += f"\n{job['current_file']}"
+        if job["eta_seconds"] is not None and job["status"] == "running":
+            minutes, seconds = divmod(int(job["eta_seconds"]), 60)
+            text += f"\nETA {minutes}m {seconds:02d}s"
+        return text
+
+    def _pause_indexing(self):
+        self.pipeline.pause_ingestion()
+        gr.Info("Indexing paused")
+
+    def _resume_indexing(self):
+        self.pipeline.resume_ingestion()
+        gr.Info("Indexing resumed")
+
+    def _get_sources(self, session: ChatSession):
+        return session.sources
+
+    @staticmethod
+    def _user(request: gr.Request | None) -> str:
+        user = request.session_hash if request is not None else None
+        return user or "anonymous"
+
+    def _cancel_in_flight(self, user: str) -> bool:
+        response = self._in_flight.pop(user, None)
+        if response is None:
+            return False
+        response.cancel()
+        return True
+
+    def _admit(self, user: str) -> Ticket | None:
+        # A new question replaces the answer still being generated.
+        if self._cancel_in_flight(user):
+            deadline = time.monotonic() + 5
+            ticket = self._admission.admit(user)
+            while ticket is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+                ticket = self._admission.admit(user)
+        else:
+            ticket = self._admission.admit(user)
+        if ticket is None:
+            gr.Warning(_DefaultElement.BUSY_MESSAGE)
+        return ticket
+
+    def _finish(
+        self,
+        user: str,
+        ticket: Ticket,
+        response: CancellableChatResponse | None,
+        completed: bool,
+    ) -> None:
+        """Releases a query, also when Gradio closes its handler at a yield."""
+        ticket.release()
+        if response is None:
+            return
+        if self._in_flight.get(user) is response:
+            del self._in_flight[user]
+        # Nobody reads the rest of an answer whose handler was closed.
+        if not completed:
+            response.cancel()
+
+    def _queued(
+        self, ticket: Ticket, message: str, chatbot: list[list[str, str]]
+    ):
+        return (
+            message,
+            chatbot + [[message, None]],
+            _DefaultElement.QUEUED_STATUS.format(ticket.position),
+        )
 
     def _get_respone(
         self,
         chat_mode: str,
         message: str,
         chatbot: list[list[str, str]],
+        session: ChatSession,
+        request: gr.Request,
         progress: gr.Progress = gr.Progress(track_tqdm=True),
     ):
         if message in [None, ""]:
             for m in self._llm_response.yield_empty_message_string():
                 yield m
-            self._sources = []
-        else:
-            console = sys.stdout
-            sys.stdout = self.logger
-            response = self.pipeline.query(chat_mode, message, chatbot)
+            session.sources = []
+            return
+
+        if not self.pipeline.is_ready():
+            gr.Warning(_DefaultElement.INDEXING_MESSAGE)
+            yield message, chatbot, _DefaultElement.INDEXING_STATUS
+            return
+
+        user = self._user(request)
+        ticket = self._admit(user)
+        if ticket is None:
+            yield message, chatbot, _DefaultElement.BUSY_STATUS
+            return
+
+        response, completed = None, False
+        try:
+            while not ticket.wait(self._setting.ADMISSION.POLL_INTERVAL):
+                yield self._queued(ticket, message, chatbot)
+            response = self.pipeline.query(chat_mode, message, chatbot, session)
+            self._in_flight[user] = response
             for m in self._llm_response.yield_stream_response(
                 message, chatbot, response
             ):
                 yield m
-            sys.stdout = console
-            self._sources = [
+            completed = True
+            session.sources = [
                 n.node.get_content(metadata_mode=MetadataMode.LLM).strip()
                 for n in response.source_nodes
             ]
+        finally:
+            self._finish(user, ticket, response, completed)
 
     async def _aget_respone(
         self,
         chat_mode: str,
         message: str,
         chatbot: list[list[str, str]],
+        session: ChatSession,
+        request: gr.Request,
         progress: gr.Progress = gr.Progress(track_tqdm=True),
     ):
         if message in [None, ""]:
             for m in self._llm_response.yield_empty_message_string():
                 yield m
-            self._sources = []
-        else:
-            console = sys.stdout
-            sys.stdout = self.logger
-            response = await self.pipeline.aquery(chat_mode, message, chatbot)
+            session.sources = []
+            return
+
+        if not self.pipeline.is_ready():
+            gr.Warning(_DefaultElement.INDEXING_MESSAGE)
+            yield message, chatbot, _DefaultElement.INDEXING_STATUS
+            return
+
+        user = self._user(request)
+        ticket = await asyncio.to_thread(self._admit, user)
+        if ticket is None:
+            yield message, chatbot, _DefaultElement.BUSY_STATUS
+            return
+
+        response, completed = None, False
+        try:
+            while not await asyncio.to_thread(
+                ticket.wait, self._setting.ADMISSION.POLL_INTERVAL
+            ):
+                yield self._queued(ticket, message, chatbot)
+            response = await self.pipeline.aquery(
+                chat_mode, message, chatbot, session
+            )
+            self._in_flight[user] = response
             for m in self._llm_response.yield_stream_response(
                 message, chatbot, response
             ):
                 yield m
-            sys.stdout = console
-            self._sources = [
+            completed = True
+            session.sources = [
                 n.node.get_content(metadata_mode=MetadataMode.LLM).strip()
                 for n in response.source_nodes
             ]
+        finally:
+            self._finish(user, ticket, response, completed)
 
     def _undo_chat(self, history: list[list[str, str]]):
         if len(history) > 0:
@@ -177,8 +326,9 @@ class LocalChatbotApp:
             return history
         return _DefaultElement.DEFAULT_HISTORY
 
-    def _clear_chat(self):
-        self.pipeline.clear_conversation()
+    def _clear_chat(self, session: ChatSession, request: gr.Request):
+        self._cancel_in_flight(self._user(request))
+        session.reset()
         gr.Info("Clear chat!")
         return (
             _DefaultElement.DEFAULT_MESSAGE,
@@ -201,15 +351,17 @@ class LocalChatbotApp:
 
     def ingest_data(self):
         print("Starting Processing...")
-        self.pipeline.process_document_dir()
-        self.pipeline.store_nodes()
-        print("Processing Completed!")
+        self.pipeline.start_ingestion()
 
     ######################
     # The User Interface #
     ######################
 
     def build_ui(self):
+        # Set once for the whole process rather than around every query,
+        # as the handlers of several sessions run at the same time.
+        sys.stdout = self.logger
+
         with gr.Blocks(
             theme=gr.themes.Soft(primary_hue="slate"),
             js=_JS_LIGHT_THEME,
@@ -226,6 +378,8 @@ class LocalChatbotApp:
 
             with gr.Tab("Interface"):
                 sidebar_state = gr.State(True)
+                # Created per browser session, with its own chat engine.
+                session = gr.State(ChatSession)
 
                 with gr.Row(variant="panel", equal_height=False):
 
@@ -239,6 +393,21 @@ class LocalChatbotApp:
                             value="Ready!",
                             interactive=False,
                         )
+                        gr.Textbox(
+                            label="Model",
+                            value=self.pipeline.get_model_status,
+                            interactive=False,
+                            every=5,
+                        )
+                        gr.Textbox(
+                            label="Index",
+                            value=self._index_status,
+                            interactive=False,
+                            every=1,
+                        )
+                        with gr.Row():
+                            pause_btn = gr.Button(value="Pause", min_width=20)
+                            resume_btn = gr.Button(value="Resume", min_width=20)
                         chat_mode = gr.Radio(
                             label="Chat Mode",
                             choices=["chat", "QA"],
@@ -284,7 +453,7 @@ class LocalChatbotApp:
                             clear_btn = gr.Button(value="Clear", min_width=20)
 
                     with gr.Column(scale=10, variant="panel"):
-                        sources_ = gr.State(self._sources)
+                        sources_ = gr.State([])
 
                         @gr.render(inputs=sources_)
                         def render_sources(sources):
@@ -318,17 +487,28 @@ class LocalChatbotApp:
             # The Behaviours #
             ##################
 
+            # Queued queries run in their handler to report their position,
+            # the admission controller limits how many of them generate.
             message.submit(
                 self._get_respone,
-                inputs=[chat_mode, message, chatbot],
+                inputs=[chat_mode, message, chatbot, session],
                 outputs=[message, chatbot, status],
-            ).then(self._get_sources, inputs=None, outputs=[sources_])
+                concurrency_limit=(
+                    self._setting.ADMISSION.MAX_QUEUE
+                    + self._setting.ADMISSION.MAX_GENERATIONS
+                ),
+            ).then(self._get_sources, inputs=[session], outputs=[sources_])
 
             language.change(self._change_language, inputs=[language])
             chat_mode.change(self._change_chat_mode, inputs=[chat_mode])
 
+            pause_btn.click(self._pause_indexing)
+            resume_btn.click(self._resume_indexing)
+
             clear_btn.click(
-                self._clear_chat, outputs=[message, chatbot, status]
+                self._clear_chat,
+                inputs=[session],
+                outputs=[message, chatbot, status],
             )
             undo_btn.click(
                 self._undo_chat, inputs=[chatbot], outputs=[chatbot]
@@ -342,4 +522,12 @@ class LocalChatbotApp:
 
             demo.load(self._welcome, outputs=[message, chatbot, status])
 
+        # Bounds the Gradio queue, which also holds the status and log polls.
+        demo.queue(
+            max_size=4
+            * (
+                self._setting.ADMISSION.MAX_QUEUE
+                + self._setting.ADMISSION.MAX_GENERATIONS
+            )
+        )
         return demo
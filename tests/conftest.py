@@ -0,0 +1,21 @@
+import pytest
+
+from llama_index.core.llms import MockLLM
+
+from rag_legal_chatbot.core import LocalChatEngineFactory
+from rag_legal_chatbot.core.jobs import IngestionWorker
+from rag_legal_chatbot.pipeline import LocalRAGPipeline
+from rag_legal_chatbot.settings import RAGSettings
+
+
+@pytest.fixture
+def chat_pipeline() -> LocalRAGPipeline:
+    """A pipeline in chat mode, without loading models or a store."""
+    setting = RAGSettings()
+    setting.OLLAMA.SUMMARIZE_HISTORY = False
+    pipeline = LocalRAGPipeline.__new__(LocalRAGPipeline)
+    pipeline._query_engine = LocalChatEngineFactory(setting).set_engine(
+        llm=MockLLM(max_tokens=8), nodes=[], chat_mode="chat"
+    )
+    pipeline._ingestion_worker = IngestionWorker()
+    return pipeline
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from llama_index.core.llms import ChatMessage, MessageRole, MockLLM
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from rag_legal_chatbot.core import LocalChatEngineFactory
+from rag_legal_chatbot.core.chat_engine import LocalCondensePlusContextChatEngine
+from rag_legal_chatbot.core.memory import SummaryChatMemory
+from rag_legal_chatbot.core.prompts import ContextPrompt, SystemPrompt
+from rag_legal_chatbot.core.tokens import TOKEN_COUNT_KEY, get_context_token_budget
+from rag_legal_chatbot.settings import RAGSettings
+
+
+class StaticRetriever(BaseRetriever):
+    def __init__(self, nodes: list[NodeWithScore]) -> None:
+        super().__init__()
+        self._nodes = nodes
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return list(self._nodes)
+
+
+def _engine(
+    nodes: list[NodeWithScore], prefix_stable: bool = True
+) -> LocalCondensePlusContextChatEngine:
+    setting = RAGSettings()
+    setting.OLLAMA.SUMMARIZE_HISTORY = False
+    llm = MockLLM(max_tokens=8)
+    return LocalCondensePlusContextChatEngine.from_defaults(
+        retriever=StaticRetriever(nodes),
+        llm=llm,
+        memory=LocalChatEngineFactory(setting).get_memory(
+            llm=llm, with_context=True
+        ),
+        system_prompt=SystemPrompt()("eng"),
+        context_prompt=ContextPrompt()("eng"),
+        prefix_stable=prefix_stable,
+        skip_condense=True,
+    )
+
+
+def _full_context() -> list[NodeWithScore]:
+    num_nodes = 10
+    tokens = get_context_token_budget() // num_nodes - 1
+    return [
+        NodeWithScore(
+            node=TextNode(
+                text=f"§ {i} " + "slovo " * tokens,
+                metadata={"file_name": "law.pdf", TOKEN_COUNT_KEY: tokens},
+            ),
+            score=1.0 - i / num_nodes,
+        )
+        for i in range(num_nodes)
+    ]
+
+
+@pytest.mark.parametrize("prefix_stable", [True, False])
+def test_full_context_keeps_question_and_history(prefix_stable):
+    nodes = _full_context()
+    engine = _engine(nodes, prefix_stable)
+    engine._memory.set(
+        [
+            ChatMessage(role=MessageRole.USER, content="Ahoj"),
+            ChatMessage(role=MessageRole.ASSISTANT, content="Dobrý den"),
+        ]
+    )
+    context_str = "\n\n".join(n.node.get_content() for n in nodes)
+
+    messages, _ = engine._build_chat_messages(
+        "Co je živnost?", "Co je živnost?", context_str, nodes
+    )
+
+    assert messages[-1].content == "Co je živnost?"
+    assert any(message.content == "Ahoj" for message in messages)
+
+
+def test_prompt_over_limit_keeps_question():
+    memory = SummaryChatMemory(token_limit=100)
+    memory.set(
+        [
+            ChatMessage(role=MessageRole.USER, content="Ahoj"),
+            ChatMessage(role=MessageRole.ASSISTANT, content="Dobrý den"),
+            ChatMessage(role=MessageRole.USER, content="Co je živnost?"),
+        ]
+    )
+
+    messages = memory.get(initial_token_count=500)
+
+    assert [message.content for message in messages] == ["Co je živnost?"]
+
+
+def _scattered_nodes() -> list[NodeWithScore]:
+    # Best score first, which is not the document order.
+    return [
+        NodeWithScore(
+            node=TextNode(
+                text=text,
+                metadata={"file_name": file_name},
+                excluded_llm_metadata_keys=["file_name"],
+                start_char_idx=start,
+            ),
+            score=score,
+        )
+        for text, file_name, start, score in [
+            ("b-200", "b.pdf", 200, 0.9),
+            ("a-500", "a.pdf", 500, 0.8),
+            ("b-100", "b.pdf", 100, 0.7),
+            ("a-0", "a.pdf", 0, 0.6),
+        ]
+    ]
+
+
+def test_prefix_stable_context_is_in_document_order():
+    engine = _engine(_scattered_nodes())
+
+    _, context_str, nodes = engine._condense_and_retrieve([], "Co je živnost?")
+
+    assert context_str.split("\n\n") == ["a-0", "a-500", "b-100", "b-200"]
+    # The sources keep their ranking.
+    assert [n.node.text for n in nodes] == ["b-200", "a-500", "b-100", "a-0"]
+
+
+def test_prefix_stable_context_is_in_document_order_async():
+    engine = _engine(_scattered_nodes())
+
+    _, context_str, _ = asyncio.run(
+        engine._acondense_and_retrieve([], "Co je živnost?")
+    )
+
+    assert context_str.split("\n\n") == ["a-0", "a-500", "b-100", "b-200"]
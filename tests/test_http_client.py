@@ -0,0 +1,20 @@
+from rag_legal_chatbot.core.http_client import get_session
+from rag_legal_chatbot.core.model import LocalRAGModelFactory
+from rag_legal_chatbot.settings import RAGSettings
+
+
+def test_session_does_not_resend_post_after_a_response():
+    retry = get_session().adapters["http://"].max_retries
+
+    assert retry.is_retry("GET", 503)
+    assert not retry.is_retry("POST", 503)
+
+
+def test_openai_retries_in_a_single_layer():
+    setting = RAGSettings()
+    setting.OLLAMA.API_KEY = "sk-test"
+
+    llm = LocalRAGModelFactory.set_model("gpt-4o-mini", setting=setting)
+
+    assert llm.max_retries == setting.OLLAMA.MAX_RETRIES
+    assert llm._http_client._transport._pool._retries == 0
@@ -0,0 +1,33 @@
+import asyncio
+
+from llama_index.core.base.llms.types import CompletionResponse
+from llama_index.core.llms import ChatMessage, MessageRole, MockLLM
+
+from rag_legal_chatbot.core.memory import SummaryChatMemory
+
+
+def test_aget_summarizes_with_acomplete_outside_the_lock():
+    calls = []
+
+    class AsyncSummaryLLM(MockLLM):
+        def complete(self, prompt, formatted=False, **kwargs):
+            raise AssertionError("complete() blocks the event loop")
+
+        async def acomplete(self, prompt, formatted=False, **kwargs):
+            calls.append(memory._lock.locked())
+            return CompletionResponse(text="summary")
+
+    memory = SummaryChatMemory(token_limit=60, summary_llm=AsyncSummaryLLM())
+    for turn in range(6):
+        memory.put(ChatMessage(role=MessageRole.USER, content=f"question {turn} " * 5))
+        memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=f"answer {turn} " * 5))
+
+    history = asyncio.run(memory.aget())
+
+    assert calls == [False]
+    assert history[0].role == MessageRole.SYSTEM
+    assert history[0].content == "summary"
+    assert history[1].role == MessageRole.USER
+    # The cached summary is reused without another call.
+    assert asyncio.run(memory.aget()) == history
+    assert calls == [False]
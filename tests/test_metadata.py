@@ -0,0 +1,18 @@
+from rag_legal_chatbot.core.metadata import LegalQueryParser
+
+
+def test_section_alone_is_not_filtered_across_acts():
+    assert LegalQueryParser().to_metadata_filters("Co stanoví § 12?") is None
+
+
+def test_section_is_filtered_within_the_named_act():
+    filters = LegalQueryParser().to_metadata_filters(
+        "Co stanoví § 12 zákona č. 455/1991 Sb.?"
+    )
+
+    assert [(f.key, f.value) for f in filters.filters] == [
+        ("act_number", 455),
+        ("act_year", 1991),
+        ("section_from", 12),
+        ("section_to", 12),
+    ]
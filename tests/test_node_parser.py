@@ -0,0 +1,11 @@
+from rag_legal_chatbot.core.node_parser import LegalNodeParser
+from rag_legal_chatbot.settings import RAGSettings
+
+
+def test_parser_defaults_follow_the_settings():
+    setting = RAGSettings()
+    parser = LegalNodeParser()
+
+    assert parser.chunk_size == setting.INGESTION.CHILD_CHUNK_SIZE
+    assert parser.parent_chunk_size == setting.INGESTION.PARENT_CHUNK_SIZE
+    assert LegalNodeParser(chunk_size=64).chunk_size == 64
@@ -0,0 +1,29 @@
+from rag_legal_chatbot.pipeline import ChatSession
+
+
+def _answer(pipeline, message, chatbot, session):
+    response = pipeline.query("chat", message, chatbot, session)
+    return "".join(response.response_gen)
+
+
+def test_sessions_do_not_share_history(chat_pipeline):
+    alice, bob = ChatSession(), ChatSession()
+
+    _answer(chat_pipeline, "Alice asks", [], alice)
+    _answer(chat_pipeline, "Bob asks", [], bob)
+
+    assert alice.engine is not bob.engine
+    alice_history = [m.content for m in alice.engine._memory.get_all()]
+    assert "Alice asks" in alice_history
+    assert "Bob asks" not in alice_history
+
+
+def test_session_follows_a_replaced_engine(chat_pipeline):
+    session = chat_pipeline.get_session()
+    old_engine = session.engine
+
+    chat_pipeline._query_engine = chat_pipeline._query_engine.fork()
+
+    assert chat_pipeline.get_session(session) is session
+    assert session.engine is not old_engine
+    assert session.source is chat_pipeline._query_engine
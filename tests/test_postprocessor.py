@@ -0,0 +1,37 @@
+import pytest
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from rag_legal_chatbot.core.postprocessor import AdaptiveDepthPostprocessor
+
+
+def _nodes(scores: list[float]) -> list[NodeWithScore]:
+    return [
+        NodeWithScore(node=TextNode(text=f"node {i}"), score=score)
+        for i, score in enumerate(scores)
+    ]
+
+
+@pytest.mark.parametrize(
+    "logits",
+    [
+        # A small best logit no longer cuts to min_k.
+        [4.0, 3.5, 3.0, -3.0, -4.0],
+        # Negative logits no longer flip the relative bounds.
+        [-0.5, -0.6, -0.7, -6.0, -7.0],
+    ],
+)
+def test_reranker_logits_are_normalized_before_the_cut(logits):
+    depth = AdaptiveDepthPostprocessor(min_k=1, max_k=5, normalize=True)
+
+    nodes = depth.postprocess_nodes(_nodes(logits))
+
+    assert [node.score for node in nodes] == logits[:3]
+
+
+def test_cosine_scores_are_cut_as_they_are():
+    depth = AdaptiveDepthPostprocessor(min_k=1, max_k=5)
+
+    nodes = depth.postprocess_nodes(_nodes([0.82, 0.8, 0.79, 0.5, 0.4]))
+
+    assert len(nodes) == 3
@@ -0,0 +1,41 @@
+from llama_index.core.base.llms.types import ChatResponse
+from llama_index.core.llms import ChatMessage
+
+from rag_legal_chatbot.core import prompt_cache
+from rag_legal_chatbot.core.prompt_cache import PromptCacheStats
+
+
+def _record(monkeypatch, raw: dict) -> dict:
+    stats = PromptCacheStats(verbose=False)
+    monkeypatch.setattr(prompt_cache, "_prompt_cache_stats", stats)
+    chat = ChatResponse(message=ChatMessage(content=""), raw=raw)
+    assert prompt_cache._record_usage(chat, [ChatMessage(content="short prompt")])
+    return stats.stats
+
+
+def test_ollama_cached_tokens_are_an_estimate_clamped_at_zero(monkeypatch):
+    stats = _record(monkeypatch, {"done": True, "prompt_eval_count": 500})
+
+    assert stats["estimated"]["requests"] == 1
+    assert stats["estimated"]["cached_tokens"] == 0
+    assert stats["reported"]["requests"] == 0
+
+
+def test_openai_cached_tokens_are_reported(monkeypatch):
+    stats = _record(
+        monkeypatch,
+        {
+            "usage": {
+                "prompt_tokens": 1000,
+                "prompt_tokens_details": {"cached_tokens": 768},
+            }
+        },
+    )
+
+    assert stats["reported"] == {
+        "requests": 1,
+        "prompt_tokens": 1000,
+        "cached_tokens": 768,
+        "cached_ratio": 0.768,
+    }
+    assert stats["estimated"]["requests"] == 0
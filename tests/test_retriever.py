@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import MockLLM
+from llama_index.core.schema import TextNode
+
+from rag_legal_chatbot.core.numpy_retriever import NumpyVectorRetriever
+from rag_legal_chatbot.core.quantized_retriever import QuantizedVectorRetriever
+from rag_legal_chatbot.core.retriever import (
+    LocalRetrieverFactory,
+    MultiQueryFusionRetriever,
+)
+from rag_legal_chatbot.settings import RAGSettings
+
+
+def _fusion_retriever(tmp_path, monkeypatch, sharding: bool):
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=4))
+    setting = RAGSettings()
+    setting.STORAGE.PERSIST_DIR = str(tmp_path)
+    setting.STORAGE.SHARDING = sharding
+    setting.RETRIEVER.RETRIEVER_MODE = "numpy"
+    setting.RETRIEVER.QUERY_FUSION = True
+    nodes = [
+        TextNode(
+            text=f"node {i}",
+            embedding=[1.0, float(i), 0.0, 0.0],
+            metadata={"file_name": f"{i % 2}.pdf"},
+        )
+        for i in range(4)
+    ]
+    return LocalRetrieverFactory(setting).get_retrievers(
+        nodes=nodes, llm=MockLLM()
+    )
+
+
+@pytest.mark.parametrize("sharding", [False, True])
+@pytest.mark.parametrize("use_async", [False, True])
+def test_fusion_searches_each_collection_in_one_batch(
+    tmp_path, monkeypatch, sharding: bool, use_async: bool
+):
+    fusion = _fusion_retriever(tmp_path, monkeypatch, sharding)
+    batches = []
+    retrieve_batch = NumpyVectorRetriever.retrieve_batch
+
+    def counting_retrieve_batch(self, queries, *args, **kwargs):
+        batches.append(len(queries))
+        return retrieve_batch(self, queries, *args, **kwargs)
+
+    monkeypatch.setattr(
+        NumpyVectorRetriever, "retrieve_batch", counting_retrieve_batch
+    )
+    if use_async:
+        nodes = asyncio.run(fusion.aretrieve("contract"))
+    else:
+        nodes = fusion.retrieve("contract")
+
+    assert isinstance(fusion, MultiQueryFusionRetriever)
+    assert nodes
+    assert len(batches) == (2 if sharding else 1)
+    assert all(size > 1 for size in batches)
+
+
+def _quantized(tmp_path, offset: float) -> QuantizedVectorRetriever:
+    nodes = [
+        TextNode(text=f"node {i}", embedding=[1.0, float(i), offset, 0.0])
+        for i in range(3)
+    ]
+    return QuantizedVectorRetriever(
+        nodes,
+        vectors_path=str(tmp_path / "collection_vectors.npy"),
+        embed_model=MockEmbedding(embed_dim=4),
+    )
+
+
+def test_quantized_vectors_are_written_only_when_changed(tmp_path):
+    vectors_path = tmp_path / "collection_vectors.npy"
+    _quantized(tmp_path, 0.0)
+    inode = vectors_path.stat().st_ino
+
+    _quantized(tmp_path, 0.0)
+    assert vectors_path.stat().st_ino == inode
+
+    retriever = _quantized(tmp_path, 1.0)
+    assert vectors_path.stat().st_ino != inode
+    assert retriever._matrix[0, 2] > 0
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "collection_vectors.npy",
+        "collection_vectors.npy.sha256",
+    ]
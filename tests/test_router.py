@@ -0,0 +1,45 @@
+import threading
+import time
+
+from rag_legal_chatbot.core.router import RoutingOllama
+
+
+def _router(**kwargs) -> RoutingOllama:
+    return RoutingOllama(
+        model="llama3",
+        base_urls=["http://a:11434", "http://b:11434"],
+        health_check_interval=3600,
+        **kwargs,
+    )
+
+
+def test_concurrent_requests_spread_over_backends():
+    router = _router()
+    barrier = threading.Barrier(8)
+
+    def acquire() -> None:
+        barrier.wait()
+        router._acquire([])
+
+    threads = [threading.Thread(target=acquire) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [backend["in_flight"] for backend in router.stats] == [4, 4]
+
+
+def test_stalled_backend_leaves_rotation():
+    router = _router(stall_timeout=10)
+    hung, other = router._backends
+    for backend in router._backends:
+        backend.last_check = time.monotonic()
+    router._acquire([])
+    hung.last_progress -= 60
+
+    router._check_backends()
+    backend, _ = router._acquire([])
+
+    assert not hung.healthy
+    assert backend is other
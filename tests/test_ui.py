@@ -0,0 +1,21 @@
+from llama_index.core.llms import MockLLM
+
+from rag_legal_chatbot.core.admission import get_admission_controller
+from rag_legal_chatbot.pipeline import ChatSession
+from rag_legal_chatbot.ui import LocalChatbotApp
+
+
+def test_closed_handler_releases_its_query(chat_pipeline):
+    chat_pipeline._query_engine._llm = MockLLM(max_tokens=200)
+    app = LocalChatbotApp(pipeline=chat_pipeline, logger=None)
+    running = get_admission_controller().stats["running"]
+
+    handler = app._get_respone("chat", "Ahoj", [], ChatSession(), None)
+    next(handler)
+    response = app._in_flight["anonymous"]
+    # Gradio closes the handler when the user cancels or disconnects.
+    handler.close()
+
+    assert app._in_flight == {}
+    assert response.cancelled
+    assert get_admission_controller().stats["running"] == running
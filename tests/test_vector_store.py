@@ -0,0 +1,69 @@
+import chromadb
+
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import TextNode
+
+from rag_legal_chatbot.core.vector_store import LocalVectorStoreFactory
+from rag_legal_chatbot.settings import RAGSettings
+
+
+def _nodes(file_name: str, text: str) -> tuple[list[TextNode], list[TextNode]]:
+    parent = TextNode(text=text, metadata={"file_name": file_name})
+    child = TextNode(
+        text=text, embedding=[1.0, 0.0, 0.0, 0.0], metadata={"file_name": file_name}
+    )
+    return [child], [parent]
+
+
+def test_reingested_shard_replaces_its_collection_and_parents(tmp_path, monkeypatch):
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=4))
+    setting = RAGSettings()
+    setting.STORAGE.PERSIST_DIR = str(tmp_path)
+    setting.STORAGE.SHARDING = True
+    factory = LocalVectorStoreFactory(setting=setting)
+
+    old_nodes, old_parents = _nodes("a.pdf", "old text")
+    other_nodes, other_parents = _nodes("b.pdf", "other text")
+    factory.get_or_create_shard_indexes(
+        old_nodes + other_nodes, old_parents + other_parents
+    )
+    old_collection = factory.get_manifest()["a.pdf"]["collection"]
+
+    new_nodes, new_parents = _nodes("a.pdf", "new text")
+    indexes = factory.get_or_create_shard_indexes(new_nodes, new_parents)
+
+    manifest = factory.get_manifest()
+    assert manifest["a.pdf"]["collection"] != old_collection
+    names = {
+        collection.name
+        for collection in chromadb.PersistentClient(path=str(tmp_path)).list_collections()
+    }
+    assert names == {manifest["a.pdf"]["collection"], manifest["b.pdf"]["collection"]}
+    assert set(indexes) == {"a.pdf", "b.pdf"}
+    assert sorted(node.text for node in factory.get_docstore().docs.values()) == [
+        "new text",
+        "other text",
+    ]
+
+
+def test_shards_are_reembedded_after_embed_dim_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=4))
+    setting = RAGSettings()
+    setting.STORAGE.PERSIST_DIR = str(tmp_path)
+    setting.STORAGE.SHARDING = True
+    nodes, parents = _nodes("a.pdf", "text")
+    LocalVectorStoreFactory(setting=setting).get_or_create_shard_indexes(
+        nodes, parents
+    )
+
+    setting.INGESTION.EMBED_DIM = 4
+    factory = LocalVectorStoreFactory(setting=setting)
+    assert not factory.is_shard_current("a.pdf", nodes)
+
+    factory.get_or_create_shard_indexes(*_nodes("a.pdf", "text"))
+    assert factory.is_shard_current("a.pdf", nodes)
+    collection = chromadb.PersistentClient(path=str(tmp_path)).get_collection(
+        factory.get_manifest()["a.pdf"]["collection"]
+    )
+    assert collection.metadata["embed_dim"] == 4